@@ -22,6 +22,18 @@ if __name__ == "__main__":
     parser.set(section, 'notify_channel', 'boardgames')
     parser.set(section, 'nick', 'hanabot')
     parser.set(section, 'nick_pass', 'PASSWORD')
+    parser.set(section, 'send_rate', '1.0')
+    parser.set(section, 'send_burst', '5')
+    parser.set(section, 'core', 'irc')
+    parser.set(section, 'game_workers', '0')
+    parser.set(section, 'journal_dir', '')
+    parser.set(section, 'metrics_port', '0')
+    parser.set(section, 'metrics_interval', '0')
+    parser.set(section, 'profile_dir', '')
+    parser.set(section, 'profile_commands', '0')
+    parser.set(section, 'archive_dir', '')
+    parser.set(section, 'idle_timeout', '3600')
+    parser.set(section, 'max_games', '0')
 
     if args.outfile:
         with open(args.outfile, 'wb') as fd:
@@ -0,0 +1,378 @@
+'''
+    async_core.py runs the hanabot on a non-blocking asyncore loop
+    instead of irc.bot.SingleServerIRCBot.
+
+    The loop reads, parses, and writes the IRC connection without ever
+    blocking on a command handler's output, and runs timers (rejoining
+    after a kick, the send queue, reconnecting) between network events.
+    Other files, such as the game workers' pipes, can be watched to be
+    read as soon as they have data.
+    AsyncHanabot keeps the same on_* and handle_* surface as Hanabot,
+    as both are built on hanabot.HanabotBase.
+
+    Usage:
+        bot = AsyncHanabot(server, channel, nick)
+        bot.start()
+'''
+import asynchat
+import asyncore
+import heapq
+import itertools
+import logging
+import socket
+import sys
+import time
+
+from hanabot import HanabotBase
+
+log = logging.getLogger(__name__)
+
+
+class _Watch(object):
+    '''An asyncore map entry that calls func when its file can be read.'''
+    def __init__(self, func):
+        self.func = func
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def handle_read_event(self):
+        self.func()
+
+    def handle_expt_event(self):
+        pass
+
+    def handle_error(self):
+        log.critical('Exception in watch %s: %s', self.func, sys.exc_info()[1])
+
+
+class EventLoop(object):
+    '''An asyncore socket map plus timers.'''
+    def __init__(self):
+        self.map = dict()
+        self._timers = []           # heap of (when, seq, func)
+        self._seq = itertools.count()
+        self._running = False
+
+    def call_later(self, delay, func):
+        '''Run func after delay seconds.'''
+        heapq.heappush(self._timers, (time.time() + delay, next(self._seq), func))
+
+    def watch(self, fileobj, func):
+        '''Run func each time fileobj (anything with a fileno()) has data to
+        read. With func None stop watching it.'''
+        if func is None:
+            self.map.pop(fileobj.fileno(), None)
+        else:
+            self.map[fileobj.fileno()] = _Watch(func)
+
+    def run_timers(self):
+        '''Run the timers that are due.'''
+        now = time.time()
+        while self._timers and self._timers[0][0] <= now:
+            when, seq, func = heapq.heappop(self._timers)
+            try:
+                func()
+            except Exception, e:
+                log.critical('Exception in timer %s: %s', func, e)
+
+    def run(self, max_wait=0.2):
+        '''Handle network events and timers until stop() is called.'''
+        self._running = True
+        while self._running:
+            wait = max_wait
+            if self._timers:
+                wait = min(wait, max(0, self._timers[0][0] - time.time()))
+
+            if self.map:
+                asyncore.loop(timeout=wait, map=self.map, count=1)
+            else:
+                time.sleep(wait)
+
+            self.run_timers()
+
+    def stop(self):
+        self._running = False
+
+
+class Source(object):
+    '''The nick!user@host an IRC message came from.'''
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.nick = prefix.split('!', 1)[0]
+
+    def __str__(self):
+        return self.prefix
+
+
+class Event(object):
+    '''An IRC message, shaped like irc.client.Event.'''
+    def __init__(self, type, source, target, arguments):
+        self.type = type
+        self.source = source
+        self.target = target
+        self.arguments = arguments
+
+    def __repr__(self):
+        return 'Event(%r, %r, %r, %r)' % (self.type, str(self.source),
+                                          self.target, self.arguments)
+
+
+class Channel(object):
+    '''The users of a channel the bot is in, and which of them are ops.'''
+    def __init__(self):
+        self._users = set()
+        self._opers = set()
+
+    def users(self):
+        return list(self._users)
+
+    def opers(self):
+        return list(self._opers)
+
+    def add_user(self, nick):
+        if nick[:1] in '@+':
+            if nick[0] == '@':
+                self._opers.add(nick[1:])
+            nick = nick[1:]
+
+        self._users.add(nick)
+
+    def remove_user(self, nick):
+        self._users.discard(nick)
+        self._opers.discard(nick)
+
+    def set_oper(self, nick, oper):
+        if oper:
+            self._opers.add(nick)
+        else:
+            self._opers.discard(nick)
+
+
+def parse_line(line):
+    '''Split a raw IRC line into (prefix, command, params).'''
+    prefix = ''
+    if line.startswith(':'):
+        prefix, line = line[1:].split(' ', 1)
+
+    if ' :' in line:
+        line, trailing = line.split(' :', 1)
+        params = line.split() + [trailing]
+    else:
+        params = line.split()
+
+    return prefix, params[0].upper(), params[1:]
+
+
+class IRCConnection(asynchat.async_chat):
+    '''
+    A non-blocking IRC client connection. Incoming messages are turned
+    into Events and passed to handler.dispatch(); the sending methods
+    only queue text on the socket.
+    '''
+    # IRC command or numeric reply --> event type
+    _event_types = {
+        '001': 'welcome',
+        '433': 'nicknameinuse',
+        'JOIN': 'join',
+        'PART': 'part',
+        'KICK': 'kick',
+        'QUIT': 'quit',
+        'NICK': 'nick',
+        'MODE': 'mode',
+        'NOTICE': 'notice',
+        '353': 'namreply',
+    }
+
+    def __init__(self, handler, loop):
+        asynchat.async_chat.__init__(self, map=loop.map)
+        self.set_terminator('\r\n')
+        self.handler = handler
+        self._buf = []
+        self.real_nickname = None
+        self.connected_ok = False
+
+    def connect_to(self, server, port, nickname, realname):
+        self.real_nickname = nickname
+        self._realname = realname
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((server, port))
+
+    # asynchat callbacks
+    def handle_connect(self):
+        self.connected_ok = True
+        self.send_raw('NICK %s' % self.real_nickname)
+        self.send_raw('USER %s 0 * :%s' % (self.real_nickname, self._realname))
+
+    def handle_close(self):
+        self.close()
+        self.connected_ok = False
+        self.handler.dispatch(self, Event('disconnect', Source(''), '', []))
+
+    def collect_incoming_data(self, data):
+        self._buf.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self._buf)
+        self._buf = []
+        if line:
+            self.handle_line(line)
+
+    def handle_line(self, line):
+        log.debug('<-- %s', line)
+        prefix, command, params = parse_line(line)
+        if command == 'PING':
+            self.send_raw('PONG :%s' % (params[0] if params else ''))
+            return
+
+        source = Source(prefix)
+        if command == 'PRIVMSG':
+            target = params[0]
+            etype = 'pubmsg' if target[:1] in '#&+!' else 'privmsg'
+            event = Event(etype, source, target, params[1:])
+        elif command in self._event_types:
+            etype = self._event_types[command]
+            if command == '001':
+                self.real_nickname = params[0]
+            elif command == 'NICK' and source.nick == self.real_nickname:
+                self.real_nickname = params[0]
+
+            target = params[0] if params else ''
+            event = Event(etype, source, target, params[1:])
+        else:
+            return
+
+        self.handler.dispatch(self, event)
+
+    # the parts of irc.client.ServerConnection the bot uses.
+    def send_raw(self, text):
+        log.debug('--> %s', text)
+        self.push(text + '\r\n')
+
+    def get_nickname(self):
+        return self.real_nickname
+
+    def nick(self, newnick):
+        self.send_raw('NICK %s' % newnick)
+
+    def join(self, channel):
+        self.send_raw('JOIN %s' % channel)
+
+    def part(self, channel, message=''):
+        self.send_raw('PART %s%s' % (channel, message and (' :' + message)))
+
+    def topic(self, channel, new_topic=None):
+        if new_topic is None:
+            self.send_raw('TOPIC %s' % channel)
+        else:
+            self.send_raw('TOPIC %s :%s' % (channel, new_topic))
+
+    def notice(self, target, text):
+        self.send_raw('NOTICE %s :%s' % (target, text))
+
+    def privmsg(self, target, text):
+        self.send_raw('PRIVMSG %s :%s' % (target, text))
+
+    def quit(self, message=''):
+        self.send_raw('QUIT :%s' % message)
+
+
+class AsyncHanabot(HanabotBase):
+    '''The bot running on an EventLoop.'''
+    reconnection_interval = 60
+
+    def __init__(self, server, channel, nick='hanabot', nick_pass=None, port=6667, topic=None,
+                 send_rate=1.0, send_burst=5, game_workers=0, journal_dir=None,
+                 metrics_port=0, metrics_interval=0, profile_dir=None, profile_commands=0,
+                 archive_dir=None, idle_timeout=0, max_games=0, loop=None):
+        log.debug('new async bot started at %s:%d@#%s as %s', server, port,
+                  channel, nick)
+        self.server = server
+        self.port = port
+        self._nickname = nick
+        self.loop = loop if loop else EventLoop()
+        self.channels = dict()
+        self.connection = IRCConnection(self, self.loop)
+        HanabotBase.__init__(self, channel, nick, nick_pass, topic,
+                             send_rate, send_burst, game_workers, journal_dir,
+                             metrics_port, metrics_interval, profile_dir, profile_commands,
+                             archive_dir, idle_timeout, max_games)
+
+    def _call_later(self, delay, func):
+        self.loop.call_later(delay, func)
+
+    def _watch(self, fileobj, func):
+        self.loop.watch(fileobj, func)
+
+    def _connect(self):
+        self.channels = dict()
+        self.connection = IRCConnection(self, self.loop)
+        try:
+            self.connection.connect_to(self.server, self.port, self._nickname,
+                                       'Mumford J. Hanabot')
+        except socket.error, e:
+            log.info('Could not connect to %s:%d: %s', self.server, self.port, e)
+            self._call_later(self.reconnection_interval, self._connect)
+
+    def start(self):
+        '''Connect and run the loop until die() is called.'''
+        self._connect()
+        self.loop.run()
+
+    def die(self, msg='Bye, cruel world!'):
+        self.connection.quit(msg)
+        # let the QUIT go out before stopping.
+        self._call_later(0.5, self.loop.stop)
+
+    def dispatch(self, conn, event):
+        '''Keep track of channels, then call self.on_<event type>.'''
+        nick = event.source.nick
+        if event.type == 'join' and nick == conn.get_nickname():
+            self.channels[event.target] = Channel()
+        elif event.type == 'join' and event.target in self.channels:
+            self.channels[event.target].add_user(nick)
+        elif event.type == 'part' and event.target in self.channels:
+            if nick == conn.get_nickname():
+                del self.channels[event.target]
+            else:
+                self.channels[event.target].remove_user(nick)
+        elif event.type == 'kick' and event.target in self.channels:
+            if event.arguments[0] == conn.get_nickname():
+                del self.channels[event.target]
+            else:
+                self.channels[event.target].remove_user(event.arguments[0])
+        elif event.type == 'quit':
+            for ch in self.channels.values():
+                ch.remove_user(nick)
+        elif event.type == 'namreply' and event.arguments[1] in self.channels:
+            for n in event.arguments[2].split():
+                self.channels[event.arguments[1]].add_user(n)
+        elif event.type == 'mode' and event.target in self.channels:
+            self._update_modes(event)
+        elif event.type == 'disconnect':
+            self._call_later(self.reconnection_interval, self._connect)
+
+        method = getattr(self, 'on_%s' % event.type, None)
+        if method:
+            try:
+                method(conn, event)
+            except Exception, e:
+                log.critical('Exception handling %s: %s', event, e)
+
+    def _update_modes(self, event):
+        '''track +o/-o on the channel users.'''
+        modes, args = event.arguments[0], event.arguments[1:]
+        sign = '+'
+        for m in modes:
+            if m in '+-':
+                sign = m
+            elif m == 'o' and args:
+                self.channels[event.target].set_oper(args.pop(0), sign == '+')
+            elif m in 'vbkehIq' and args:
+                args.pop(0)
+            elif m == 'l' and sign == '+' and args:
+                # the limit only takes an argument when it is set.
+                args.pop(0)
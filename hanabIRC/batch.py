@@ -0,0 +1,247 @@
+'''
+    batch.py plays many games of Hanabi in lockstep with NumPy, for
+    strategy research that needs more games than one Game object per game
+    allows.
+
+    A Batch holds N games of the same number of players as arrays, one row
+    per game:
+
+        deck        (N, D) the deck order as card codes (color index * 5 +
+                    number - 1), drawn from the start
+        drawn       (N,) the number of cards drawn
+        hands       (N, P, H) the hands, by player in join order, in the
+                    order the engine keeps them: a played or discarded card
+                    is taken out and the new card goes at the end
+        order       (N, P) the turn order, as players
+        turns       (N,) the turns taken; order[turns % P] is to play
+        table       (N, 5) the top number played of each color
+        notes, storms (N,) the tokens left and storms flipped
+        discarded   (N, 25) the number of each card discarded or misplayed
+        over        (N,) whether the game has ended
+
+    step() applies one action per game as array operations, with the
+    rules of engine.apply(): a play of a card that does not fit flips a
+    storm, a 5 or a discard turns a note back, and the game ends when the
+    last card is drawn, the table is full or the storms run out. A hint
+    that is not allowed (to oneself, with no notes, or that matches no
+    card) is refused and the turn does not pass. What the hints told is
+    not kept: a hint only spends a note, so policies must not depend on it.
+
+    Games are dealt from hanabi.Game seeds (from_seeds), to compare with
+    games played by a Game, or by NumPy (deal) when only the number of
+    games matters. NumPy is only needed to use this module.
+
+    Usage:
+        batch = deal(100000, 3, numpy.random.RandomState(0))
+        while not batch.over.all():
+            batch.step(*cheat_actions(batch))
+        batch.score()
+'''
+import time
+from collections import defaultdict
+
+import numpy
+
+from engine import COLORS, CARD_DISTRIBUTION, DEFAULT_RULES, MAX_SCORE, COLOR_INDEX
+from hanabi import Game
+
+PLAY, DISCARD, HINT = 0, 1, 2
+
+# card code --> color index and number - 1. Looking them up is much faster
+# than dividing arrays.
+_color = numpy.arange(MAX_SCORE, dtype=numpy.int8) // 5
+_number = numpy.arange(MAX_SCORE, dtype=numpy.int8) % 5
+
+# [hint, card code] --> whether the hint is about the card.
+_matches = numpy.array([[_color[c] == h if h < 5 else _number[c] == h - 5
+                         for c in range(MAX_SCORE)] for h in range(10)])
+
+
+def card_code(card):
+    return COLOR_INDEX[card.color] * 5 + card.number - 1
+
+
+class Batch(object):
+    '''N games of the same number of players and rules, as arrays.'''
+    def __init__(self, decks, orders, rules=DEFAULT_RULES):
+        '''decks is an (N, D) array of card codes and orders an (N, P) array
+        of turn orders. The hands are dealt from the decks as the engine
+        does, each player's whole hand in turn, in join order.'''
+        decks, orders = numpy.asarray(decks, numpy.int8), numpy.asarray(orders, numpy.int8)
+        n, players = orders.shape
+        size = rules.hand_sizes[players]
+
+        self.rules = rules
+        self.deck = decks
+        self.order = orders
+        self.hands = decks[:, :players * size].reshape(n, players, size).copy()
+        self.drawn = numpy.full(n, players * size, numpy.int16)
+        self.turns = numpy.zeros(n, numpy.int32)
+        self.table = numpy.zeros((n, len(COLORS)), numpy.int8)
+        self.notes = numpy.full(n, rules.max_notes, numpy.int8)
+        self.storms = numpy.zeros(n, numpy.int8)
+        self.discarded = numpy.zeros((n, MAX_SCORE), numpy.int8)
+        self.over = numpy.zeros(n, bool)
+
+        # kept up to date by step(), rather than worked out from the above.
+        self._score = numpy.zeros(n, numpy.int8)
+        self._seat = numpy.zeros(n, numpy.int8)     # turns % players
+
+        # the arrays are indexed through flat views, which is faster than
+        # indexing them by two arrays.
+        self._rows = numpy.arange(n)
+        self._slots = numpy.arange(size)
+        self._flat_hands = self.hands.reshape(n * players, size)
+
+    def __len__(self):
+        return len(self.order)
+
+    def score(self):
+        return self._score.copy()
+
+    def current(self):
+        '''The player to play in each game.'''
+        return self.order.take(self._rows * self.order.shape[1] + self._seat)
+
+    def hand(self, players):
+        '''The hand of the given player in each game, as an (N, H) array.'''
+        return self._flat_hands.take(self._rows * self.order.shape[1] + players, axis=0)
+
+    def tops(self, colors):
+        '''The top of the table in each game of the colors given for it, an
+        array of indices with N rows.'''
+        rows = self._rows.reshape((-1,) + (1,) * (numpy.ndim(colors) - 1))
+        return self.table.take(rows * len(COLORS) + colors)
+
+    def step(self, kind, slot, target=None, hint=None):
+        '''Apply an action to each game that is not over. kind is PLAY,
+        DISCARD or HINT, slot the index in the hand of the card to play or
+        discard, target the player to hint and hint a color index (0 to 4)
+        or a number plus 4 (5 to 9). Return the games whose action was
+        taken.'''
+        rows, active = self._rows, ~self.over
+        kind, slot = numpy.asarray(kind), numpy.asarray(slot)
+        size = len(self._slots)
+        cur = self.current()
+        hands = self.hand(cur)
+        card = hands.take(rows * size + slot)
+        color, number = _color.take(card), _number.take(card)
+
+        plays = active & (kind == PLAY)
+        fits = plays & (number == self.tops(color))
+        misses = plays & ~fits
+        discards = active & (kind == DISCARD)
+        gone = plays | discards
+
+        taken = gone
+        if target is not None:
+            target, hint = numpy.asarray(target), numpy.asarray(hint)
+            theirs = self.hand(target)
+            matches = _matches.take(hint[:, None] * MAX_SCORE + theirs).any(axis=1)
+            hints = (active & (kind == HINT) & (target != cur) &
+                     (self.notes > 0) & matches)
+            self.notes -= hints
+            taken = gone | hints
+
+        self.table.reshape(-1)[(rows * len(COLORS) + color)[fits]] += 1
+        self._score += fits
+        back = discards | (fits & (number == 4))
+        self.notes += back & (self.notes < self.rules.max_notes)
+        self.storms += misses
+        lost = misses | discards
+        self.discarded.reshape(-1)[(rows * MAX_SCORE + card)[lost]] += 1
+
+        # take the card out and put the top of the deck at the end.
+        g = rows[gone]
+        shift = numpy.minimum(self._slots + (self._slots >= slot[gone][:, None]), size - 1)
+        refilled = hands.take(g[:, None] * size + shift)
+        refilled[:, -1] = self.deck.take(g * self.deck.shape[1] + self.drawn[g])
+        self._flat_hands[g * self.order.shape[1] + cur[gone]] = refilled
+        self.drawn += gone
+        self.turns += taken
+        self._seat += taken
+        self._seat[self._seat == self.order.shape[1]] = 0
+
+        self.over |= active & ((self.drawn >= self.deck.shape[1]) |
+                               (self._score == MAX_SCORE) |
+                               (self.storms >= self.rules.max_storms))
+        return taken
+
+
+def from_states(states):
+    '''A Batch of the engine.States of games that have just started, with
+    the same number of players and rules.'''
+    decks = [[card_code(c) for c in s.deck] for s in states]
+    orders = [[s.players.index(nick) for nick in s.turn_order] for s in states]
+    return Batch(decks, orders, states[0].rules)
+
+
+def from_seeds(seeds, players, rules=DEFAULT_RULES):
+    '''A Batch of the games hanabi.Game deals for seeds, started by
+    players players as simulator.run_game() does.'''
+    states = []
+    for seed in seeds:
+        game = Game(seed=seed, rules=rules)
+        nicks = ['player_%d' % i for i in range(1, players+1)]
+        for nick in nicks:
+            game.add_player(nick)
+        game.start_game(nicks[0])
+        states.append(game.state)
+
+    return from_states(states)
+
+
+def deal(n, players, rng, rules=DEFAULT_RULES, card_distribution=CARD_DISTRIBUTION):
+    '''A Batch of n games shuffled and ordered by the numpy RandomState rng.'''
+    cards = numpy.array([c * 5 + number - 1 for c in range(len(COLORS))
+                         for number in card_distribution], numpy.int8)
+    decks = cards[numpy.argsort(rng.random_sample((n, len(cards))), axis=1)]
+    orders = numpy.argsort(rng.random_sample((n, players)), axis=1)
+    return Batch(decks, orders, rules)
+
+
+def cheat_actions(batch):
+    '''The actions of simulator.cheat_policy for each game: play the first
+    card that fits, else hint the next player while there are notes, else
+    discard the first card that can never be played, else the highest
+    card. Return (kind, slot, target, hint).'''
+    hands = batch.hand(batch.current())
+    number = _number.take(hands)
+    tops = batch.tops(_color.take(hands))
+    fits, trash = number == tops, number < tops
+    can_play = fits.any(axis=1)
+
+    slot = numpy.where(can_play, fits.argmax(axis=1),
+                       numpy.where(trash.any(axis=1), trash.argmax(axis=1),
+                                   number.argmax(axis=1)))
+    kind = numpy.where(can_play, PLAY, numpy.where(batch.notes > 0, HINT, DISCARD))
+    players = batch.order.shape[1]
+    seat = batch._seat + 1
+    seat[seat == players] = 0
+    target = batch.order.take(batch._rows * players + seat)
+    hint = _color.take(batch.hand(target)[:, 0])
+    return kind, slot, target, hint
+
+
+def simulate(games, players, seed=0, chunksize=100000):
+    '''Play games games with the cheat policy, chunksize at a time. Return
+    the stats of simulator.run_batch(), with the turns taken.'''
+    rng = numpy.random.RandomState(seed)
+    scores, turns = defaultdict(int), 0
+    start = time.time()
+    for first in xrange(0, games, chunksize):
+        batch = deal(min(chunksize, games - first), players, rng)
+        while not batch.over.all():
+            batch.step(*cheat_actions(batch))
+        for s, n in zip(*numpy.unique(batch.score(), return_counts=True)):
+            scores[int(s)] += int(n)
+        turns += int(batch.turns.sum())
+
+    elapsed = time.time() - start
+    return {
+        'games': games,
+        'elapsed': elapsed,
+        'games_per_sec': games / elapsed if elapsed else float('inf'),
+        'turns': turns,
+        'scores': dict(scores),
+    }
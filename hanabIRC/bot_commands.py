@@ -0,0 +1,149 @@
+'''
+    bot_commands.py is the table of bot commands.
+
+    Each Command names its handler, its aliases, and a schema for its
+    arguments: a list of converters, one per argument, the last few of
+    which may be optional. The table is compiled once into a dict from
+    every name and alias to its Command, so dispatching a message is one
+    dict lookup and checking its arguments is one pass over the schema.
+
+    Converters take the argument string and return the converted value,
+    or raise ValueError if it is not valid.
+'''
+from hanabi import Game
+
+
+class ArgError(ValueError):
+    '''The arguments given do not match a command's schema.'''
+    pass
+
+
+# argument converters
+#############################################################
+def word(arg):
+    return str(arg)
+
+
+def card(arg):
+    '''A card in the player's hand, by letter. Case insensitive.'''
+    if len(arg) != 1 or arg.upper() not in 'ABCDE':
+        raise ValueError(arg)
+
+    return arg.upper()
+
+
+def slot(arg):
+    '''A 1-based position in a hand.'''
+    i = int(arg)
+    if not 1 <= i <= 5:
+        raise ValueError(arg)
+
+    return i
+
+
+_hint_colors = dict([(c, c) for c in Game.colors] + [(c[0], c) for c in Game.colors])
+
+
+def hint(arg):
+    '''A number 1-5, or a color given by name or first letter. Case insensitive.'''
+    if arg.isdigit():
+        return slot(arg)
+
+    try:
+        return _hint_colors[arg.lower()]
+    except KeyError:
+        raise ValueError(arg)
+
+
+def span(arg):
+    '''How long to profile: a number of commands ("50"), a number of seconds
+    or minutes ("30s", "5m"), or "stop". Returns (kind, amount).'''
+    if arg == 'stop':
+        return ('stop', None)
+    if arg[-1:] in ('s', 'm'):
+        n = float(arg[:-1])
+        if n <= 0:
+            raise ValueError(arg)
+        return ('seconds', n * 60 if arg[-1] == 'm' else n)
+
+    n = int(arg)
+    if n <= 0:
+        raise ValueError(arg)
+
+    return ('commands', n)
+
+
+class Command(object):
+    '''
+    A bot command. handler is called as handler(args, event) with args
+    converted by schema. The last optional items in schema may be left out.
+    '''
+    def __init__(self, name, group, schema=(), optional=0, aliases=(),
+                 needs_game=True, admin=False):
+        self.name = name
+        self.group = group
+        self.schema = tuple(schema)
+        self.optional = optional
+        self.aliases = tuple(aliases)
+        self.needs_game = needs_game
+        self.admin = admin
+        self._min = len(self.schema) - optional
+
+    def parse(self, args):
+        '''Return args converted by the schema. Raise ArgError if they do not fit.'''
+        if not self._min <= len(args) <= len(self.schema):
+            raise ArgError('Wrong number of arguments to %s' % self.name)
+
+        converted = []
+        for conv, a in zip(self.schema, args):
+            try:
+                converted.append(conv(a))
+            except ValueError:
+                raise ArgError('Wrong type for argument %s in command %s.' % (a, self.name))
+
+        return converted
+
+
+commands = [
+    Command('new', 'Game Management', [word], optional=1, needs_game=False),
+    Command('delete', 'Game Management'),
+    Command('join', 'Game Management', aliases=['j']),
+    Command('start', 'Game Management'),
+    Command('leave', 'Game Management'),
+    Command('part', 'Game Management', needs_game=False),
+    Command('seed', 'Game Management', [int], optional=1),
+    Command('move', 'Hand Management', [card, slot], aliases=['m']),
+    Command('swap', 'Hand Management', [card, card], aliases=['s']),
+    Command('sort', 'Hand Management'),
+    Command('play', 'Game Action', [card], aliases=['p']),
+    Command('hint', 'Game Action', [word, hint], aliases=['h']),
+    Command('discard', 'Game Action', [card], aliases=['d']),
+    Command('help', 'Information', [word], optional=1, needs_game=False),
+    Command('rules', 'Information', needs_game=False),
+    Command('turn', 'Information'),
+    Command('turns', 'Information'),
+    Command('game', 'Information', needs_game=False),
+    Command('games', 'Information', needs_game=False),
+    Command('hands', 'Information'),
+    Command('table', 'Information', aliases=['t']),
+    Command('discardpile', 'Information', aliases=['dp']),
+    Command('profile', 'Admin', [span, word], optional=2, needs_game=False, admin=True),
+    Command('undo', 'Admin', admin=True),
+    Command('die', 'Admin', needs_game=False, admin=True),
+]
+
+
+def compile_table(cmds):
+    '''Return a dict of every name and alias in cmds to its Command.'''
+    table = dict()
+    for cmd in cmds:
+        for name in (cmd.name,) + cmd.aliases:
+            if name in table:
+                raise ValueError('command name %s used twice' % name)
+
+            table[name] = cmd
+
+    return table
+
+
+table = compile_table(commands)
@@ -0,0 +1,603 @@
+'''
+    engine.py is the side effect free core of the Hanabi rules.
+
+    A State is an immutable, hashable value holding everything about a
+    game: the players, their hands and what the hints told them about
+    their cards, the turn order, the deck order and how much of it has
+    been drawn, the table, discards and tokens, and the Rules played by.
+    apply(state, action) returns the state after the action and its
+    output for the players, the (public, private) pair of lists that
+    hanabi.Game methods return, and changes nothing. An action that is
+    not allowed returns the same state, with the reason in the output.
+
+    Actions are journal records (see journal.py), e.g. ('play', nick,
+    'A'). The random outcomes, the turn order of a 'start' and the new
+    deck of a 'leave', are part of the action, so a state and an action
+    always give the same result.
+
+    hanabi.Game wraps a State, picking the random outcomes with its seeded
+    generator. Search and analysis code can use states directly, as
+    dictionary keys, sent to other processes, or shared between branches.
+
+    Usage:
+        state = new_state(deck)
+        state, output = apply(state, ('join', 'alice'))
+        state, output = apply(state, ('join', 'bob'))
+        state, output = apply(state, ('start', 'alice', ('bob', 'alice')))
+        state, (pub, priv) = apply(state, ('play', 'bob', 'A'))
+'''
+import logging
+import string
+from collections import namedtuple
+from text_markup import irc_markup
+from events import (CardPlayed, CardDiscarded, CardDrawn, HintGiven,
+                    TokensChanged, TableState, HandsShown, GameEnded)
+
+log = logging.getLogger(__name__)
+
+COLORS = ['red', 'white', 'blue', 'green', 'yellow']
+CARD_DISTRIBUTION = [1, 1, 1, 2, 2, 3, 3, 4, 4, 5]
+
+# color --> index into the table
+COLOR_INDEX = dict((c, i) for i, c in enumerate(COLORS))
+
+MAX_SCORE = 5 * len(COLORS)
+
+# knowledge masks with every color or every number still possible.
+ALL_COLORS = ALL_NUMBERS = 0x1f
+
+
+class Card(object):
+    '''
+    Card has a color, a number, and a "mark". The mark is a char that
+    represents the card, think the image of the char on the back of the card.
+
+    Cards are small records that are never changed once built, so the same
+    instance can sit in any number of decks, hands, and games. Use Card.get()
+    to fetch the shared instance for a (color, number, mark) triple.
+    '''
+    __slots__ = ('color', 'number', 'mark')
+
+    # one markup instance shared by all cards.
+    markup = irc_markup()
+
+    # (color, number, mark) --> Card
+    _interned = dict()
+
+    def __init__(self, color, number, mark=None):
+        self.color = color
+        self.number = number
+        self.mark = mark
+
+    @classmethod
+    def get(cls, color, number, mark=None):
+        '''Return the shared Card for color, number, and mark.'''
+        key = (color, number, mark)
+        card = cls._interned.get(key)
+        if card is None:
+            card = cls._interned[key] = cls(color, number, mark)
+
+        return card
+
+    def front(self):
+        return self.markup.card(self.color, self.number)
+
+    def back(self):
+        return '%s' % self.mark
+
+    def __str__(self):
+        return self.markup.card(self.color, self.number, self.mark)
+
+    def __repr__(self):
+        return 'Card(%r, %d, %r)' % (self.color, self.number, self.mark)
+
+    def __eq__(self, other):
+        return (isinstance(other, Card) and self.color == other.color and
+                self.number == other.number and self.mark == other.mark)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.color, self.number, self.mark))
+
+
+# The house rules: the most players, the note and storm tokens, and
+# hand_sizes[n], the cards dealt to each of n players.
+Rules = namedtuple('Rules', ['max_players', 'max_notes', 'max_storms', 'hand_sizes'])
+
+DEFAULT_RULES = Rules(max_players=5, max_notes=8, max_storms=3,
+                      hand_sizes=(5, 5, 5, 5, 4, 4))
+
+
+class State(namedtuple('State', ['rules', 'players', 'hands', 'knowledge',
+                                 'turn_order', 'deck', 'drawn', 'table', 'score',
+                                 'discards', 'notes', 'storms', 'playing', 'over'])):
+    '''
+        The state of a game. players are the nicks in the order they
+        joined; hands and knowledge are indexed like players, a tuple of
+        Cards and a tuple of (colors, numbers) knowledge masks for each
+        (see Player). deck is the order of the whole deck, of which the
+        first drawn cards have been drawn. table is the top number played
+        in each color, indexed like COLORS, and score its sum.
+    '''
+    __slots__ = ()
+
+    def _replace(self, **changes):
+        # a few times faster than namedtuple's, which checks and rebuilds
+        # every field. Actions call this a handful of times each.
+        values = list(self)
+        for name, value in changes.iteritems():
+            values[_fields[name]] = value
+        return tuple.__new__(State, values)
+
+    def index(self, nick):
+        '''nick's index into players, None if not in the game.'''
+        return self.players.index(nick) if nick in self.players else None
+
+    def hand(self, nick):
+        return self.hands[self.players.index(nick)]
+
+    def known(self, nick):
+        return self.knowledge[self.players.index(nick)]
+
+    def remaining(self):
+        '''The cards left in the deck, in the order they will be drawn.'''
+        return self.deck[self.drawn:]
+
+    def deck_size(self):
+        return len(self.deck) - self.drawn
+
+# field name --> index into a State
+_fields = dict((name, i) for i, name in enumerate(State._fields))
+
+
+def new_state(deck, rules=DEFAULT_RULES):
+    '''The state of a new game with no players and deck as the deck.'''
+    return State(rules=rules, players=(), hands=(), knowledge=(), turn_order=(),
+                 deck=tuple(deck), drawn=0, table=(0,) * len(COLORS), score=0,
+                 discards=(), notes=rules.max_notes, storms=0, playing=False,
+                 over=False)
+
+
+def set_card(state, nick, i, card):
+    '''Return state with card at index i of nick's hand, e.g. to set up
+    a position to test or analyse.'''
+    p = state.players.index(nick)
+    hand = list(state.hands[p])
+    hand[i] = card
+    return state._replace(hands=_put(state.hands, p, tuple(hand)))
+
+
+def apply(state, action):
+    '''Return (new state, (pub, priv)) for action applied to state.'''
+    return _actions[action[0]](state, *action[1:])
+
+
+def table_state(state):
+    '''A TableState event for state. The versions and the render cache are
+    left for the caller (see hanabi.Game).'''
+    return TableState(COLORS, state.table, state.notes, state.rules.max_notes,
+                      state.storms, state.rules.max_storms, state.deck_size(),
+                      state.discards, state.turn_order[0] if state.turn_order else None,
+                      None, None, None)
+
+
+def hands_shown(state, nick):
+    '''A HandsShown event of all the hands, for nick.'''
+    return HandsShown(nick, zip(state.players, state.hands, state.knowledge), COLORS)
+
+
+#
+# hand helpers, on hand and knowledge tuples. hanabi.Player uses these too.
+#
+def card_index(hand, X):
+    '''index of the card marked X in hand, None if there is none.'''
+    X = X.upper()
+    return next((i for i, c in enumerate(hand) if c.mark == X), None)
+
+
+def add_card(hand, knowledge, card):
+    '''Return hand and knowledge with card added, marked with the mark
+    missing from the hand.'''
+    marks = [c.mark for c in hand]
+    missing = [m for m in string.uppercase[:len(hand)+1] if m not in marks]
+    if len(missing) != 1:
+        log.info('Error: adding card to player\'s hand')
+        return hand, knowledge
+
+    # cards are shared, so add the marked version of the card.
+    return (hand + (Card.get(card.color, card.number, missing[0]),),
+            knowledge + ((ALL_COLORS, ALL_NUMBERS),))
+
+
+def sort_cards(hand, knowledge):
+    '''Return hand and knowledge with the cards in mark order.'''
+    order = sorted(xrange(len(hand)), key=lambda i: hand[i].mark)
+    return tuple(hand[i] for i in order), tuple(knowledge[i] for i in order)
+
+
+def swap_cards(hand, knowledge, A, B):
+    '''Return hand, knowledge, pub, priv after swapping cards A and B.'''
+    pub, priv = [], []
+    i = card_index(hand, A)
+    j = card_index(hand, B)
+    if i is None or j is None:
+        priv.append('!swap card argument must be one of %s' %
+                    ', '.join(sorted([c.mark for c in hand])))
+        return hand, knowledge, pub, priv
+
+    hand, knowledge = list(hand), list(knowledge)
+    hand[i], hand[j] = hand[j], hand[i]
+    knowledge[i], knowledge[j] = knowledge[j], knowledge[i]
+    priv.append('Swapped cards %s and %s' % (A, B))
+    return tuple(hand), tuple(knowledge), pub, priv
+
+
+def move_card(hand, knowledge, A, i):
+    '''Return hand, knowledge, pub, priv after moving card A to the 1-based
+    index i.'''
+    pub, priv = [], []
+    try:
+        i = int(i)
+    except ValueError:
+        priv.append('move index arugment must be an integer.')
+        return hand, knowledge, pub, priv
+
+    if not (1 <= i <= len(hand)):
+        priv.append('move index argument must between 1 and %d' % len(hand))
+        return hand, knowledge, pub, priv
+
+    j = card_index(hand, A)
+    if j is None:
+        priv.append('move card argument must be one of %s' %
+                    ', '.join(sorted([c.mark for c in hand])))
+        return hand, knowledge, pub, priv
+
+    hand, knowledge = list(hand), list(knowledge)
+    hand.insert(i-1, hand.pop(j))
+    knowledge.insert(i-1, knowledge.pop(j))
+    priv.append('Moved card %s to position %d.' % (A, i))
+    return tuple(hand), tuple(knowledge), pub, priv
+
+
+def learn(hand, knowledge, hint):
+    '''Return knowledge updated with hint, a color or a number: the cards
+    that match it are that color or number, the others are not.'''
+    if isinstance(hint, int):
+        bit = 1 << (hint - 1)
+        return tuple((colors, bit if c.number == hint else numbers & ~bit)
+                     for c, (colors, numbers) in zip(hand, knowledge))
+    else:
+        bit = 1 << COLOR_INDEX[hint]
+        return tuple((bit if c.color == hint else colors & ~bit, numbers)
+                     for c, (colors, numbers) in zip(hand, knowledge))
+
+
+#
+# actions. Each returns (state, (pub, priv)).
+#
+def _join(state, nick):
+    if state.playing:
+        return state, ([], ['Game already started.'])
+
+    pub, priv = [], []
+    if len(state.players) >= state.rules.max_players:
+        priv.append('Max players already in game %s.')
+    elif nick in state.players:
+        priv.append('You are already in the game.')
+    else:
+        state = state._replace(players=state.players + (nick,), hands=state.hands + ((),),
+                               knowledge=state.knowledge + ((),))
+        pub.append('%s has joined the game.' % nick)
+        if len(state.players) > 1:
+            pub.append('The game has enough players and can be started '
+                       'with the start command !start.')
+
+    return state, (pub, priv)
+
+
+def _leave(state, nick, deck=None):
+    '''deck is the new deck order if nick has cards, which go back in the
+    deck. Without it they go under the cards left.'''
+    p = state.index(nick)
+    if p is None:
+        return state, ([], ['You are not in the game. You cannot be removed from a game you'
+                            ' are not in.'])
+
+    pub, priv = [], []
+    pub.append('Removing %s from the game.' % nick)
+    priv.append('You\'ve been removed from the game.')
+    if state.hands[p]:
+        pub.append('Putting %s\'s cards back in the deck and reshuffling.' % nick)
+        if deck is None:
+            # back in the deck the cards lose their marks.
+            deck = state.remaining() + tuple(Card.get(c.color, c.number)
+                                             for c in state.hands[p])
+        state = state._replace(deck=tuple(deck), drawn=0)
+
+    state = state._replace(players=_drop(state.players, p), hands=_drop(state.hands, p),
+                           knowledge=_drop(state.knowledge, p))
+
+    if len(state.players) < 2:
+        pub.append('Stopping the game as there are fewer than two people left in '
+                   'the game.')
+        state = state._replace(playing=False, over=True)
+
+    elif len(state.players) < 4:
+        pub.append('Now that there are fewer than four players, everyone gets '
+                   'another card. Adding card to each player\s hand.')
+        for other in state.players:
+            state = _draw(state, other)
+
+    if state.playing:
+        if nick == state.turn_order[0]:
+            pub.append('It is now %s\'s turn.' % state.turn_order[1])
+
+        state = state._replace(turn_order=tuple(n for n in state.turn_order if n != nick))
+
+    return state, (pub, priv)
+
+
+def _start(state, nick, order=None):
+    '''order is the turn order, the join order if not given.'''
+    pub, priv = [], []
+    if nick not in state.players:
+        priv.append('You are not in the game.')
+        return state, (pub, priv)
+
+    if state.playing:
+        priv.append('The game has already begun.')
+        return state, (pub, priv)
+
+    if len(state.players) < 2:
+        priv.append('There are not enough players in the game, not starting.')
+        return state, (pub, priv)
+
+    pub.append('The Hanabi game has started!')
+    state = state._replace(playing=True, turn_order=tuple(order or state.players))
+    for player in state.players:
+        for i in xrange(state.rules.hand_sizes[len(state.players)]):
+            state = _draw(state, player)
+
+    pub.append(table_state(state))
+    return state, (pub, priv)
+
+
+def _play(state, nick, X):
+    pub, priv = [], []
+    if not _in_game_is_turn(state, nick, priv):
+        return state, (pub, priv)
+
+    p = state.players.index(nick)
+    i = card_index(state.hands[p], X)
+    if i is None:
+        priv.append('You tried to play card %s, oops.' % X)
+        priv.append('Card must be one of %s' %
+                    ', '.join(sorted([c.mark for c in state.hands[p]])))
+        return state, (pub, priv)
+
+    c = state.hands[p][i]
+    color = COLOR_INDEX[c.color]
+    if c.number == state.table[color] + 1:
+        pub.append(CardPlayed(nick, c, True))
+        changes = dict(table=_put(state.table, color, c.number), score=state.score + 1)
+        if c.number == 5:
+            changes['notes'] = min(state.notes + 1, state.rules.max_notes)
+            pub.append(TokensChanged(changes['notes'], state.storms, c.color))
+    else:
+        pub.append(CardPlayed(nick, c, False))
+        changes = dict(storms=min(state.storms + 1, state.rules.max_storms),
+                       discards=(c,) + state.discards)
+        pub.append(TokensChanged(state.notes, changes['storms'], None))
+
+    state = _end_turn(state, p, i, changes)
+    pub.append(CardDrawn(nick, state.hands[p][-1]))
+    pub.append(table_state(state))
+    return _check_over(state, pub), (pub, priv)
+
+
+def _discard(state, nick, X):
+    pub, priv = [], []
+    if not _in_game_is_turn(state, nick, priv):
+        return state, (pub, priv)
+
+    p = state.players.index(nick)
+    i = card_index(state.hands[p], X)
+    if i is None:
+        priv.append('You tried to discard card %s, oops.' % X)
+        priv.append('Card must be one of %s' %
+                    ', '.join(sorted([c.mark for c in state.hands[p]])))
+        return state, (pub, priv)
+
+    c = state.hands[p][i]
+    pub.append(CardDiscarded(nick, c))
+    state = _end_turn(state, p, i, dict(discards=state.discards + (c,),
+                                        notes=min(state.notes + 1, state.rules.max_notes)))
+    pub.append(CardDrawn(nick, state.hands[p][-1]))
+    pub.append(TokensChanged(state.notes, state.storms, None))
+    pub.append(table_state(state))
+    return _check_over(state, pub), (pub, priv)
+
+
+def _hint(state, nick, player, hint):
+    '''hint can be a color (a string) or a number (an int).'''
+    pub, priv = [], []
+    if not _in_game_is_turn(state, nick, priv):
+        return state, (pub, priv)
+
+    if nick == player:
+        priv.append('You really want to give a hint to yourself? Too bad '
+                    'no information leak here.')
+        return state, (pub, priv)
+
+    try:
+        hint = int(hint)
+    except ValueError:
+        try:
+            hint = str(hint)
+        except ValueError:
+            priv.append('The hint command must be a string (color) or '
+                        'an integer (card number). Valid colors are %s '
+                        ' or the first charecter  of the word (all case '
+                        'insensitive.' % ', '.join(COLORS))
+            return state, (pub, priv)
+
+    pub.append('Invalid hint command still %s\'s turn.' % state.turn_order[0])
+    if not player in state.players:
+        priv.append('player %s is not in the game.' % player)
+        return state, (pub, priv)
+
+    if isinstance(hint, str):
+        hint = hint.lower()
+        if not hint in COLORS or (
+                len(hint) == 1 and not hint in [c[0] for c in COLORS]):
+            priv.append('%s is not a valid color. Valid colors are %s.' %
+                    (hint, ', '.join(COLORS)))
+            return state, (pub, priv)
+
+        # convert "?" into full color string.
+        if len(hint) == 1:
+            hint = [c for c in COLORS if c[0] == hint][0]
+
+    elif isinstance(hint, int) and not 0 < hint < 6:
+        priv.append('numbers must be between 1 and 5 inclusive.')
+        return state, (pub, priv)
+
+    # valid hint command, do the action.
+    pub = []
+    if not state.notes:
+        pub.append('Oh no! %s gave a hint when all notes were turned '
+                   'over. ' % nick)
+        pub.append('So, ya know, just disregard anything they said.')
+        return state, (pub, priv)
+
+    p = state.players.index(player)
+    marks = [c.mark for c in state.hands[p] if c.number == hint or c.color == hint]
+    if not marks:
+        pub.append('Looks like %s is as deceiving as a low down dirty '
+                   '... deceiver. They gave a hint that does not '
+                   'match anything in %s\'s hand!' % (nick, player))
+        return state, (pub, priv)
+
+    pub.append(HintGiven(nick, player, hint, marks))
+    state = state._replace(knowledge=_put(state.knowledge, p,
+                                          learn(state.hands[p], state.knowledge[p], hint)))
+    state = state._replace(notes=max(state.notes - 1, 0),
+                           turn_order=state.turn_order[1:] + state.turn_order[:1])
+    pub.append(TokensChanged(state.notes, state.storms, None))
+    pub.append(table_state(state))
+    return state, (pub, priv)
+
+
+def _swap(state, nick, A, B):
+    p = state.index(nick)
+    if p is None:
+        return state, ([], ['You are not in the game.'])
+
+    hand, knowledge, pub, priv = swap_cards(state.hands[p], state.knowledge[p], A, B)
+    return _rearranged(state, nick, p, hand, knowledge, pub, priv)
+
+
+def _move(state, nick, A, i):
+    p = state.index(nick)
+    if p is None:
+        return state, ([], ['You are not in game %s.'])
+
+    hand, knowledge, pub, priv = move_card(state.hands[p], state.knowledge[p], A, i)
+    return _rearranged(state, nick, p, hand, knowledge, pub, priv)
+
+
+def _sort(state, nick):
+    p = state.index(nick)
+    if p is None:
+        return state, ([], ['You are not in game %s.'])
+
+    hand, knowledge = sort_cards(state.hands[p], state.knowledge[p])
+    return _rearranged(state, nick, p, hand, knowledge,
+                       ['Your cards have been sorted.'], [])
+
+
+def _rearranged(state, nick, p, hand, knowledge, pub, priv):
+    '''state with nick's rearranged hand, and the output showing the hands.'''
+    if hand is not state.hands[p]:
+        state = state._replace(hands=_put(state.hands, p, hand),
+                               knowledge=_put(state.knowledge, p, knowledge))
+
+    priv.append(hands_shown(state, nick))
+    return state, (pub, priv)
+
+
+_actions = {
+    'join': _join,
+    'leave': _leave,
+    'start': _start,
+    'play': _play,
+    'discard': _discard,
+    'hint': _hint,
+    'swap': _swap,
+    'move': _move,
+    'sort': _sort,
+}
+
+
+def _put(items, i, item):
+    '''tuple items with items[i] replaced by item.'''
+    return items[:i] + (item,) + items[i+1:]
+
+
+def _drop(items, i):
+    return items[:i] + items[i+1:]
+
+
+def _draw(state, nick):
+    '''Move the top card of the deck to nick's hand.'''
+    if state.drawn >= len(state.deck):
+        raise IndexError('draw from an empty deck')
+
+    p = state.players.index(nick)
+    hand, knowledge = add_card(state.hands[p], state.knowledge[p], state.deck[state.drawn])
+    return state._replace(hands=_put(state.hands, p, hand),
+                          knowledge=_put(state.knowledge, p, knowledge),
+                          drawn=state.drawn + 1)
+
+
+def _end_turn(state, p, i, changes):
+    '''state at the end of a play or discard of card i by player p: with
+    the card replaced by the top card of the deck, the changes (a dict of
+    fields) made, and the turn passed on.'''
+    if state.drawn >= len(state.deck):
+        raise IndexError('draw from an empty deck')
+
+    hand, knowledge = add_card(_drop(state.hands[p], i), _drop(state.knowledge[p], i),
+                               state.deck[state.drawn])
+    changes.update(hands=_put(state.hands, p, hand), knowledge=_put(state.knowledge, p, knowledge),
+                   drawn=state.drawn + 1,
+                   turn_order=state.turn_order[1:] + state.turn_order[:1])
+    return state._replace(**changes)
+
+
+def _check_over(state, pub):
+    '''state ended if any end of game condition is true.'''
+    if (state.drawn >= len(state.deck) or state.score == MAX_SCORE or
+            state.storms == state.rules.max_storms):
+        pub.append(GameEnded(state.score))
+        return state._replace(playing=False, over=True)
+
+    return state
+
+
+def _in_game_is_turn(state, nick, priv):
+    '''Return True if the player is in the game and it is his/her turn
+    else return False.'''
+    if not nick in state.players:
+        priv.append('You are not in game.')
+        return False
+    elif not state.playing:
+        priv.append('The game has not yet started')
+        return False
+    elif state.turn_order[0] != nick:
+        priv.append('It is not your turn. It is %s\'s turn.' % state.turn_order[0])
+        return False
+
+    return True
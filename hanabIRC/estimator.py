@@ -0,0 +1,312 @@
+'''
+    estimator.py estimates how well games go under variants of the rules,
+    to decide which house rules to play by.
+
+    A Variant is a number of players, the engine.Rules (the most players,
+    note and storm tokens, and the cards dealt to each player for each
+    number of players) and the card distribution (the numbers of the
+    cards of each color). Games of each variant are played by a scripted
+    policy (see simulator.py) across a multiprocessing pool, a chunk of
+    seeds at a time. Every variant plays the same seeds, so differences
+    between variants are not down to the luck of the deals.
+
+    An Estimate keeps the running score mean and variance and the number
+    of perfect games of a variant, with confidence intervals for both.
+    run() yields the estimates each time a chunk is done, so a caller can
+    report them as they come and stop whenever it likes. It stops by
+    itself once every interval is narrower than asked for (after
+    min_games games of each variant), or after max_games games of each.
+
+    Usage:
+        variants = make_variants(players=[3, 4], notes=[8, 10])
+        for variant, estimates in run(variants, tolerance=0.05):
+            ...
+'''
+import argparse
+import itertools
+import logging
+import math
+import signal
+import sys
+import time
+from collections import deque, namedtuple
+from multiprocessing import Pool, cpu_count
+
+from engine import COLORS, DEFAULT_RULES, CARD_DISTRIBUTION, MAX_SCORE
+from simulator import run_game, policies
+
+log = logging.getLogger(__name__)
+
+Variant = namedtuple('Variant', ['players', 'rules', 'card_distribution'])
+
+
+def make_variants(players=(3,), notes=(DEFAULT_RULES.max_notes,),
+                  storms=(DEFAULT_RULES.max_storms,), hand_sizes=(DEFAULT_RULES.hand_sizes,),
+                  card_distributions=(CARD_DISTRIBUTION,)):
+    '''Every combination of the given numbers of players, notes, storms,
+    hand sizes (by number of players, see engine.Rules) and card
+    distributions, as Variants. Games of more than the default most
+    players are allowed, dealt the hand size of the most players given.
+    Raise ValueError if a variant deals the whole deck, which leaves no
+    card to draw after the first play.'''
+    variants = []
+    for p, n, s, h, d in itertools.product(players, notes, storms, hand_sizes,
+                                           card_distributions):
+        h = tuple(h) + (h[-1],) * (p + 1 - len(h))
+        if len(COLORS) * len(d) <= p * h[p]:
+            raise ValueError('%d players with hands of %d need more than %d cards' %
+                             (p, h[p], len(COLORS) * len(d)))
+        rules = DEFAULT_RULES._replace(max_players=max(p, DEFAULT_RULES.max_players),
+                                       max_notes=n, max_storms=s, hand_sizes=h)
+        variants.append(Variant(p, rules, tuple(d)))
+
+    return variants
+
+
+def describe(variant):
+    '''The variant as a string.'''
+    rules = variant.rules
+    return '%d players, %d notes, %d storms, hands of %d, cards %s' % (
+        variant.players, rules.max_notes, rules.max_storms,
+        rules.hand_sizes[variant.players],
+        ''.join(str(n) for n in variant.card_distribution))
+
+
+def z_score(confidence):
+    '''The number of standard deviations either side of the mean of a
+    normal distribution that hold confidence of it.'''
+    low, high = 0.0, 10.0
+    while high - low > 1e-9:
+        z = (low + high) / 2
+        if math.erf(z / math.sqrt(2)) < confidence:
+            low = z
+        else:
+            high = z
+
+    return (low + high) / 2
+
+
+class Estimate(object):
+    '''The running statistics of the scores of a variant's games.'''
+    def __init__(self):
+        self.games = 0
+        self.mean = 0.0
+        self._m2 = 0.0              # sum of squared differences from the mean
+        self.perfect = 0
+
+    def add(self, score):
+        # Welford's update, so long runs do not lose precision.
+        self.games += 1
+        delta = score - self.mean
+        self.mean += delta / self.games
+        self._m2 += delta * (score - self.mean)
+        if score == MAX_SCORE:
+            self.perfect += 1
+
+    def variance(self):
+        return self._m2 / (self.games - 1) if self.games > 1 else float('inf')
+
+    def interval(self, z):
+        '''The half width of the confidence interval of the mean score.'''
+        if self.games < 2:
+            return float('inf')
+        return z * math.sqrt(self.variance() / self.games)
+
+    def perfect_rate(self):
+        return float(self.perfect) / self.games if self.games else 0.0
+
+    def perfect_interval(self, z):
+        '''The (low, high) confidence interval of the rate of perfect games,
+        Wilson's, which holds up when the rate is near 0 or 1.'''
+        if not self.games:
+            return 0.0, 1.0
+
+        n, p = self.games, self.perfect_rate()
+        center = (p + z * z / (2 * n)) / (1 + z * z / n)
+        half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        return max(0.0, center - half), min(1.0, center + half)
+
+    def tight(self, z, tolerance, perfect_tolerance=None):
+        '''True if the intervals are no wider than tolerance points either
+        side of the mean and perfect_tolerance either side of the rate.'''
+        if self.interval(z) > tolerance:
+            return False
+        if perfect_tolerance is not None:
+            low, high = self.perfect_interval(z)
+            return (high - low) / 2 <= perfect_tolerance
+
+        return True
+
+
+def _ignore_interrupts():
+    '''worker initializer: leave ^C to the parent, which stops the pool.'''
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_chunk(args):
+    '''worker entry point: the scores of a variant's games for each seed in
+    the chunk.'''
+    i, variant, policy_name, seeds = args
+    policy = policies[policy_name]
+    return i, [run_game(policy, variant.players, seed, rules=variant.rules,
+                        card_distribution=variant.card_distribution)['score']
+               for seed in seeds]
+
+
+def run(variants, policy_name='cheat', processes=None, seed=0, chunksize=200,
+        confidence=0.95, tolerance=0.05, perfect_tolerance=None, min_games=1000,
+        max_games=None):
+    '''Play games of each variant until its estimate is tight (see
+    Estimate.tight) after at least min_games, or until max_games have been
+    played. After each chunk of games yield (its variant, the Estimates of
+    all variants, in order).
+    With processes of 1 the games are played here, else by a pool of that
+    many processes (None for one per cpu), each kept busy with a couple of
+    chunks at a time.'''
+    z = z_score(confidence)
+    estimates = [Estimate() for v in variants]
+    started = [0] * len(variants)   # the games of each variant handed out
+
+    def wanted(i):
+        if max_games is not None and started[i] >= max_games:
+            return False
+        return started[i] < min_games or not estimates[i].tight(z, tolerance, perfect_tolerance)
+
+    def next_chunk():
+        '''the next chunk to play, for the variant with the fewest games
+        handed out that still needs some. None if none do.'''
+        needed = [i for i in range(len(variants)) if wanted(i)]
+        if not needed:
+            return None
+
+        i = min(needed, key=lambda i: started[i])
+        n = chunksize if max_games is None else min(chunksize, max_games - started[i])
+        seeds = range(seed + started[i], seed + started[i] + n)
+        started[i] += n
+        return (i, variants[i], policy_name, seeds)
+
+    def record(i, scores):
+        for s in scores:
+            estimates[i].add(s)
+        return variants[i], estimates
+
+    if processes == 1:
+        chunk = next_chunk()
+        while chunk:
+            yield record(*_run_chunk(chunk))
+            chunk = next_chunk()
+        return
+
+    pool = Pool(processes, _ignore_interrupts)
+    in_flight = 2 * (processes or cpu_count())
+    pending = deque()
+    try:
+        while True:
+            while len(pending) < in_flight:
+                chunk = next_chunk()
+                if chunk is None:
+                    break
+                pending.append(pool.apply_async(_run_chunk, (chunk,)))
+
+            if not pending:
+                break
+
+            # get() with no timeout cannot be interrupted.
+            yield record(*pending.popleft().get(86400))
+    finally:
+        # also when the caller stops early: drop the games still going.
+        pool.terminate()
+        pool.join()
+
+
+def report(variants, estimates, confidence, elapsed):
+    '''Return the estimates as a list of strings.'''
+    z = z_score(confidence)
+    games = sum(e.games for e in estimates)
+    lines = ['%d games in %.1f seconds (%.1f games/sec), %g%% intervals.' % (
+        games, elapsed, games / elapsed if elapsed else float('inf'), confidence * 100)]
+    for variant, e in zip(variants, estimates):
+        low, high = e.perfect_interval(z)
+        lines.append('%s: %d games, score %.2f +/- %.2f, perfect %.1f%% (%.1f%% to %.1f%%).' % (
+            describe(variant), e.games, e.mean, e.interval(z), e.perfect_rate() * 100,
+            low * 100, high * 100))
+
+    return lines
+
+
+def _numbers(text):
+    return [int(n) for n in text.split(',')]
+
+
+def main(argv=None):
+    desc = 'Estimate the scores of games of Hanabi under variants of the rules.'
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument('-p', '--players', type=_numbers, default=[3],
+                           help='The numbers of players, e.g. 2,3,4,5. Default is 3.')
+    argparser.add_argument('-n', '--notes', type=_numbers,
+                           default=[DEFAULT_RULES.max_notes],
+                           help='The numbers of note tokens, e.g. 8,10.')
+    argparser.add_argument('-t', '--storms', type=_numbers,
+                           default=[DEFAULT_RULES.max_storms],
+                           help='The numbers of storm tokens, e.g. 3,4.')
+    argparser.add_argument('-H', '--hand-sizes', type=_numbers, action='append',
+                           help='The cards dealt to each player, by number of players '
+                           'from 0 (e.g. 5,5,5,5,4,4), or one size for all. Repeat for '
+                           'more than one. Default is %s.' %
+                           ','.join(str(h) for h in DEFAULT_RULES.hand_sizes))
+    argparser.add_argument('-d', '--distribution', action='append',
+                           help='The numbers of the cards of each color, e.g. %s. '
+                           'Repeat for more than one.' %
+                           ''.join(str(n) for n in CARD_DISTRIBUTION))
+    argparser.add_argument('--policy', default='cheat',
+                           choices=sorted(policies.keys()),
+                           help='How the players choose their actions.')
+    argparser.add_argument('-c', '--confidence', type=float, default=0.95,
+                           help='The confidence of the intervals.')
+    argparser.add_argument('-e', '--tolerance', type=float, default=0.05,
+                           help='Stop once the mean score of each variant is known to '
+                           'this many points either side.')
+    argparser.add_argument('--perfect-tolerance', type=float,
+                           help='And the rate of perfect games to this either side, '
+                           'e.g. 0.01.')
+    argparser.add_argument('-g', '--max-games', type=int,
+                           help='Stop after this many games of each variant.')
+    argparser.add_argument('-j', '--processes', type=int, default=cpu_count(),
+                           help='The number of worker processes.')
+    argparser.add_argument('-s', '--seed', type=int, default=0,
+                           help='The seed of the first game of each variant.')
+    argparser.add_argument('-i', '--interval', type=float, default=5,
+                           help='Report the estimates every this many seconds.')
+    args = argparser.parse_args(argv)
+
+    try:
+        variants = make_variants(
+            players=args.players, notes=args.notes, storms=args.storms,
+            hand_sizes=[h * 6 if len(h) == 1 else h for h in args.hand_sizes or
+                        [DEFAULT_RULES.hand_sizes]],
+            card_distributions=[[int(n) for n in d] for d in args.distribution or
+                                [CARD_DISTRIBUTION]])
+    except ValueError as e:
+        argparser.error(str(e))
+
+    start = last = time.time()
+    estimates = [Estimate() for v in variants]
+    try:
+        for variant, estimates in run(variants, args.policy, args.processes, args.seed,
+                                      confidence=args.confidence, tolerance=args.tolerance,
+                                      perfect_tolerance=args.perfect_tolerance,
+                                      max_games=args.max_games):
+            if time.time() - last >= args.interval:
+                last = time.time()
+                for l in report(variants, estimates, args.confidence, last - start):
+                    print l
+                print
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        print 'Stopped.'
+
+    for l in report(variants, estimates, args.confidence, time.time() - start):
+        print l
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+'''
+    events.py defines the events reported by the hanabi.Game engine.
+
+    Game methods return a pair of lists, (public, private). Each item
+    in a list is either a plain string or one of the Event objects
+    below. Events only hold the facts of what happened; turning them
+    into text is left to renderer.Renderer, so callers that never show
+    the output (simulations, AI players, logging) never pay for the
+    formatting and markup.
+
+    str(event) renders the event with the default (IRC) renderer.
+'''
+
+
+class Event(object):
+    '''Base class for all game events.'''
+    __slots__ = ()
+
+    def __init__(self, *args):
+        for name, value in zip(self.__slots__, args):
+            setattr(self, name, value)
+
+    def __str__(self):
+        # imported here as the renderer needs the event classes.
+        from renderer import default_renderer
+        return '\n'.join(default_renderer.render(self))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            ['%s=%r' % (n, getattr(self, n)) for n in self.__slots__]))
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, n) == getattr(other, n) for n in self.__slots__))
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class CardPlayed(Event):
+    '''nick played card. success is False if the card did not fit on
+    the table, in which case it went to the discard pile.'''
+    __slots__ = ('nick', 'card', 'success')
+
+
+class CardDiscarded(Event):
+    '''nick discarded card.'''
+    __slots__ = ('nick', 'card')
+
+
+class CardDrawn(Event):
+    '''nick drew card from the deck.'''
+    __slots__ = ('nick', 'card')
+
+
+class HintGiven(Event):
+    '''nick told player which of their cards (marks) match hint.'''
+    __slots__ = ('nick', 'player', 'hint', 'marks')
+
+
+class TokensChanged(Event):
+    '''The note or storm tokens changed. notes and storms are the
+    number of tokens now flipped up. bonus is the color of a group
+    just finished, if that is why a note was flipped up.'''
+    __slots__ = ('notes', 'storms', 'bonus')
+
+
+class TableState(Event):
+    '''A snapshot of the table. table is the top number played in each
+    color, indexed like colors. discards is a tuple of Cards.
+    table_version and discards_version change when the table or discards
+    change; cache is the game's render cache (see Renderer).'''
+    __slots__ = ('colors', 'table', 'notes', 'max_notes', 'storms',
+                 'max_storms', 'deck_size', 'discards', 'turn',
+                 'table_version', 'discards_version', 'cache')
+
+
+class HandsShown(Event):
+    '''The hands of all players as seen by viewer. hands is a list of
+    (name, tuple of Cards, tuple of (colors, numbers) knowledge masks as
+    in hanabi.Player); the color bits are indexed like colors.'''
+    __slots__ = ('viewer', 'hands', 'colors')
+
+
+class DiscardPileShown(Event):
+    '''The discard pile, a tuple of Cards, with its version and the game's
+    render cache as in TableState.'''
+    __slots__ = ('discards', 'discards_version', 'cache')
+
+
+class GameEnded(Event):
+    '''The game is over with the final score.'''
+    __slots__ = ('score',)
@@ -2,9 +2,10 @@
     hanabi.py implements the logic of the game Hanabi.
 
     It exports an API for player and card management. The API
-    generally returns arrays of strings suitable for display to 
-    game players. These strings can be dumped to an IRC channel,
-    or directly to a socket, stdout, etc. 
+    generally returns arrays of strings and events (see events.py)
+    suitable for display to game players. A renderer.Renderer turns
+    them into text that can be dumped to an IRC channel, or directly
+    to a socket, stdout, etc. 
 
     The general play sequence is: 
         add players
@@ -23,34 +24,22 @@
         number of legally played cards on the table at the end 
         of the game.
 
+    The rules themselves are in engine.py, as a function from an
+    immutable State and an action to the next State. A Game holds the
+    current State and adds what the engine leaves out: the seeded random
+    number generator, the observers, the render cache and the undo
+    history. As states are values, a Game can be snapshot() after any
+    action and restore()d later, e.g. to undo a misclick, or branch()ed
+    into a copy to try out moves, without copying anything.
+
 '''
-import logging
+import copy
 import random
-import string
-from text_markup import irc_markup
-from collections import defaultdict
-
-log = logging.getLogger(__name__)
-
-class Card(object):
-    '''
-    Card has a color, a number, and a "mark". The mark is a char that 
-    represents the card, think the image of the char on the back of the card.
-    '''
-    def __init__(self, color, number, mark=None):
-        self.color = color
-        self.number = number
-        self.mark = mark
-        self.markup = irc_markup()
-
-    def front(self):
-        return self.markup.color('%s%d' % (self.color[0].upper(), self.number), self.color)
-
-    def back(self):
-        return '%s' % self.mark
+from collections import deque
+from events import TableState, DiscardPileShown
+import engine
+from engine import Card, DEFAULT_RULES, COLORS, COLOR_INDEX, CARD_DISTRIBUTION
 
-    def __str__(self):
-        return self.markup.color('%s%d' % (self.color[0].upper(), self.number), self.color) + '/%s' % self.mark
 
 class Player(object):
     '''
@@ -58,63 +47,51 @@ class Player(object):
         an opaque hand. If anyone else wants to see it, they see it all.
 
         Players can modify the order of cards in their own hands as well.
+
+        knowledge keeps what the hints so far say about each card, indexed
+        like hand: a (colors, numbers) pair of bitmasks of what the card can
+        still be. Bit i of colors is Game.colors[i]; bit n-1 of numbers is
+        the number n.
+
+        A Game keeps its hands in its State; a Player is a hand on its own,
+        changed with the same rules.
     '''
     def __init__(self, name):
         self.name = str(name)
         # The player's hand, a list of Cards
         self.hand = list()
+        self.knowledge = list()
+
+    def _set(self, hand, knowledge):
+        self.hand = list(hand)
+        self.knowledge = list(knowledge)
 
     def sort_cards(self):
         '''
         re-sort the card into "orginal" positions.
         '''
-        self.hand = sorted(self.hand, key=lambda x: x.mark)
-
+        self._set(*engine.sort_cards(tuple(self.hand), tuple(self.knowledge)))
         pub, priv = [], []
         pub.append('Your cards have been sorted.')
         return pub, priv
 
     def card_index(self, X):
-        # ugly, sorry. Works well though.
-        return next((i for i, c in enumerate(self.hand) if c.mark == X.upper()), None)
+        return engine.card_index(self.hand, X)
 
     def swap_cards(self, A, B):
         '''swap a card within a hand. output is for the group. A and B
         are the position-based index of the cards.'''
-        pub, priv = [], []
-        i = self.card_index(A.upper())
-        j = self.card_index(B.upper())
-        if i is None or j is None:
-            priv.append('!swap card argument must be one of %s' %
-                        ', '.join(sorted([c.mark for c in self.hand])))
-            return pub, priv
-
-        self.hand[i], self.hand[j] = self.hand[j], self.hand[i]
-        priv.append('Swapped cards %s and %s' % (A, B))
+        hand, knowledge, pub, priv = engine.swap_cards(
+            tuple(self.hand), tuple(self.knowledge), A, B)
+        self._set(hand, knowledge)
         return pub, priv
 
     def move_card(self, A, i):
         '''swap a card within a hand. A is the card, i is the 1-based index or where
         to put it within the hand.'''
-        pub, priv = [], []
-        try:
-            i = int(i)
-        except ValueError:
-            priv.append('move index arugment must be an integer.')
-            return pub, priv
-
-        if not (1 <= i <= len(self.hand)):
-            priv.append('move index argument must between 1 and %d' % len(self.hand))
-            return pub, priv
-
-        j = self.card_index(A.upper())
-        if j is None:
-            priv.append('move card argument must be one of %s' %
-                        ', '.join(sorted([c.mark for c in self.hand])))
-            return pub, priv
-
-        self.hand.insert(i-1, self.hand.pop(j))
-        priv.append('Moved card %s to position %d.' % (A, i))
+        hand, knowledge, pub, priv = engine.move_card(
+            tuple(self.hand), tuple(self.knowledge), A, i)
+        self._set(hand, knowledge)
         return pub, priv
 
     def get_hand(self, hidden=False):
@@ -130,16 +107,17 @@ class Player(object):
     def add_card(self, card):
         '''Add a card to a player's hand. This method marks the back of the card
         appropriately and is the only way you should add cards to a player's hand.'''
-        # use sets to find the missing mark
-        missing = set(string.uppercase[:len(self.hand)+1]) - set([c.mark for c in self.hand])
+        self._set(*engine.add_card(tuple(self.hand), tuple(self.knowledge), card))
 
-        if len(missing) != 1:
-            log.info('Error: adding card to player\'s hand')
-            return
+    def remove_card(self, i):
+        '''Remove the card at index i from the hand and return it.'''
+        del self.knowledge[i]
+        return self.hand.pop(i)
 
-        # simply append the card after marking it.
-        card.mark = list(missing)[0]
-        self.hand.append(card)
+    def learn(self, hint):
+        '''Update knowledge with hint, a color or a number: the cards that
+        match it are that color or number, the others are not.'''
+        self.knowledge = list(engine.learn(self.hand, self.knowledge, hint))
 
 
 class Game(object):
@@ -163,39 +141,108 @@ class Game(object):
         TODO: doctest sample here.
     '''
     # "static" class variables.
-    colors = ['red', 'white', 'blue', 'green', 'yellow'] 
-    card_distribution = [1, 1, 1, 2, 2, 3, 3, 4, 4, 5]
+    colors = COLORS
+    card_distribution = CARD_DISTRIBUTION
 
-    def __init__(self):
+    # color --> index into the table
+    _color_index = COLOR_INDEX
+
+    def __init__(self, seed=None, deck=None, rules=DEFAULT_RULES):
         '''
-            Later may take variants as args so something.
+            seed seeds the game's own random number generator, which
+            shuffles the deck and picks the turn order, so the same seed
+            and actions always give the same game. A seed is picked if
+            none is given; it is kept in self.seed. deck is an explicit
+            deck order (a list of Cards, drawn from the start) to use
+            instead of a shuffled one. rules are the engine.Rules to play
+            by.
         '''
-        self._players = defaultdict(str)
-        # turn_order[0] is always current player's name
-        self.turn_order = []
-        self.max_players = 5
-
-        self.notes_up, self.notes_down = ('w', 'b')
-        self.notes = [self.notes_up for i in range(8)]
-        self.storms_up, self.storms_down = ('X', 'O')
-        self.storms = [self.storms_down for i in range(3)]
-        
-        # The deck is Cards with color and count distributions shown, shuffled.
-        self.deck = [Card(c, n) for c in Game.colors
-                     for n in self.card_distribution]
-        random.shuffle(self.deck)
+        self.state = engine.new_state((), rules)
+        self._new_deck(seed, deck)
+
+        # bumped whenever the table or the discards change. Renderers keep
+        # rendered text for them in render_cache until the version changes.
+        self.table_version = 0
+        self.discards_version = 0
+        self.render_cache = dict()
 
-        self._playing = False
-        self._game_over = False
+        # observers are called with a record tuple for each change to the
+        # game, e.g. ('play', nick, X), so the game can be rebuilt by
+        # replaying them (see journal.py). Random outcomes are recorded too.
+        self.observers = []
 
-        # table is a dict of lists of cards, indexed by color. 
-        self.table = defaultdict(list)
+        # orders to use instead of random ones, for replays. Each is a deck
+        # order for remove_player or a turn order for start_game.
+        self.forced_orders = deque()
 
-        self.discards = list()     # list of Cards
+        # (action, nick, State from before it) for the last few plays,
+        # discards and hints, for undo().
+        self.history = deque(maxlen=20)
+
+    #
+    # the parts of the state, read only but for turn_order and deck.
+    #
+    @property
+    def turn_order(self):
+        '''turn_order[0] is always current player's name.'''
+        return self.state.turn_order
+
+    @turn_order.setter
+    def turn_order(self, order):
+        self.state = self.state._replace(turn_order=tuple(order))
+
+    @property
+    def deck(self):
+        '''The cards left to draw, drawn from the start.'''
+        return self.state.remaining()
+
+    @deck.setter
+    def deck(self, cards):
+        self.state = self.state._replace(deck=tuple(cards), drawn=0)
+
+    @property
+    def table(self):
+        '''table is the top number played in each color group, indexed
+        like Game.colors. 0 means nothing played yet.'''
+        return self.state.table
+
+    @property
+    def score(self):
+        return self.state.score
+
+    @property
+    def discards(self):
+        return self.state.discards
+
+    @property
+    def notes(self):
+        '''tokens are counters of how many are flipped up.'''
+        return self.state.notes
+
+    @property
+    def storms(self):
+        return self.state.storms
+
+    @property
+    def max_players(self):
+        return self.state.rules.max_players
+
+    @property
+    def max_notes(self):
+        return self.state.rules.max_notes
+
+    @property
+    def max_storms(self):
+        return self.state.rules.max_storms
+
+    def hand(self, nick):
+        '''nick's hand, a tuple of Cards.'''
+        state = self.state
+        return state.hands[state.players.index(nick)]
 
     def in_game(self, nick):
         '''Return True is nick is in the game, False otherwise.'''
-        return nick in self._players.keys()
+        return nick in self.state.players
 
     def player_turn(self):
         '''REturn the nick of the player whose turn it is.'''
@@ -219,83 +266,24 @@ class Game(object):
         return (pub, list())
 
     def has_started(self):
-        return self._playing
+        return self.state.playing
 
     def game_over(self):
-        return self._game_over
+        return self.state.over
 
     def players(self):
         '''return a list of player ids in the game.'''
-        return self._players.keys()
+        return list(self.state.players)
 
     def discard_card(self, nick, X):
         '''Discard the card with ID X.'''
-        pub, priv = [], []
-        if not self._in_game_is_turn(nick, priv):
-            return (pub, priv)
-        
-        i = self._players[nick].card_index(X)
-        if i is None:
-            priv.append('You tried to discard card %s, oops.' % X)
-            priv.append('Card must be one of %s' %
-                        ', '.join(sorted([c.mark for x in self._players[nick].hand])))
-            return (pub, priv)
-            
-        c = self._players[nick].hand.pop(i)
-        self._players[nick].add_card(self.deck.pop(0))
-        pub.append('%s has discarded %s' % (nick, str(c)))
-        self.discards.append(c)
-        self._flip(self.notes, self.notes_down, self.notes_up)
-        self.turn_order.append(self.turn_order.pop(0))
-
-        pub += self.get_table()[0]
-
-        if self._is_game_over():
-            self._end_game(pub, priv)
-
-        return (pub, priv)    
+        return self._act('discard', nick, X)
 
     def play_card(self, nick, X):
-        '''Have player "nick" play card X from his/her hand. "X" is the 
+        '''Have player "nick" play card X from his/her hand. "X" is the
         card ID, e.g. A, B, C, ... N. The output is for group
         consumption.'''
-        pub, priv = [], []
-        if not self._in_game_is_turn(nick, priv):
-            return (pub, priv)
-
-        i = self._players[nick].card_index(X)
-        if i is None:
-            priv.append('You tried to play card %s, oops.' % X)
-            priv.append('Card must be one of %s' %
-                        ', '.join(sorted([c.mark for c in self._players[nick].hand])))
-            return (pub, priv)
-
-        c = self._players[nick].hand.pop(i)
-        if self._is_valid_play(c):
-            self.table[c.color].append(c)
-            pub.append('%s successfully added %s to the %s group.' %
-                       (nick, str(c), c.color))
-            if len(self.table[c.color]) == 5:
-                pub.append('Bonus for finishing %s group: one note token '
-                           'flipped up!' % c.color)
-                self._flip(self.notes, self.notes_down, self.notes_up)
-        else:
-            pub.append('%s guessed wrong with %s! One storm token '
-                          'flipped up!' % (nick, str(c)))
-            self._flip(self.storms, self.storms_down, self.storms_up)
-            self.discards.insert(0, c)
-
-        self._players[nick].add_card(self.deck.pop(0))
-        pub.append('%s drew a new card from the deck into his or her hand.' % nick)
-
-        self.turn_order.append(self.turn_order.pop(0))
-
-        pub += self.get_table()[0]
-
-        if self._is_game_over():
-            self._end_game(pub, priv)
-
-        return (pub, priv)
+        return self._act('play', nick, X)
 
     def hint_player(self, nick, player, hint):
         '''
@@ -303,330 +291,188 @@ class Game(object):
 
             nick: who is hinting
             player: the hintee
-            hint: can be one of: 
+            hint: can be one of:
                 string: a valid color
                 int: a valid number (int)
 
             hint_player validates input.
         '''
-        pub, priv = [], []
-        if not self._in_game_is_turn(nick, priv):
-            return (pub, priv)
-        
-        if nick == player:
-            priv.append('You really want to give a hint to yourself? Too bad '
-                        'no information leak here.')
-            return (pub, priv)
-
-        try:
-            hint = int(hint)
-        except ValueError:
-            try: 
-                hint = str(hint)
-            except ValueError:
-                priv.append('The hint command must be a string (color) or '
-                            'an integer (card number). Valid colors are %s '
-                            ' or the first charecter  of the word (all case '
-                            'insensitive.' % ', '.join(Game.colors))
-                return (pub, priv)
-
-        pub.append('Invalid hint command still %s\'s turn.' % self.turn_order[0])
-        if not player in self._players.keys():
-            priv.append('player %s is not in the game.' % player)
-            return (pub, priv)
-
-        if isinstance(hint, str):
-            hint = hint.lower()
-            if not hint in Game.colors or (
-                    len(hint) == 1 and not hint in [c[0] for c in Game.colors]):
-                priv.append('%s is not a valid color. Valid colors are %s.' %
-                        (hint, ', '.join(Game.colors)))
-                return (pub, priv)
-
-            # convert "?" into full color string.
-            if len(hint) == 1:
-                hint = [c for c in Game.colors if c[0] == hint][0]
-
-        elif isinstance(hint, int) and not 0 < hint < 6:
-            priv.append('numbers must be between 1 and 5 inclusive.')
-            return (pub, priv)
-
-        # valid hint command, do the action.
-        pub = []
-        if not self.notes_up in self.notes:
-            pub.append('Oh no! %s gave a hint when all notes were turned '
-                       'over. ' % nick)
-            pub.append('So, ya know, just disregard anything they said.')
-            return (pub, priv)
-
-        cards = self._get_cards(player, hint)
-
-        if not len(cards):
-            pub.append('Looks like %s is as deceiving as a low down dirty '
-                       '... deceiver. They gave a hint that does not '
-                       'match anything in %s\'s hand!' % (nick, player))
-            return (pub, priv)
-
-        plural = 's ' if len(cards) > 1 else ' '
-        is_are = 'are ' if len(cards) > 1 else 'is '
-        a = 'a ' if isinstance(hint, int) else ''
-        pub.append('%s has given %s a hint: your card%s%s %s%s%s' % (
-                   (nick, player, plural, ', '.join([c.mark for c in cards]), is_are, 
-                    a, str(hint))))
-        self.turn_order.append(self.turn_order.pop(0))
-        self._flip(self.notes, self.notes_up, self.notes_down)
-
-        pub += self.get_table()[0]
-        return (pub, priv)
+        return self._act('hint', nick, player, hint)
 
     def swap_cards(self, nick, A, B):
         '''In nick's hand, swap cards A and B.'''
-        pub, priv = [], []
-        if not nick in self._players.keys():
-            priv.append('You are not in the game.')
-            return (pub, priv)
-
-        pub, priv = self._players[nick].swap_cards(A, B)
-        tmp = self.get_hands(nick)
-        pub += tmp[0]
-        priv += tmp[1]
-        return (pub, priv)
+        return self._act('swap', nick, A, B)
 
     def sort_cards(self, nick):
         '''In nick's hand, sort cards to "original" A-E order.'''
-        pub, priv = [], []
-        if not nick in self._players.keys():
-            priv.append('You are not in game %s.')
-            return (pub, priv)
-
-        pub, priv = self._players[nick].sort_cards()
-        tmp = self.get_hands(nick)
-        pub += tmp[0]
-        priv += tmp[1]
-        return (pub, priv)
+        return self._act('sort', nick)
 
     def move_card(self, nick, A, i):
         '''In nick's hand, move card A to slot i.'''
+        return self._act('move', nick, A, i)
+
+    def snapshot(self):
+        '''Return the game's state, for restore().'''
+        return self.state
+
+    def restore(self, state):
+        '''Put the game back in state. The random number generator, observers
+        and undo history are left as they are.'''
+        self.state = state
+
+        # new versions, not the old ones: the render cache has text for
+        # those from after the snapshot.
+        self.table_version += 1
+        self.discards_version += 1
+
+    def branch(self):
+        '''Return a new Game in the same state as this one, to try out moves
+        on. It has its own random number generator (in the same state) and
+        no observers or undo history.'''
+        game = copy.copy(self)
+        # not copy.copy(), which seeds the new generator from os.urandom first.
+        game.rng = random.Random.__new__(random.Random)
+        game.rng.setstate(self.rng.getstate())
+        game.render_cache = dict()
+        game.observers = []
+        game.forced_orders = deque()
+        game.history = deque(maxlen=self.history.maxlen)
+        return game
+
+    def undo(self, nick):
+        '''Take back the last play, discard or hint. nick is who asked.'''
         pub, priv = [], []
-        if not nick in self._players.keys():
-            priv.append('You are not in game %s.')
+        if not self.history:
+            priv.append('There is nothing to undo.')
             return (pub, priv)
 
-        pub, priv = self._players[nick].move_card(A, i)
-        tmp = self.get_hands(nick)
-        pub += tmp[0]
-        priv += tmp[1]
+        action, player, state = self.history.pop()
+        self._notify('undo', nick)
+        self.restore(state)
+        pub.append('%s took back %s\'s %s. It is %s\'s turn again.' %
+                   (nick, player, action, self.turn_order[0]))
+        pub.append(self._table_state())
         return (pub, priv)
 
     def get_hands(self, nick):
         pub, priv = [], []
-        hands = []
-        for p in self._players.values():
-            if p.name != nick:
-                hands.append(p.get_hand())
-            else:
-                hands.append(p.get_hand(hidden=True))
-
-        priv.append('Current hands: %s' % ', '.join(hands))
+        priv.append(engine.hands_shown(self.state, nick))
         return pub, priv
 
     def get_discard_pile(self):
         pub, priv = [], []
-        if not len(self.discards):
-            priv.append('There are no cards in the discard pile.')
-            return pub, priv
-
-        priv.append('Discards: %s' % ', '.join([c.front() for c in self.discards]))
+        priv.append(DiscardPileShown(self.discards, self.discards_version,
+                                     self.render_cache))
         return pub, priv
 
     def get_table(self):
         pub, priv = [], []
-        # GTL - this could be done in a confusing list comprehension.
-        cardstrs = list()
-        for cardstack in self.table.values():
-            if len(cardstack):
-                cardstrs.append(''.join([c.front() for c in cardstack]))
-
-        if not cardstrs:
-            pub.append('Table: empty')
-        else:
-            pub.append('Table: %s' % ', '.join(cardstrs))
-
-        pub.append('Notes: %s, Storms: %s, %d cards remaining.' %
-                      (''.join(self.notes), ''.join(self.storms), 
-                       len(self.deck)))
-
-        if len(self.discards):
-            pub.append('Discard pile: %s. (size is %d)' %
-                          (', '.join([c.front() for c in self.discards]),
-                           len(self.discards)))
-
-        pub += self.turn()[0]
-
+        pub.append(self._table_state())
         return pub, priv
 
     def add_player(self, nick):
-        if self._playing:
-            return ([],['Game already started.'])
+        return self._act('join', nick)
 
-        pub, priv = [], []
-        if len(self._players) >= self.max_players:
-            priv.append('Max players already in game %s.')
-        else:
-            if nick in self._players.keys():
-                priv.append('You are already in the game.')
+    def remove_player(self, nick):
+        deck = None
+        p = self.state.index(nick)
+        if p is not None and self.state.hands[p]:
+            # back in the deck the cards lose their marks.
+            deck = list(self.deck) + [Card.get(c.color, c.number)
+                                      for c in self.state.hands[p]]
+            if self.forced_orders:
+                deck = list(self.forced_orders.popleft())
             else:
-                self._players[nick] = Player(nick)
-                pub.append('%s has joined the game.' % nick)
-                if len(self._players) > 1:
-                    pub.append('The game has enough players and can be started '
-                               'with the start command !start.')
+                self.rng.shuffle(deck)
+            deck = tuple(deck)
 
-        return (pub, priv)
+        output = self._act('leave', nick, deck)
+        if p is not None:
+            # states from before would bring the player back.
+            self.history.clear()
 
-    def remove_player(self, nick):
-        if not nick in self._players.keys():
-            return ([],['You are not in the game. You cannot be removed from a game you'
-                      ' are not in.'])
-        
+        return output
+
+    def get_seed(self):
+        return (['The seed of this game is %d.' % self.seed], [])
+
+    def set_seed(self, nick, seed):
+        '''Reshuffle the deck with the given seed. Only before the game starts.'''
         pub, priv = [], []
-        pub.append('Removing %s from the game.' % nick)
-        priv.append('You\'ve been removed from the game.')
-        if self._players[nick].hand:
-            pub.append('Putting %s\'s cards back in the deck and reshuffling.' % nick)
-            self.deck += self._players[nick].hand
-            random.shuffle(self.deck)
-
-        del self._players[nick]
-
-        if len(self._players) < 2:
-            pub.append('Stopping the game as there are fewer than two people left in '
-                       'the game.')
-            self._playing = False
-            self._game_over = True
-
-        elif len(self._players) < 4:
-            pub.append('Now that there are fewer than four players, everyone gets '
-                       'another card. Adding card to each player\s hand.')
-            for p in self._players.values():
-                p.add_card(self.deck.pop(0))
-
-        if self._playing:
-            if nick == self.turn_order[0]:
-                pub.append('It is now %s\'s turn.' % self.turn_order[1])
-       
-            del self.turn_order[0]
+        if self.state.playing or self.state.over:
+            priv.append('The seed can only be set before the game starts.')
+            return (pub, priv)
 
+        self._new_deck(seed)
+        self._notify('seed', self.seed, self.deck)
+        pub.append('%s set the seed to %d. The deck has been reshuffled.' % (nick, self.seed))
         return (pub, priv)
 
     def start_game(self, nick):
         '''Start an existing game. Will fail if called by someone not in the game
         or if there are not enough players.'''
-        pub, priv = [], []
-        if not nick in self._players.keys():
-            priv.append('You are not in the game.')
-            return (pub, priv)
-
-        if self._playing:
-            priv.append('The game has already begun.')
-            return (pub, priv)
-
-        if len(self._players) > 1:
-            self._playing = True
-            pub.append('The Hanabi game has started!')
-            self.turn_order = random.sample(self._players.keys(), len(self._players))
-        else:
-            priv.append('There are not enough players in the game, not starting.')
-            return (pub, priv)
-        
-        card_count = 5 if len(self._players) < 4 else 4
-        for player in self._players.values():
-            for c in self.deck[:card_count]:
-                player.add_card(c)
-
-            self.deck = self.deck[card_count:]
-
-        pub += self.get_table()[0]
+        order = None
+        players = self.state.players
+        if nick in players and not self.state.playing and len(players) > 1:
+            if self.forced_orders:
+                order = tuple(self.forced_orders.popleft())
+            else:
+                order = tuple(self.rng.sample(players, len(players)))
 
-        return (pub, priv)
+        return self._act('start', nick, order)
 
     #
     # "private" methods below
     #
-    def _get_cards(self, player, hint):
-        '''Figure how which cards the hint is referring to and return the list
-        if indexes that match the hint. Hint can be an int (1-5) or a string (color).'''
-        return [c for c in self._players[player].hand if c.number == hint or c.color == hint]
-
-    def _flip(self, tokens, A, B):
-        '''flip the first non A char token to the B token char.'''
-        for i in xrange(len(tokens)):
-            if tokens[i] == A:
-                tokens[i] = B
-                return
-
-    def _is_game_over(self):
-        '''Return True if ay end game condition is true.'''
-        if not len(self.deck):
-            return True
-        elif 25 == sum([len(cs) for cs in self.table.values()]):
-            return True
-        elif not self.storms_down in self.storms:
-            return True
-        else:
-            return False
-
-    def _end_game(self, pub, priv):
-        score = sum([len(cs) for cs in self.table.values()])
-        self._game_over = True
-        self._playing = False
-        pub += ['-------------------------']
-        pub.append('The game is over. Final score is %d.' % score)
-        if 0 <= score <= 5:
-            pub.append('Oh dear! The crowd booed.')
-        elif 6 <= score <= 10:
-            pub.append('Poor! Hardly any applause.')
-        elif 11 <= score <= 15:
-            pub.append('OK! The audience has seen better.')
-        elif 16 <= score <= 20:
-            pub.append('Good! The audience is pleased!')
-        elif 21 <= score <= 24:
-            pub.append('Very good! The audience is enthusiastic!')
-        elif score == 25:
-            pub.append('Congratulationss! It\'s a perfect game! 25 points!')
-        else:
-            pub.append('Hmm. score should only be in range 0 to 25. Somthing is amiss. '
-                       ' Might as well play again...')
+    def _act(self, *action):
+        '''Apply action to the state. If it changed the game, tell the
+        observers and keep the old state for undo().'''
+        before = self.state
+        self.state, (pub, priv) = engine.apply(before, action)
+        if self.state is not before:
+            if action[0] in ('play', 'discard', 'hint'):
+                self.history.append((action[0], action[1], before))
+            self._notify(*action)
+            if self.state.table is not before.table:
+                self.table_version += 1
+            if self.state.discards is not before.discards:
+                self.discards_version += 1
+
+        for e in pub:
+            if isinstance(e, TableState):
+                self._versioned(e)
 
-        pub += ['-------------------------']
+        return (pub, priv)
 
-    def _is_valid_play(self, c):
-        if not len(self.table[c.color]):
-            if c.number == 1:
-                return True
-            else:
-                return False
-        else:
-            # if card is one greater than last number in color group
-            if self.table[c.color][-1].number + 1 == c.number:
-                return True
-            else:
-                return False
-
-    def _in_game_is_turn(self, nick, priv):
-        '''Return True if the player is in the game and is his/her turn
-        else return False.'''
-        if not nick in self._players.keys():
-            priv.append('You are not in game.')
-            return False
-        elif not self._playing:
-            priv.append('The game has not yet started')
-            return False
-        elif self.turn_order[0] != nick:
-            priv.append('It is not your turn. It is %s\'s turn.' % self.turn_order[0])
-            return False
-
-        return True
+    def _new_deck(self, seed=None, deck=None):
+        '''Set up the random number generator from seed and the deck.'''
+        # pick a seed ourselves so any game can be replayed.
+        self.seed = seed if seed is not None else random.randint(0, 2**31 - 1)
+        self.rng = random.Random(self.seed)
+
+        # The deck is Cards with color and count distributions shown, shuffled.
+        # Cards are drawn from the left.
+        if deck is None:
+            deck = [Card.get(c, n) for c in Game.colors
+                    for n in self.card_distribution]
+            self.rng.shuffle(deck)
+
+        self.deck = deck
+
+    def _notify(self, *record):
+        for observer in self.observers:
+            observer(record)
+
+    def _versioned(self, e):
+        '''fill in the versions and render cache of TableState e.'''
+        e.table_version = self.table_version
+        e.discards_version = self.discards_version
+        e.cache = self.render_cache
+        return e
+
+    def _table_state(self):
+        '''Return a TableState event for the current table.'''
+        return self._versioned(engine.table_state(self.state))
 
 if __name__ == "__main__":
     import doctest
@@ -2,39 +2,57 @@
     hanabot.py implements an IRC bot that plays Hanabi.
 
     It uses the hanabi.Game module Hanabi engine to 
-    get strings to display on the channel and private
-    messages to the player. 
+    get strings and events to display on the channel and private
+    messages to the player. Events are turned into text by a
+    renderer.Renderer just before they are sent.
 
     It primarly is responsible for connecting to the 
     channel, parsing incoming commands, and writing
     reponses from the game engine.
 '''    
 import logging
-import time
 import string
 import random
 import sys
 import os
+import time
 import traceback
+from abc import ABCMeta, abstractmethod
 from collections import defaultdict
 
 from hanabi import Game
+from bot_commands import ArgError
+import bot_commands
+from renderer import Renderer
+from outbound import coalesce, budget, SendQueue, HIGH, NORMAL
+from sharding import LocalGames, GameShards
+from metrics import Metrics
+from lifecycle import Lifecycle
+from profiling import CommandProfiler
+from text_markup import irc_markup
 from irc.bot import SingleServerIRCBot
 from irc.client import VERSION as irc_client_version
 
 log = logging.getLogger(__name__)
 
 
-class Hanabot(SingleServerIRCBot):
-    def __init__(self, server, channel, nick='hanabot', nick_pass=None, port=6667, topic=None):
-        log.debug('new bot started at %s:%d@#%s as %s', server, port,
-                  channel, nick)
-        SingleServerIRCBot.__init__(
-            self,
-            server_list=[(server, port)],
-            nickname=nick,
-            realname='Mumford J. Hanabot')
+class HanabotBase(object):
+    '''
+    The Hanabi part of the bot: the IRC callbacks (on_*), command parsing
+    and the handle_* commands. It does not care how it talks to the IRC
+    server; subclasses provide self.connection, self.channels, die(),
+    _call_later() and _watch(). Hanabot runs it on irc.bot.SingleServerIRCBot and
+    async_core.AsyncHanabot on a non-blocking asyncore loop.
+    '''
+    __metaclass__ = ABCMeta
+
+    # seconds between looks for idle games to retire.
+    sweep_interval = 60
 
+    def __init__(self, channel, nick='hanabot', nick_pass=None, topic=None,
+                 send_rate=1.0, send_burst=5, game_workers=0, journal_dir=None,
+                 metrics_port=0, metrics_interval=0, profile_dir=None,
+                 profile_commands=0, archive_dir=None, idle_timeout=0, max_games=0):
         self.nick_pass = nick_pass
         self.nick_name = nick  
         self.topic = topic
@@ -42,34 +60,154 @@ class Hanabot(SingleServerIRCBot):
         # force channel to start with #
         self.initial_channel = channel if channel[0] == '#' else '#%s' % channel
 
-        # valid bot commands
-        self.command_dict = {
-            'Game Management': ['new', 'delete', 'join', 'start', 'leave', 'part'],
-            'Hand Management': ['move', 'swap', 'sort'],
-            'Game Action': ['play', 'hint', 'discard'],
-            'Information': ['help', 'rules', 'turn', 'turns', 'game',
-                            'games', 'hands', 'table', 'discardpile']
-        }
-        
-        self.commands = list()
-        for cmds in self.command_dict.values():
-            self.commands += cmds
-
-        self.commands_admin = ['die']
-
-        # these commands can execute without an active game.
+        # valid bot commands: name or alias --> (Command, bound handle_* method).
+        # Commands that do not need_game can execute without an active game,
         # otherwise the command handlers can assume an active game.
-        self.no_game_commands = ['new', 'help', 'rules', 'game', 'games', 'part']
+        self.commands = dict(
+            (name, (cmd, getattr(self, 'handle_%s' % cmd.name)))
+            for name, cmd in bot_commands.table.iteritems())
 
         # games is a dict indexed by channel name, value is the Game object.
-        self.games = dict()
+        # With game_workers the games live in that many worker processes.
+        # With journal_dir the games are journaled there and the games in
+        # progress when the bot last stopped are brought back. With
+        # archive_dir the games are written there when they are retired.
+        if game_workers:
+            self.games = GameShards(game_workers, self._watch, journal_dir, archive_dir)
+        else:
+            self.games = LocalGames(journal_dir, archive_dir)
+
+        # games are retired when they end, after idle_timeout seconds
+        # without a command, and to make room when max_games are going.
+        self.lifecycle = Lifecycle(idle_timeout, max_games)
+
+        # nick --> channel of the game the nick is in, to enforce one game
+        # per nick without looking at every game. Kept in sync by join,
+        # leave, delete and game over.
+        self.player_channels = dict()
+
+        for chan in self.games.restore():
+            log.info('Restored game in %s from the journal.', chan)
+            self.lifecycle.touch(chan)
+            for nick in self.games[chan].players():
+                self.player_channels[nick] = chan
+
+        # turns game output into IRC text.
+        self.renderer = Renderer(irc_markup())
+
+        # all NOTICEs go through the queue to stay under flood limits.
+        self.sendq = SendQueue(self._send_notice, rate=send_rate, burst=send_burst,
+                               call_later=self._call_later)
+
+        # Handler times are the time to run the handle_* method; with
+        # game_workers that does not include the game's work.
+        self.metrics = Metrics()
+        self._received = self.metrics.counter(
+            'hanabot_messages_received_total', 'Messages seen in channels and privately.')
+        self._sent = self.metrics.counter(
+            'hanabot_messages_sent_total', 'NOTICEs sent.')
+        self._commands_run = self.metrics.counter(
+            'hanabot_commands_total', 'Commands run.', ('command', 'channel'))
+        self._command_errors = self.metrics.counter(
+            'hanabot_command_errors_total', 'Commands that raised an exception.')
+        self._command_time = self.metrics.histogram(
+            'hanabot_command_seconds', 'Time spent in command handlers.',
+            ('command', 'channel'))
+        self._parse_time = self.metrics.histogram(
+            'hanabot_parse_seconds', 'Time spent in parse_commands.')
+        self.metrics.gauge('hanabot_send_queue_depth', 'Messages waiting to be sent.',
+                           lambda: len(self.sendq))
+        self._retired = self.metrics.counter(
+            'hanabot_games_retired_total', 'Games retired.', ('reason',))
+        self.metrics.gauge('hanabot_games', 'Games being played or waiting for players.',
+                           lambda: len(self.games))
+
+        if metrics_port:
+            self.metrics.serve(metrics_port)
+
+        self.metrics_interval = metrics_interval
+        self._last_summary = (time.time(), 0, 0)
+        self._last_commands = dict()    # command --> (count, sum) at the last summary
+        if metrics_interval:
+            self._call_later(metrics_interval, self._log_metrics)
+
+        if idle_timeout:
+            self._call_later(min(self.sweep_interval, idle_timeout), self._sweep_games)
+
+        # ops turn this on with !profile; with profile_commands it profiles
+        # that many commands from startup. Off, it costs one attribute check
+        # per command.
+        self.profiler = CommandProfiler(profile_dir or '.')
+        if profile_commands:
+            self.profiler.start(commands=profile_commands)
+
+    @abstractmethod
+    def _call_later(self, delay, func):
+        '''Run func in the IRC event loop after delay seconds.'''
+
+    @abstractmethod
+    def _watch(self, fileobj, func):
+        '''Run func in the IRC event loop each time fileobj (anything with a
+        fileno()) has data to read. With func None stop watching it.'''
+
+    def _send_notice(self, target, msg):
+        self._sent.inc()
+        self.connection.notice(target, msg)
+
+    def _log_metrics(self):
+        '''Log a summary of the metrics since the last one, and schedule the next.'''
+        for line in self.metrics_summary():
+            log.info('%s', line)
+
+        self._call_later(self.metrics_interval, self._log_metrics)
+
+    def _sweep_games(self):
+        '''Retire the idle games, and schedule the next sweep.'''
+        for chan in self.lifecycle.idle():
+            if chan in self.games:
+                self._to_chan_name(chan, 'The game in %s was removed after %d minutes '
+                                   'without a move.' % (chan, self.lifecycle.idle_timeout / 60))
+                self._retire(chan, 'idle')
+            else:
+                self.lifecycle.forget(chan)
+
+        self._call_later(min(self.sweep_interval, self.lifecycle.idle_timeout),
+                         self._sweep_games)
+
+    def metrics_summary(self):
+        '''Return lines with message rates and the per command counts and
+        mean latencies since the last summary. The max latencies are since
+        the bot started, as the histogram keeps only the max of all.'''
+        now, received, sent = time.time(), self._received.total(), self._sent.total()
+        then, received0, sent0 = self._last_summary
+        self._last_summary = (now, received, sent)
+        elapsed = max(now - then, 1e-9)
+
+        lines = ['metrics: %.2f msgs/s in, %.2f msgs/s out, %d queued, %d errors' %
+                 ((received - received0) / elapsed, (sent - sent0) / elapsed,
+                  len(self.sendq), self._command_errors.total())]
+
+        per_command = defaultdict(lambda: [0, 0.0, 0.0])
+        for (command, channel) in self._command_time.values.keys():
+            count, total, worst = self._command_time.stats((command, channel))
+            c = per_command[command]
+            c[0] += count
+            c[1] += total
+            c[2] = max(c[2], worst)
+
+        for command, (count, total, worst) in sorted(per_command.iteritems()):
+            count0, total0 = self._last_commands.get(command, (0, 0.0))
+            self._last_commands[command] = (count, total)
+            if count == count0:
+                continue
+            lines.append('metrics: !%s: %d run, %.2f ms mean, %.2f ms max since start' %
+                         (command, count - count0, 1000 * (total - total0) / (count - count0),
+                          1000 * worst))
+
+        return lines
 
     # lib IRC callbacks
     #############################################################
-    def get_version(self):
-        '''raises exception in lib irc, so overload in the bot.'''
-        return "Python irc.bot 8.0"
-
     def on_nicknameinuse(self, conn, event):
         conn.nick(conn.get_nickname() + "_")
 
@@ -79,11 +217,19 @@ class Hanabot(SingleServerIRCBot):
             self.connection.privmsg('NickServ', msg)
 
         conn.join(self.initial_channel)
+        # and the channels of games restored from the journal.
+        for chan in self.games.keys():
+            if chan != self.initial_channel:
+                conn.join(chan)
 
     def on_kick(self, conn, event):
-        time.sleep(1)
-        conn.join(self.channel)
-        conn.notice(self.channel, 'Why I outta....')
+        # rejoin a moment later without blocking the other channels.
+        chan = event.target
+        def rejoin():
+            conn.join(chan)
+            self._to_chan_name(chan, 'Why I outta....')
+
+        self._call_later(1, rejoin)
 
     def on_join(self, conn, event):
         log.debug('got on_join: %s %s', conn, event)
@@ -95,6 +241,7 @@ class Hanabot(SingleServerIRCBot):
         self.on_pubmsg(event, event)
 
     def on_pubmsg(self, conn, event):
+        self._received.inc()
         try:
             log.debug('got pubmsg. %s -> %s', event.source, event.arguments)
             # messaged commands
@@ -113,6 +260,13 @@ class Hanabot(SingleServerIRCBot):
             log.critical('Got exception when handling message: %s' % e)
 
     def parse_commands(self, event, cmds):
+        if self.profiler.active:
+            self.profiler.run(self._parse_commands, event, cmds)
+        else:
+            self._parse_commands(event, cmds)
+
+    def _parse_commands(self, event, cmds):
+        start = time.time()
         try:
             log.debug('got command. %s --> %s : %s',
                       event.source.nick, event.target, event.arguments)
@@ -124,35 +278,48 @@ class Hanabot(SingleServerIRCBot):
             # space separated words - need more IRC lib experience or docs.
             cmds = [str(c) for c in cmds[0].split()]
 
-            # op only commands - return after executing.
-            if cmds[0] in self.commands_admin:
-                log.debug('running admin cmd %s', cmds[0])
-                for chname, chobj in self.channels.items():
-                    if nick in chobj.opers():
-                        if cmds[0] == 'die':
-                            self.die('Seppuku Successful')
+            cmd, method = self.commands.get(cmds[0], (None, None))
 
-                        return
+            # op only commands are unknown to everyone else. Those on a
+            # channel's game need an op of that channel, so not a private
+            # message.
+            if cmd and cmd.admin:
+                if cmd.needs_game:
+                    chans = [self.channels[event.target]] if event.target in self.channels else []
+                else:
+                    chans = self.channels.values()
+                if not any(nick in chobj.opers() for chobj in chans):
+                    cmd = None
 
             # valid user command check
-            if not cmds[0] in self.commands:
+            if not cmd:
                 self._to_nick(event, 'My dearest brother Willis, I do not '
                               'understand this "%s" of which you speak.' %
                               ' '.join(cmds))
                 return
-            # call the appropriate handle_* function.
-            method = getattr(self, 'handle_%s' % cmds[0], None)
-            if method:
-                if not cmds[0] in self.no_game_commands:
-                    if not event.target in self.games:
-                        msg = 'There is no active game in %s! Start one with !new.' % event.target
-                        self._to_chan(event, msg)
-                        return
-                
-                # invoke it!
-                method(cmds[1:], event)
+
+            if cmd.needs_game and not event.target in self.games:
+                msg = 'There is no active game in %s! Start one with !new.' % event.target
+                self._to_chan(event, msg)
+                return
+
+            try:
+                args = cmd.parse(cmds[1:])
+            except ArgError, e:
+                # show error message and help to nick.
+                self._to_nick(event, str(e))
+                self.handle_help([cmd.name], event)
+                return
+
+            # invoke it!
+            labels = (cmd.name, event.target)
+            t = time.time()
+            method(args, event)
+            self._command_time.observe(labels, time.time() - t)
+            self._commands_run.inc(labels)
 
         except Exception, e:
+            self._command_errors.inc()
             exc_type, exc_value, exc_tb = sys.exc_info()
             filename, line_num, func_name, text = traceback.extract_tb(exc_tb)[-1]
             filename = os.path.basename(filename)
@@ -165,16 +332,61 @@ class Hanabot(SingleServerIRCBot):
                 log.critical('%s', err)
                 self._to_chan(event, err)
 
+        finally:
+            self._parse_time.observe((), time.time() - start)
+
+    def _game_call(self, event, method, args=(), done=None, priority=NORMAL):
+        '''Call Game.method(*args) on the game in event.target. Its (pub,
+        priv) output is passed to done(output) if given, else displayed with
+        priority. The call may complete after this returns (see sharding).'''
+        if done is None:
+            done = lambda output: self._display(output, event, priority)
+
+        self.lifecycle.touch(event.target)
+        self.games.submit(event.target, method, args, done)
+
+    def _check_game_over(self, channel):
+        '''retire the game in channel if it is over.'''
+        game = self.games.get(channel)
+        if game is not None and game.game_over():
+            self._retire(channel, 'over')
+
+    def _retire(self, channel, reason):
+        '''drop the game in channel, archiving it if there is an archive.'''
+        self._untrack_players(channel)
+        self.lifecycle.forget(channel)
+        self.games.retire(channel, reason)
+        self._retired.inc((reason,))
+
+    def _untrack_players(self, channel):
+        '''remove the players of the game in channel from player_channels.'''
+        game = self.games.get(channel)
+        if game is None:
+            return
+
+        for nick in game.players():
+            if self.player_channels.get(nick) == channel:
+                del self.player_channels[nick]
+
     # some sugar for sending msgs
-    def _display(self, output, event):
+    def _display(self, output, event, priority=NORMAL):
         '''Output is the list of (public, private) msgs generated
         byt the Game engine. nick is the user to priv message.
-        output == (string list, string list).'''
-        for l in output[0]:
-            self.connection.notice(event.target, l)
-
-        for l in output[1]:
-            self.connection.notice(event.source.nick, l)
+        output == (string/event list, string/event list).
+        Lines for the same target are packed into as few NOTICEs as fit
+        and queued with the given priority (outbound.HIGH or NORMAL).'''
+        for target, msgs in [(event.target, output[0]),
+                             (event.source.nick, output[1])]:
+            if not msgs:
+                continue
+
+            lines = self.renderer.render_all(msgs)
+            for l in coalesce(lines, budget(target)):
+                self.sendq.put(target, l, priority)
+
+    def _to_chan_name(self, chan, msg):
+        '''send msg to chan when there is no event to reply to.'''
+        self.sendq.put(chan, msg)
 
     # some sugar for sending msgs
     def _to_chan(self, event, msgs):
@@ -223,32 +435,43 @@ class Hanabot(SingleServerIRCBot):
                 'The game continues until the deck is empty, all the cards '
                 'are correcly displayed on the table, or the three storm '
                 'tokens have been flipped.')
-            for text, cmds in self.command_dict.iteritems():
+            groups = list()
+            for cmd in bot_commands.commands:
+                if cmd.admin:
+                    continue
+                if not groups or groups[-1][0] != cmd.group:
+                    groups.append((cmd.group, []))
+                groups[-1][1].append(cmd.name)
+
+            for text, cmds in groups:
                 usage.append('%s commands: %s' % (text, ', '.join(cmds)))
 
             usage.append('Doing "!help [command]" will give details on that command.')
             self._to_nick(event, usage)
             return
 
-        if args[0] in Hanabot._command_usage:
-            self._to_nick(event, Hanabot._command_usage[args[0]])
+        topic = args[0]
+        if topic in bot_commands.table:
+            cmd = bot_commands.table[topic]
+            topic = cmd.name
+            if cmd.aliases:
+                self._to_nick(event, 'Short form%s of !%s: %s' % (
+                    's' if len(cmd.aliases) > 1 else '', cmd.name,
+                    ', '.join('!%s' % a for a in cmd.aliases)))
+
+        if topic in HanabotBase._command_usage:
+            self._to_nick(event, HanabotBase._command_usage[topic])
         else:
             self._to_nick(event, 'No help for topic %s' % args[0])
 
     def handle_hint(self, args, event):
         log.debug('got hint event. args: %s', args)
-        if not self._check_args(args, 2, [str, str], event, 'hint'):
-            return 
-
         # now tell the engine about the !hint
         nick = event.source.nick
-        self._display(self.games[event.target].hint_player(nick, player=args[0], hint=args[1]), event)
+        self._game_call(event, 'hint_player', (nick, args[0], args[1]), priority=HIGH)
 
     def handle_rules(self, args, event):
         log.debug('got rules event. args: %s', args)
-        if not self._check_args(args, 0, [], event, 'rules'):
-            return 
-
         self._to_nick(event, 'Go here for english rules: '
                       'http://boardgamegeek.com/filepage/59655/hanabi-'
                       'english-translation')
@@ -281,79 +504,60 @@ class Hanabot(SingleServerIRCBot):
 
     def handle_game(self, args, event):
         log.debug('got game event. args: %s', args)
-        if not self._check_args(args, 0, [], event, 'game'):
-            return 
-
         self._display(self._game_state(event.target), event)
 
     def handle_games(self, args, event):
         log.debug('got games event. args: %s', args)
-        if not self._check_args(args, 0, [], event, 'games'):
-            return 
-
         # iterate over all channels the bot is in.
         for chan in self.channels.keys():
             self._display(self._game_state(str(chan)), event)
 
     def handle_turn(self, args, event):
-        if not self._check_args(args, 0, [], event, 'turn'):
-            return 
-
-        self._display(self.games[event.target].turn(), event)
+        self._game_call(event, 'turn')
 
     def handle_turns(self, args, event):
-        if not self._check_args(args, 0, [], event, 'turn'):
-            return 
-
-        self._display(self.games[event.target].turns(), event)
+        self._game_call(event, 'turns')
 
     def handle_table(self, args, event):
         log.debug('got table command.')
-        if not self._check_args(args, 0, [], event, 'table'):
-            return 
-
-        self._display(self.games[event.target].get_table(), event)
+        self._game_call(event, 'get_table')
 
     def handle_discard(self, args, event):
         log.debug('got discard event. args: %s', args)
-        if not self._check_args(args, 1, [str], event, 'discard'):
-            return 
-
         # discard the card and show the repsonse
         nick = event.source.nick
-        self._display(self.games[event.target].discard_card(nick, args[0]), event)
+        def done(output):
+            self._display(output, event, HIGH)
+            # discarding a card can trigger end game.
+            self._check_game_over(event.target)
 
-        # discarding a card can trigger end game.
-        if self.games[event.target].game_over():
-            self.games[event.target] = None 
+        self._game_call(event, 'discard_card', (nick, args[0]), done)
 
     def handle_play(self, args, event):
         log.debug('got play event. args: %s', args)
         # play the card and show the repsonse
-        if not self._check_args(args, 1, [str], event, 'play'):
-            return 
-
         nick = event.source.nick
-        self._display(self.games[event.target].play_card(nick, args[0]), event)
+        def turn_done(output):
+            # tell the next player it is their turn.
+            # take what would be public and make it privmsg
+            pub, priv = output
+            if len(pub):
+                self._display(([], pub), event, HIGH)
 
-        # tell the next player it is their turn.
-        # take what would be public and make it privmsg
-        pub, priv = self.games[event.target].turn()
-        if len(pub):
-            self._display(([], pub), event)
+            # playing a card can trigger end game.
+            self._check_game_over(event.target)
 
-        # playing a card can trigger end game.
-        if self.games[event.target].game_over():
-            self.games[event.target] = None 
+        def play_done(output):
+            self._display(output, event, HIGH)
+            self._game_call(event, 'turn', (), turn_done)
+
+        self._game_call(event, 'play_card', (nick, args[0]), play_done)
     
     def handle_hands(self, args, event):
         ''' Show hands of current game.  '''
         log.debug('got hands event. args: %s', args)
-        if not self._check_args(args, 0, [], event, 'hands'):
-            return 
-
         nick = event.source.nick
-        self._display(self.games[event.target].get_hands(nick), event)
+        self._game_call(event, 'get_hands', (nick,))
 
     def handle_xyzzy(self, args, event):
         self._to_nick(event, 'Nothing happens.')
@@ -361,7 +565,6 @@ class Hanabot(SingleServerIRCBot):
     def handle_new(self, args, event):
         ''' Create a new game. '''
         log.debug('got new game event')
-
         if len(args) == 1:
             chan = '#%s' % args[0]
             self.connection.join(chan)
@@ -369,92 +572,106 @@ class Hanabot(SingleServerIRCBot):
                           'to begin game there.' % (chan, chan))
             return
 
-        if not self._check_args(args, 0, [], event, 'new'):
-            return 
-
         nick = event.source.nick
         if event.target in self.games:
             self._to_nick(event, 'There is already an active game in the channel.')
             return 
         
+        if self.lifecycle.full(self.games):
+            # make room by retiring the oldest game still waiting for players.
+            victim = self.lifecycle.victim(self.games)
+            if victim is None:
+                self._to_nick(event, 'There are already %d games going, the most I '
+                              'keep. Try again later.' % len(self.games))
+                return
+
+            self._to_chan_name(victim, 'The game in %s was removed to make room for '
+                               'a new game.' % victim)
+            self._retire(victim, 'cap')
+
         log.info('Starting new game.')
         self.games[event.target] = Game()
+        self.lifecycle.touch(event.target)
         pub = ['New game started by %s. Accepting joins.' % nick]
         self._display((pub, []), event)
 
     def handle_join(self, args, event):
         '''join a game, if one is active.'''
         log.debug('got join event')
-        if not self._check_args(args, 0, [], event, 'join'):
-            return 
-
         nick = event.source.nick
         # enforce one game per player. Will not be needed if force users to 
         # send commands from the channel, so I can key the game to the channel.
-        for chan, g in self.games.iteritems():
-            if nick in g.players():
-                msg = 'You are already in a game in %s. One game per nick please.' % chan
-                self._to_nick(event, msg)
-                return
+        if nick in self.player_channels:
+            msg = ('You are already in a game in %s. One game per nick please.' %
+                   self.player_channels[nick])
+            self._to_nick(event, msg)
+            return
 
-        self._display(self.games[event.target].add_player(nick), event)
+        # hold the nick's place until the game says whether it joined.
+        chan = event.target
+        self.player_channels[nick] = chan
+        def done(output):
+            self._display(output, event)
+            game = self.games.get(chan)
+            if (game is None or not game.in_game(nick)) and \
+                    self.player_channels.get(nick) == chan:
+                del self.player_channels[nick]
+
+        try:
+            self._game_call(event, 'add_player', (nick,), done)
+        except:
+            del self.player_channels[nick]
+            raise
 
     # GTL TODO: make sure this is called when the players leaves the channel?
     def handle_leave(self, args, event):
         '''leave an active game.'''
         log.debug('got leave event. args: %s', args)
-        if not self._check_args(args, 0, [], event, 'leave'):
-            return 
-
         nick = event.source.nick
         # remove the player and display the result
-        self._display(self.games[event.target].remove_player(nick), event)
+        def done(output):
+            self._display(output, event)
+            if self.player_channels.get(nick) == event.target:
+                del self.player_channels[nick]
 
-        # removing a player can trigger end game (if there is now only one player).
-        if self.games[event.target].game_over():
-            self.games[event.target] = None
+            # removing a player can trigger end game (if there is now only one player).
+            self._check_game_over(event.target)
+
+        self._game_call(event, 'remove_player', (nick,), done)
 
     def handle_sort(self, args, event):
         '''arg format: []'''
         log.debug('got handle_sort event. args: %s', args)
-        if not self._check_args(args, 0, [], event, 'sort'):
-            return 
-
         nick = event.source.nick
-        self._display(self.games[event.target].sort_cards(nick), event)
+        self._game_call(event, 'sort_cards', (nick,))
 
     def handle_move(self, args, event):
         '''arg format: cardX slotN.'''
         log.debug('got handle_move event. args: %s', args)
-        if not self._check_args(args, 2, [str, int], event, 'move'):
-            return 
-
         nick = event.source.nick
-        self._display(self.games[event.target].move_card(nick, args[0], args[1]), event)
+        self._game_call(event, 'move_card', (nick, args[0], args[1]))
 
     def handle_swap(self, args, event):
         '''arg format: cardA cardB.'''
         log.debug('got handle_swap event. args: %s', args)
-        if not self._check_args(args, 2, [str, str], event, 'swap'):
-            return 
-
         # do the swap
         nick = event.source.nick
-        self._display(self.games[event.target].swap_cards(nick, args[0], args[1]), event)
+        self._game_call(event, 'swap_cards', (nick, args[0], args[1]))
 
     def handle_start(self, args, event):
         log.debug('got start event')
-        if not self._check_args(args, 0, [], event, 'start'):
-            return 
-
         nick = event.source.nick
-        self._display(self.games[event.target].start_game(nick), event)
+        self._game_call(event, 'start_game', (nick,), priority=HIGH)
+
+    def handle_seed(self, args, event):
+        log.debug('got seed event. args: %s', args)
+        if not args:
+            self._game_call(event, 'get_seed')
+        else:
+            self._game_call(event, 'set_seed', (event.source.nick, args[0]))
 
     def handle_part(self, args, event):
         log.debug('got part event')
-        if not self._check_args(args, 0, [], event, 'part'):
-            return 
-
         if event.target != self.initial_channel:
             self._to_chan(event, 'Hanabot leaving channel.')
             self.connection.part(event.target)
@@ -463,42 +680,56 @@ class Hanabot(SingleServerIRCBot):
 
     def handle_delete(self, args, event):
         log.debug('got delete event')
-        if not self._check_args(args, 0, [], event, 'delete'):
-            return 
-
+        self._untrack_players(event.target)
+        self.lifecycle.forget(event.target)
         del self.games[event.target]
         self._to_chan(event, '%s deleted game.' % event.source.nick)
 
-    def handle_discardpile(self, args, event):
-        log.debug('got discardpile event')
-        if not self._check_args(args, 0, [], event, 'discardpile'):
-            return 
+    def handle_undo(self, args, event):
+        log.debug('got undo event')
+        self._game_call(event, 'undo', (event.source.nick,), priority=HIGH)
 
+    def handle_profile(self, args, event):
+        log.debug('got profile event. args: %s', args)
         nick = event.source.nick
-        self._display(self.games[event.target].get_discard_pile(), event)
-
-    def _check_args(self, args, num, types, event, cmd):
-        '''Check the given arguments for correct types and number. Show error
-        message and help to nick on error and return False. Else return True. 
-        As a side effect, set the types correctly. e.g. "1.2" is set to 1.2.'''
-        if len(args) != num:
-            self._to_nick(event, 'Wrong number of arguments to %s' % cmd)
-            self.handle_help([cmd], event)
-            return False
-        elif len(types) != num:
-            # This is an internal callee error, so no message. 
-            log.info('internal error in _check_args: wrong number of types passed in.')
-            return False
-
-        for i in xrange(len(args)):
-            try:
-                args[i] = types[i](args[i])
-            except ValueError:
-                self._to_nick(event, 'Wrong type for argument %s in command %s.' % (args[i], cmd))
-                self.handle_help([cmd], event)
-                return False
+        kind, amount = args[0] if args else ('commands', 100)
+        if kind == 'stop':
+            if not self.profiler.active:
+                self._to_nick(event, 'Not profiling.')
+            self.profiler.stop()
+            return
 
-        return True
+        if args[1:] and args[1] != 'stacks':
+            self._to_nick(event, 'Unknown profile option %s.' % args[1])
+            return
+
+        def done(paths):
+            self.sendq.put(nick, 'Profile written to %s.' % (
+                ', '.join(paths) or 'nowhere (no commands ran)'))
+
+        started = self.profiler.start(stacks=bool(args[1:]), done=done, **{kind: amount})
+        if not started:
+            self._to_nick(event, 'Already profiling. Use !profile stop to stop.')
+            return
+
+        if kind == 'seconds':
+            self._call_later(amount, self.profiler.expire)
+
+        self._to_nick(event, 'Profiling the next %s %s.' % (
+            amount if kind == 'commands' else '%g' % amount, kind))
+
+    def handle_die(self, args, event):
+        log.debug('got die event')
+        # let the journals get to disk.
+        self.games.close()
+        self.metrics.close()
+        self.profiler.stop()
+        self.die('Seppuku Successful')
+
+    def handle_discardpile(self, args, event):
+        log.debug('got discardpile event')
+        nick = event.source.nick
+        self._game_call(event, 'get_discard_pile')
 
     ####### static class data 
     _command_usage = {
@@ -507,6 +738,7 @@ class Hanabot(SingleServerIRCBot):
         'join': '!join - join a game. If not game in channel, use !new to create one.', 
         'start': '!start - start a game. The game must have at least two players.',
         'leave': '!leave - leave a game. This is bad form.', 
+        'seed': '!seed [number] - show the seed of the game, or set it before the game starts. Games with the same seed and players are dealt the same cards.',
         'part': '!part - tell Hanabot to part the channel. Note: Hanbot will not leave its home channel.', 
         'move': '!move card - move a card in your hand and slide all other cards "right". "card" must be one of A, B, C, D, or E. "index" is where to put the card, counting from the left and must be an integer between 1 and max hand size.',
         'swap': '!swap card card - swap cards in your hand. Card arguments must be one of A, B, C, D, or E.',
@@ -523,5 +755,70 @@ class Hanabot(SingleServerIRCBot):
         'hands': '!hands - show hands of players. Your own hand will be shown with the "backs" facing you, identified individually by a letter. When a card is removed the letter is reused for the new card.',
         'table': '!game - show the state of the table', 
         'discardpile': '!discardpile - show the current discard pile.',
+        'undo': '!undo - (ops only) take back the last play, discard or hint, e.g. after a misclick.',
+        'profile': '!profile [count|seconds|stop] [stacks] - (ops only) profile the next count commands (default 100), or the commands in the next seconds ("30s", "5m"), and write the stats to the profile directory. With stacks, also write collapsed stacks for a flamegraph.',
         'grue': 'You are likely to be eaten.',
     }
+
+
+class _Watch(object):
+    '''Stands in for an irc.client connection in the reactor's list, to run
+    func when fileobj can be read.'''
+    def __init__(self, fileobj, func):
+        self.socket = fileobj
+        self.func = func
+
+    def _get_socket(self):
+        # irc < 12
+        return self.socket
+
+    def process_data(self):
+        try:
+            self.func()
+        except Exception, e:
+            log.critical('Exception in watch %s: %s', self.func, e)
+
+    def disconnect(self, message=''):
+        pass
+
+
+class Hanabot(HanabotBase, SingleServerIRCBot):
+    '''The bot running on irc.bot.SingleServerIRCBot.'''
+    def __init__(self, server, channel, nick='hanabot', nick_pass=None, port=6667, topic=None,
+                 send_rate=1.0, send_burst=5, game_workers=0, journal_dir=None,
+                 metrics_port=0, metrics_interval=0, profile_dir=None, profile_commands=0,
+                 archive_dir=None, idle_timeout=0, max_games=0):
+        log.debug('new bot started at %s:%d@#%s as %s', server, port,
+                  channel, nick)
+        SingleServerIRCBot.__init__(
+            self,
+            server_list=[(server, port)],
+            nickname=nick,
+            realname='Mumford J. Hanabot')
+
+        HanabotBase.__init__(self, channel, nick, nick_pass, topic,
+                             send_rate, send_burst, game_workers, journal_dir,
+                             metrics_port, metrics_interval, profile_dir, profile_commands,
+                             archive_dir, idle_timeout, max_games)
+
+    def _call_later(self, delay, func):
+        '''Run func in the IRC event loop after delay seconds.'''
+        if hasattr(self, 'reactor'):
+            self.reactor.scheduler.execute_after(delay, func)
+        else:
+            # irc < 12
+            self.ircobj.execute_delayed(delay, func)
+
+    def _watch(self, fileobj, func):
+        '''Run func in the IRC event loop each time fileobj has data to read.
+        The reactor selects on the sockets of its connections, so fileobj
+        joins them in a stand in connection.'''
+        reactor = self.reactor if hasattr(self, 'reactor') else self.ircobj
+        reactor.connections[:] = [c for c in reactor.connections
+                                  if not (isinstance(c, _Watch) and c.socket is fileobj)]
+        if func is not None:
+            reactor.connections.append(_Watch(fileobj, func))
+
+    def get_version(self):
+        '''raises exception in lib irc, so overload in the bot.'''
+        return "Python irc.bot 8.0"
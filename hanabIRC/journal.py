@@ -0,0 +1,247 @@
+'''
+    journal.py keeps an append only journal of each channel's game, so
+    games in progress can be rebuilt when the bot restarts.
+
+    A Journal is attached to a Game as an observer. The game reports
+    every change as a record tuple: the seed and starting deck order,
+    joins, leaves (with the reshuffled deck), the start (with the turn
+    order), and each play, discard, hint, swap, move, sort and undo. Records are
+    queued and written by a background thread, one JSON list per line
+    in <directory>/<quoted channel>.journal. The thread writes all the
+    records that are waiting, then does one fsync per file it touched
+    (group commit), so callers never wait for the disk.
+
+    A journal is removed when its game ends or is deleted. load() rebuilds
+    the games of the journals left in a directory by replaying them.
+
+    Usage:
+        journal = Journal('/var/lib/hanabot')
+        journal.attach('#hanabi', game)
+        ...
+        games = load('/var/lib/hanabot')     # [(channel, Game), ...]
+'''
+import json
+import logging
+import os
+import threading
+import urllib
+import Queue
+
+from hanabi import Game, Card
+
+log = logging.getLogger(__name__)
+
+SUFFIX = '.journal'
+
+# color initial --> color
+_colors = dict((c[0], c) for c in Game.colors)
+
+
+def encode_cards(cards):
+    '''cards as a compact string, e.g. "r1w3b5".'''
+    return ''.join('%s%d' % (c.color[0], c.number) for c in cards)
+
+
+def decode_cards(text):
+    return [Card.get(_colors[text[i]], int(text[i+1])) for i in xrange(0, len(text), 2)]
+
+
+def encode_record(record):
+    '''record with its decks and hands as card strings.'''
+    return tuple(encode_cards(a) if isinstance(a, tuple) and a and
+                 isinstance(a[0], Card) else a for a in record)
+
+
+def _path(directory, channel):
+    return os.path.join(directory, urllib.quote(channel, safe='') + SUFFIX)
+
+
+class Journal(object):
+    '''Writes the journals of the games attached to it in directory.'''
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # (op, channel, record) waiting to be written. None stops the writer.
+        self._queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='journal')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def attach(self, channel, game, new=True):
+        '''Journal the changes to game from now on. If new, start a new
+        journal for channel with the game's seed and deck; otherwise append
+        to the existing one (as for a game rebuilt by load()).'''
+        if new:
+            self._queue.put(('new', channel, ('seed', game.seed, encode_cards(game.deck))))
+
+        def observer(record):
+            self._queue.put(('add', channel, encode_record(record)))
+
+        game.observers.append(observer)
+
+    def end(self, channel):
+        '''The game in channel is over or gone; remove its journal.'''
+        self._queue.put(('end', channel, None))
+
+    def flush(self):
+        '''Wait until everything queued so far is on disk.'''
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        files = dict()
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            # group commit: take everything that queued up meanwhile.
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            dirty = set()
+            for item in batch:
+                if item is None:
+                    stop = True
+                    continue
+
+                op, channel, record = item
+                try:
+                    if op == 'end' or op == 'new':
+                        if channel in files:
+                            files.pop(channel).close()
+                            dirty.discard(channel)
+                        if os.path.exists(_path(self.directory, channel)):
+                            os.unlink(_path(self.directory, channel))
+                        if op == 'end':
+                            continue
+
+                    if channel not in files:
+                        files[channel] = open(_path(self.directory, channel), 'ab')
+
+                    files[channel].write(json.dumps(record, separators=(',', ':')) + '\n')
+                    dirty.add(channel)
+                except (IOError, OSError), e:
+                    log.critical('Error writing journal for %s: %s', channel, e)
+
+            for channel in dirty:
+                try:
+                    files[channel].flush()
+                    os.fsync(files[channel].fileno())
+                except (IOError, OSError), e:
+                    log.critical('Error syncing journal for %s: %s', channel, e)
+
+            for item in batch:
+                self._queue.task_done()
+
+        for f in files.itervalues():
+            f.close()
+
+
+# record kind --> Game method that made it
+_methods = {
+    'join': 'add_player',
+    'leave': 'remove_player',
+    'start': 'start_game',
+    'play': 'play_card',
+    'discard': 'discard_card',
+    'hint': 'hint_player',
+    'swap': 'swap_cards',
+    'move': 'move_card',
+    'sort': 'sort_cards',
+    'undo': 'undo',
+}
+
+
+def apply_record(game, record):
+    '''Apply one record to game and return the game's (pub, priv) output.
+    The random outcomes in the record (deck and turn orders) are optional;
+    without them the game's own seeded generator decides.'''
+    kind, args = record[0], list(record[1:])
+    if kind == 'seed':
+        # reseed as the game did, then take the recorded deck if there is one.
+        game._new_deck(args[0])
+        if len(args) > 1 and args[1]:
+            game.deck = decode_cards(args[1])
+        return ([], [])
+
+    if kind not in _methods:
+        raise ValueError('unknown journal record %r' % (record,))
+
+    if kind == 'leave':
+        if len(args) > 1:
+            if args[1] is not None:
+                game.forced_orders.append(decode_cards(args[1]))
+            args = args[:1]
+    elif kind == 'start':
+        if len(args) > 1:
+            game.forced_orders.append(args[1])
+            args = args[:1]
+
+    return getattr(game, _methods[kind])(*args)
+
+
+def replay(records):
+    '''Return a new Game with the journal records applied.'''
+    game = Game()
+    for record in records:
+        apply_record(game, record)
+
+    return game
+
+
+def _str(value):
+    '''value from JSON with its strings, also in nested lists, as str
+    like the rest of the bot's nicks and marks.'''
+    if isinstance(value, unicode):
+        return str(value)
+    elif isinstance(value, list):
+        return [_str(v) for v in value]
+
+    return value
+
+
+def read(path):
+    '''Return the records in the journal at path. A torn last line (from a
+    crash in the middle of a write) is ignored.'''
+    records = []
+    with open(path, 'rb') as fd:
+        for line in fd:
+            try:
+                records.append(_str(json.loads(line)))
+            except ValueError:
+                log.info('Ignoring bad journal line in %s: %r', path, line)
+                break
+
+    return records
+
+
+def load(directory, records=False):
+    '''Rebuild the games journaled in directory. Return a list of (channel, Game),
+    or with records of (channel, Game, journal records).'''
+    games = []
+    if not os.path.isdir(directory):
+        return games
+
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(SUFFIX):
+            continue
+
+        channel = urllib.unquote(name[:-len(SUFFIX)])
+        try:
+            recs = read(os.path.join(directory, name))
+            game = replay(recs)
+        except Exception, e:
+            log.critical('Could not replay journal %s: %s', name, e)
+            continue
+
+        if not game.game_over():
+            games.append((channel, game, recs) if records else (channel, game))
+
+    return games
@@ -0,0 +1,116 @@
+'''
+    lifecycle.py decides when the bot lets go of a game, so a long running
+    bot holds only the games people are playing.
+
+    A game is retired when it ends, when nobody has touched it for
+    idle_timeout seconds (abandoned lobbies and games), or to make room
+    for a new game when max_games are going. Lifecycle keeps the last
+    activity time of each channel and picks the games to retire; the bot
+    calls games.retire(channel, reason) for them.
+
+    Given an archive directory, retired games are written there by an
+    Archive, one JSON object per line in games-YYYY-MM.jsonl: the channel,
+    why and when it was retired, the seed, players and score, and the
+    game's journal records (see journal.py), from which journal.replay()
+    rebuilds the game.
+
+    Usage:
+        lifecycle = Lifecycle(idle_timeout=3600, max_games=100)
+        lifecycle.touch('#hanabi')
+        for channel in lifecycle.idle():
+            games.retire(channel, 'idle')
+'''
+import json
+import logging
+import os
+import time
+
+import journal
+
+log = logging.getLogger(__name__)
+
+
+class Lifecycle(object):
+    '''The last activity of each game's channel.'''
+    def __init__(self, idle_timeout=0, max_games=0, clock=time.time):
+        self.idle_timeout = idle_timeout
+        self.max_games = max_games
+        self._clock = clock
+        self._last = dict()         # channel --> time of last activity
+
+    def touch(self, channel):
+        self._last[channel] = self._clock()
+
+    def forget(self, channel):
+        self._last.pop(channel, None)
+
+    def last_activity(self, channel):
+        return self._last.get(channel)
+
+    def idle(self):
+        '''Channels whose game has not been touched for idle_timeout seconds,
+        oldest first.'''
+        if not self.idle_timeout:
+            return []
+
+        cutoff = self._clock() - self.idle_timeout
+        return sorted((c for c, t in self._last.iteritems() if t <= cutoff),
+                      key=self._last.get)
+
+    def full(self, games):
+        return bool(self.max_games) and len(games) >= self.max_games
+
+    def victim(self, games):
+        '''The game to retire to make room for a new one: the least recently
+        active game that has not started. None if all of them have.'''
+        waiting = [c for c in games if not games[c].has_started()]
+        if not waiting:
+            return None
+
+        return min(waiting, key=lambda c: self._last.get(c, 0))
+
+
+class Archive(object):
+    '''Records the games attached to it and writes them to directory when
+    they are retired.'''
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._records = dict()      # channel --> journal records
+
+    def attach(self, channel, game, records=None):
+        '''Record the changes to game from now on, after records (the game's
+        journal so far, for a restored game).'''
+        self._records[channel] = kept = list(records) if records else [
+            ('seed', game.seed, journal.encode_cards(game.deck))]
+        game.observers.append(lambda record: kept.append(journal.encode_record(record)))
+
+    def forget(self, channel):
+        self._records.pop(channel, None)
+
+    def write(self, channel, game, reason):
+        '''Write the game in channel to the archive and forget it.'''
+        now = time.time()
+        entry = {
+            'channel': channel,
+            'reason': reason,
+            'retired': int(now),
+            'seed': game.seed,
+            'players': sorted(game.players()),
+            'score': game.score,
+            'records': self._records.pop(channel, []),
+        }
+        path = os.path.join(self.directory, time.strftime('games-%Y-%m.jsonl',
+                                                          time.localtime(now)))
+        try:
+            # one write per game, so workers appending to the same file do
+            # not mix their lines.
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+            try:
+                os.write(fd, json.dumps(entry, separators=(',', ':')) + '\n')
+            finally:
+                os.close(fd)
+        except (IOError, OSError), e:
+            log.critical('Could not archive the game in %s: %s', channel, e)
@@ -0,0 +1,516 @@
+'''
+    loadtest.py measures how much play a hanabot can take, without a live
+    IRC network.
+
+    It starts a stand-in IRC server on localhost, runs a real bot (Hanabot
+    or AsyncHanabot) against it in a child process, and has the bot join
+    one channel per table. At each table 2 to 5 scripted clients play full
+    games through !new, !join, !start, !play, !hint, !discard, !hands and
+    !table, following the bot's replies to know whose turn it is, and start
+    a new game when one ends.
+
+    Each table waits for the reply to its command before it sends the next
+    one, so there is at most one command per table in flight. The server
+    sends a PING after each command; the bot answers it once it has sent
+    everything it had to say about the command. With game_workers the
+    bot can answer before the worker is done, so there a command is done
+    at its first reply after the PONG. The command rate is paced per
+    table. Each step runs at a target rate for a while and reports the
+    command to first reply latency percentiles. By default the rate
+    doubles each step until the bot stops keeping up (it falls behind the
+    target, the p99 latency goes over the limit, or a command gets no
+    reply), and the last rate it kept up with is reported.
+
+    Usage:
+        test = LoadTest(tables=20)
+        test.start()
+        stats = test.step(rate=100, duration=10)
+        test.stop()
+'''
+import argparse
+import asynchat
+import asyncore
+import logging
+import math
+import multiprocessing
+import os
+import random
+import re
+import signal
+import socket
+import sys
+import time
+from collections import defaultdict, deque
+
+from async_core import EventLoop, parse_line
+
+log = logging.getLogger(__name__)
+
+HOME = '#hanabload'
+BOT_NICK = 'hanabot'
+
+# IRC color and formatting codes.
+_formatting = re.compile(r'\x03(\d{1,2}(,\d{1,2})?)?|[\x02\x0f\x16\x1d\x1f]')
+_turn = re.compile(r"It is (\S+)'s turn to play")
+_letters = re.compile(r'Card must be one of ([A-E](, [A-E])*)')
+
+_refused = re.compile(r'deceiving|Oh no|Invalid hint')
+
+_hints = ['1', '2', '3', '4', '5', 'r', 'b', 'w', 'g', 'y']
+
+
+def percentile(values, p):
+    '''The p-th percentile (0-100) of the sorted list values, by nearest rank.'''
+    if not values:
+        return 0.0
+
+    i = int(math.ceil(p / 100.0 * len(values))) - 1
+    return values[max(0, min(len(values) - 1, i))]
+
+
+class BotLink(asynchat.async_chat):
+    '''The server side of the bot's connection.'''
+    def __init__(self, server, sock):
+        asynchat.async_chat.__init__(self, sock, map=server.loop.map)
+        self.set_terminator('\r\n')
+        self.server = server
+        self.nick = BOT_NICK
+        self._buf = []
+
+    def handle_read(self):
+        asynchat.async_chat.handle_read(self)
+        # ack at once: a delayed ack holds the bot's next write for up to
+        # 40ms (Nagle), which would swamp the latencies measured.
+        if hasattr(socket, 'TCP_QUICKACK') and self.socket:
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+    def collect_incoming_data(self, data):
+        self._buf.append(data)
+
+    def found_terminator(self):
+        line = ''.join(self._buf)
+        self._buf = []
+        if line:
+            self.handle_line(line)
+
+    def handle_line(self, line):
+        prefix, command, params = parse_line(line)
+        if command == 'NICK':
+            self.nick = params[0]
+        elif command == 'USER':
+            self.send_raw(':fakeirc 001 %s :Welcome to the load test' % self.nick)
+        elif command == 'PING':
+            self.send_raw(':fakeirc PONG fakeirc :%s' % (params[0] if params else ''))
+        elif command == 'JOIN':
+            for chan in params[0].split(','):
+                self.send_raw(':%s!bot@fakeirc JOIN %s' % (self.nick, chan))
+                self.send_raw(':fakeirc 353 %s = %s :@%s' % (self.nick, chan, self.nick))
+                self.send_raw(':fakeirc 366 %s %s :End of /NAMES list.' % (self.nick, chan))
+                self.server.on_join(chan)
+        elif command == 'PONG' and params:
+            self.server.on_pong(params[-1])
+        elif command in ('NOTICE', 'PRIVMSG') and len(params) > 1:
+            self.server.on_reply(params[0], params[1])
+        elif command == 'QUIT':
+            self.close()
+
+    def send_raw(self, text):
+        self.push(text + '\r\n')
+
+    def handle_close(self):
+        self.close()
+        self.server.link = None
+
+
+class FakeServer(asyncore.dispatcher):
+    '''A stand-in IRC server for one bot. Clients are not connections,
+    they are simulated: say() delivers a message from them to the bot, and
+    the bot's NOTICEs, JOINs and PONGs go to on_reply, on_join and on_pong.'''
+    def __init__(self, loop, on_join, on_reply, on_pong, port=0):
+        asyncore.dispatcher.__init__(self, map=loop.map)
+        self.loop = loop
+        self.on_join = on_join
+        self.on_reply = on_reply
+        self.on_pong = on_pong
+        self.link = None
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(('127.0.0.1', port))
+        self.listen(1)
+        self.port = self.socket.getsockname()[1]
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            pair[0].setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.link = BotLink(self, pair[0])
+
+    def say(self, nick, target, text):
+        self.link.send_raw(':%s!client@fakeirc PRIVMSG %s :%s' % (nick, target, text))
+
+    def ping(self, token):
+        self.link.send_raw('PING :%s' % token)
+
+
+class Pending(object):
+    '''A command waiting for its reply. It is done when the bot has
+    replied and answered the PING sent after it.'''
+    def __init__(self, nick, command, token):
+        self.nick = nick
+        self.command = command
+        self.kind = command.split()[0]
+        self.token = token
+        self.sent = time.time()
+        self.replied = False
+        self.ponged = False
+
+
+class Table(object):
+    '''The scripted clients playing in one channel.'''
+    def __init__(self, test, chan, nicks, rng):
+        self.test = test
+        self.chan = chan
+        self.nicks = nicks
+        self.rng = rng
+        self.queue = deque()
+        self.pending = None         # the Pending command in flight
+        self.turn = None
+        self.letters = dict()
+        self.hint_refused = False
+        self.over = False
+        self.last_sent = 0
+        self._timer = None
+        self.seq = 0
+        self.games = 0
+        self._new_game()
+
+    def _new_game(self):
+        self.turn = None
+        self.letters = dict((n, 'ABCDE') for n in self.nicks)
+        self.queue.extend([(self.nicks[0], 'new')] +
+                          [(n, 'join') for n in self.nicks] +
+                          [(self.nicks[0], 'start')])
+
+    def _next(self):
+        '''The next (nick, command) to send.'''
+        if self.queue:
+            return self.queue.popleft()
+
+        if self.turn is None:
+            return (self.rng.choice(self.nicks), 'turn')
+
+        r = self.rng.random()
+        if r < 0.1:
+            return (self.rng.choice(self.nicks), 'hands')
+        if r < 0.2:
+            return (self.rng.choice(self.nicks), 'table')
+
+        nick = self.turn
+        letter = self.rng.choice(self.letters[nick])
+        r = self.rng.random()
+        if r < 0.3 and not self.hint_refused:
+            other = self.rng.choice([n for n in self.nicks if n != nick])
+            return (nick, 'hint %s %s' % (other, self.rng.choice(_hints)))
+        if r < 0.65:
+            return (nick, 'play %s' % letter)
+
+        return (nick, 'discard %s' % letter)
+
+    def send(self):
+        '''Send the next command, if none is waiting for its reply.'''
+        if self.pending is not None or not self.test.running:
+            return
+
+        nick, command = self._next()
+        self.seq += 1
+        self.pending = Pending(nick, command, '%s.%d' % (self.chan[1:], self.seq))
+        self.last_sent = self.pending.sent
+        self.test.server.say(nick, self.chan, '!' + command)
+        self.test.server.ping(self.pending.token)
+        self.test.loop.call_later(self.test.timeout, lambda p=self.pending: self._timeout(p))
+
+    def _timeout(self, pending):
+        if self.pending is not pending:
+            return
+
+        log.info('No reply in %s to %s: !%s', self.chan, pending.nick, pending.command)
+        self.test.stats['timeouts'] += 1
+        # find out whose turn it is before going on.
+        self.queue.appendleft((self.nicks[0], 'turn'))
+        self.pending = None
+        self.schedule()
+
+    def reply(self, target, text):
+        '''A NOTICE from the bot to the channel or one of the players.'''
+        text = _formatting.sub('', text)
+        turns = _turn.findall(text)
+        if turns:
+            self.turn = turns[-1]
+            self.hint_refused = False
+        if _refused.search(text):
+            self.hint_refused = True
+        if 'The game is over' in text or 'already an active game' in text:
+            self.over = True
+
+        m = _letters.search(text)
+        if m and target in self.letters:
+            self.letters[target] = m.group(1).replace(', ', '')
+
+        p = self.pending
+        if p is not None and not p.replied:
+            p.replied = True
+            self.test.latencies[p.kind].append(time.time() - p.sent)
+            self._check_done()
+
+    def pong(self, token):
+        '''The bot has sent everything it had to say before the ping.'''
+        if self.pending is not None and self.pending.token == token:
+            self.pending.ponged = True
+            self._check_done()
+
+    def _check_done(self):
+        # with game_workers the reply can come after the PONG.
+        p = self.pending
+        if not (p.ponged and p.replied):
+            return
+
+        self.pending = None
+        self.test.stats['commands'] += 1
+        if self.over:
+            self.over = False
+            self.queue.clear()
+            if p.kind == 'new':
+                # a game is still going in the channel.
+                self.queue.append((self.nicks[0], 'delete'))
+            else:
+                self.games += 1
+                self.test.stats['games'] += 1
+            self._new_game()
+
+        self.schedule()
+
+    def schedule(self, wait=None):
+        '''Send the next command after wait seconds, or when the pacing
+        allows. Replaces any send already scheduled.'''
+        if wait is None:
+            wait = max(0, self.last_sent + self.test.interval - time.time())
+
+        timer = self._timer = object()
+        self.test.loop.call_later(wait, lambda: timer is self._timer and self.send())
+
+
+def _run_bot(core, port, game_workers, send_rate):
+    '''Run a bot against the fake server. In the child process, which leads
+    its own process group so stop() also ends the game workers.'''
+    os.setpgrp()
+    if core == 'async':
+        from async_core import AsyncHanabot as botclass
+    else:
+        from hanabot import Hanabot as botclass
+
+    bot = botclass('127.0.0.1', HOME, BOT_NICK, None, port, send_rate=send_rate,
+                   send_burst=max(5, send_rate), game_workers=game_workers)
+    bot.start()
+
+
+class LoadTest(object):
+    '''Runs a bot against a FakeServer with tables scripted clients.'''
+    def __init__(self, tables=10, players=(2, 5), core='irc', game_workers=0,
+                 send_rate=0, timeout=5.0, seed=None):
+        self.rng = random.Random(seed)
+        self.ntables = tables
+        self.players = players
+        self.core = core
+        self.game_workers = game_workers
+        # 0 for no flood limit: the bot is what is measured.
+        self.send_rate = send_rate or 1e9
+        self.timeout = timeout
+        self.loop = EventLoop()
+        self.server = FakeServer(self.loop, self._on_join, self._on_reply, self._on_pong)
+        self.tables = dict()        # channel --> Table
+        self._targets = dict()      # channel or nick --> Table
+        self._joined = set()
+        self.running = False
+        self.interval = 0
+        self._bot = None
+
+    def _on_join(self, chan):
+        self._joined.add(chan)
+
+    def _on_reply(self, target, text):
+        table = self._targets.get(target)
+        if table is not None:
+            table.reply(target, text)
+
+    def _on_pong(self, token):
+        table = self.tables.get('#' + token.split('.')[0])
+        if table is not None:
+            table.pong(token)
+
+    def _wait(self, cond, timeout=30):
+        '''Run the loop until cond() or timeout seconds.'''
+        end = time.time() + timeout
+        while not cond():
+            if time.time() > end or not self._bot.is_alive():
+                raise RuntimeError('The bot did not come up.')
+            asyncore.loop(timeout=0.05, map=self.loop.map, count=1)
+            self.loop.run_timers()
+
+    def start(self):
+        '''Start the bot and have it join the tables' channels.'''
+        self._bot = multiprocessing.Process(
+            target=_run_bot, name='hanabot',
+            args=(self.core, self.server.port, self.game_workers, self.send_rate))
+        self._bot.start()
+        self._wait(lambda: HOME in self._joined)
+
+        for i in xrange(self.ntables):
+            chan = '#load%d' % i
+            nicks = ['p%d_%d' % (i, j) for j in xrange(self.rng.randint(*self.players))]
+            self.server.say('loadtest', HOME, '!new %s' % chan[1:])
+            table = self.tables[chan] = Table(self, chan, nicks, random.Random(self.rng.random()))
+            self._targets[chan] = table
+            for n in nicks:
+                self._targets[n] = table
+
+        self._wait(lambda: all(c in self._joined for c in self.tables))
+
+    def step(self, rate=0, duration=10):
+        '''Play for duration seconds, with the tables sending rate commands a
+        second between them (0 for as fast as the replies come). Return the
+        stats of the step.'''
+        self.interval = float(self.ntables) / rate if rate else 0
+        self.latencies = defaultdict(list)
+        self.stats = defaultdict(int)
+        self.running = True
+        for table in self.tables.itervalues():
+            # stagger the tables over one interval.
+            table.schedule(self.rng.random() * self.interval)
+
+        start = time.time()
+        self.loop.call_later(duration, self.loop.stop)
+        self.loop.run(max_wait=0.05)
+        self.running = False
+        elapsed = time.time() - start
+
+        every = sorted(l for ls in self.latencies.itervalues() for l in ls)
+        stats = dict(self.stats)
+        stats.update({
+            'rate': rate,
+            'achieved': self.stats['commands'] / elapsed,
+            'p50': percentile(every, 50),
+            'p90': percentile(every, 90),
+            'p99': percentile(every, 99),
+            'max': every[-1] if every else 0.0,
+            'commands': self.stats['commands'],
+            'games': self.stats['games'],
+            'timeouts': self.stats['timeouts'],
+            'by_command': dict((k, (len(v), percentile(sorted(v), 50), percentile(sorted(v), 99)))
+                               for k, v in self.latencies.iteritems()),
+        })
+        # let the replies in flight come in before the next step.
+        end = time.time() + self.timeout
+        while time.time() < end and any(t.pending for t in self.tables.itervalues()):
+            asyncore.loop(timeout=0.05, map=self.loop.map, count=1)
+
+        for table in self.tables.itervalues():
+            table.pending = None
+
+        return stats
+
+    def stop(self):
+        if self._bot is not None:
+            try:
+                os.killpg(self._bot.pid, signal.SIGTERM)
+            except OSError:
+                pass
+            self._bot.join()
+            self._bot = None
+
+        if self.server.link:
+            self.server.link.close()
+        self.server.close()
+
+
+def sustainable(stats, slo):
+    '''Did the bot keep up in this step?'''
+    return (not stats['timeouts'] and stats['p99'] <= slo and
+            (not stats['rate'] or stats['achieved'] >= 0.9 * stats['rate']))
+
+
+def report(stats):
+    return ('target %6s cmds/s: %7.1f cmds/s, latency p50 %6.1f ms, p90 %6.1f ms, '
+            'p99 %6.1f ms, max %6.1f ms, %d games done, %d timeouts' % (
+                stats['rate'] or 'max', stats['achieved'], stats['p50'] * 1000,
+                stats['p90'] * 1000, stats['p99'] * 1000, stats['max'] * 1000,
+                stats['games'], stats['timeouts']))
+
+
+def main(argv=None):
+    desc = ('Load test a hanabot on a local stand-in IRC server with scripted players, '
+            'and find the highest command rate it keeps up with.')
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument('-t', '--tables', type=int, default=20,
+                           help='Channels with a game going. Default 20.')
+    argparser.add_argument('-p', '--players', default='2-5',
+                           help='Players per table, as min-max. Default 2-5.')
+    argparser.add_argument('-c', '--core', choices=['irc', 'async'], default='irc',
+                           help='Run Hanabot (irc) or AsyncHanabot (async).')
+    argparser.add_argument('-w', '--game_workers', type=int, default=0,
+                           help='Worker processes for the games, as in the bot config.')
+    argparser.add_argument('-r', '--rate', type=float, default=10,
+                           help='Commands per second to start from. Default 10.')
+    argparser.add_argument('-f', '--fixed', action='store_true',
+                           help='Only run at --rate (0 for as fast as replies come).')
+    argparser.add_argument('-d', '--duration', type=float, default=10,
+                           help='Seconds per step. Default 10.')
+    argparser.add_argument('--slo', type=float, default=0.25,
+                           help='The highest p99 latency, in seconds, that counts as '
+                           'keeping up. Default 0.25.')
+    argparser.add_argument('--send_rate', type=float, default=0,
+                           help='The bot\'s NOTICE rate limit. Default 0, no limit.')
+    argparser.add_argument('-s', '--seed', type=int, help='Seed for the players.')
+    argparser.add_argument('-v', '--verbose', action='store_true',
+                           help='Show the latency of each command.')
+    args = argparser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    players = tuple(int(n) for n in args.players.split('-'))
+    if len(players) == 1:
+        players = players * 2
+
+    test = LoadTest(args.tables, players, args.core, args.game_workers,
+                    args.send_rate, seed=args.seed)
+    test.start()
+    best = None
+    rate = args.rate
+    try:
+        while True:
+            stats = test.step(rate, args.duration)
+            print report(stats)
+            if args.verbose:
+                for cmd, (n, p50, p99) in sorted(stats['by_command'].iteritems()):
+                    print '    !%-8s %6d run, p50 %6.1f ms, p99 %6.1f ms' % (
+                        cmd, n, p50 * 1000, p99 * 1000)
+
+            if args.fixed or not rate:
+                break
+            if not sustainable(stats, args.slo):
+                break
+
+            best = stats
+            if stats['achieved'] < 0.9 * rate:
+                break
+            rate *= 2
+    finally:
+        test.stop()
+
+    if not args.fixed and rate:
+        if best:
+            print 'Highest sustainable rate: %.1f commands/s (p99 %.1f ms) with %d tables.' % (
+                best['achieved'], best['p99'] * 1000, args.tables)
+        else:
+            print 'The bot did not keep up with %g commands/s.' % args.rate
+
+if __name__ == '__main__':
+    sys.exit(main())
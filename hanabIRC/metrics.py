@@ -0,0 +1,182 @@
+'''
+    metrics.py keeps counters and latency histograms for the bot and
+    exports them in the Prometheus text format, over HTTP on a local
+    port if asked to, and as a short summary for the log.
+
+    Each metric has a name, help text and label names. Values are kept
+    per tuple of label values:
+
+        metrics = Metrics()
+        commands = metrics.counter('hanabot_commands_total', 'Commands run.',
+                                   ('command', 'channel'))
+        commands.inc(('play', '#hanabi'))
+        latency = metrics.histogram('hanabot_command_seconds', 'Time in handlers.',
+                                    ('command',))
+        latency.observe(('play',), 0.002)
+        metrics.gauge('hanabot_send_queue', 'Queued messages.', lambda: len(q))
+        print metrics.exposition()
+'''
+import logging
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from bisect import bisect_left
+
+log = logging.getLogger(__name__)
+
+# histogram bucket upper bounds, in seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+             for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class Counter(object):
+    '''A count per tuple of label values that only goes up.'''
+    kind = 'counter'
+
+    def __init__(self, name, help, labels, lock):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = lock
+        self.values = dict()
+
+    def inc(self, labels=(), n=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def total(self):
+        return sum(self.values.itervalues())
+
+    def lines(self):
+        return ['%s%s %s' % (self.name, _labels(self.labels, k), v)
+                for k, v in sorted(self.values.iteritems())]
+
+
+class Histogram(object):
+    '''Observations bucketed per tuple of label values. Also keeps the
+    sum, count and max of the observations.'''
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, lock, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._lock = lock
+        self.buckets = tuple(buckets)
+        # label values --> [bucket counts..., sum, count, max]
+        self.values = dict()
+
+    def observe(self, labels, value):
+        n = len(self.buckets)
+        with self._lock:
+            v = self.values.get(labels)
+            if v is None:
+                v = self.values[labels] = [0] * n + [0.0, 0, 0.0]
+            i = bisect_left(self.buckets, value)
+            if i < n:
+                v[i] += 1
+            v[n] += value
+            v[n+1] += 1
+            v[n+2] = max(v[n+2], value)
+
+    def stats(self, labels):
+        '''Return (count, sum, max) for labels.'''
+        n = len(self.buckets)
+        v = self.values.get(labels, [0] * n + [0.0, 0, 0.0])
+        return v[n+1], v[n], v[n+2]
+
+    def lines(self):
+        n = len(self.buckets)
+        lines = []
+        for k, v in sorted(self.values.iteritems()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, v):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (self.name, _labels(
+                    self.labels, k, 'le="%g"' % bound), cumulative))
+            lines.append('%s_bucket%s %d' % (self.name, _labels(
+                self.labels, k, 'le="+Inf"'), v[n+1]))
+            lines.append('%s_sum%s %r' % (self.name, _labels(self.labels, k), v[n]))
+            lines.append('%s_count%s %d' % (self.name, _labels(self.labels, k), v[n+1]))
+
+        return lines
+
+
+class Gauge(object):
+    '''A value read from func() when the metrics are exported.'''
+    kind = 'gauge'
+
+    def __init__(self, name, help, func):
+        self.name, self.help, self.func = name, help, func
+
+    def lines(self):
+        return ['%s %s' % (self.name, self.func())]
+
+
+class Metrics(object):
+    '''A set of metrics, exported together.'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._server = None
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels, self._lock))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, self._lock, buckets))
+
+    def gauge(self, name, help, func):
+        return self._add(Gauge(name, help, func))
+
+    def exposition(self):
+        '''All metrics in the Prometheus text format.'''
+        lines = []
+        with self._lock:
+            for m in self._metrics:
+                lines.append('# HELP %s %s' % (m.name, m.help))
+                lines.append('# TYPE %s %s' % (m.name, m.kind))
+                lines += m.lines()
+
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        '''Serve the exposition at http://host:port/metrics from a thread.'''
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = metrics.exposition()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug('metrics http: ' + format, *args)
+
+        self._server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, name='metrics')
+        thread.daemon = True
+        thread.start()
+        log.info('Serving metrics on http://%s:%d/metrics', host, self._server.server_port)
+        return self._server.server_port
+
+    def close(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
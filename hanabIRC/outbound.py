@@ -0,0 +1,217 @@
+'''
+    outbound.py prepares the text the bot sends to IRC.
+
+    The bot sends each line of game output as a NOTICE. Sending them one
+    by one costs a message (and a turn of the server's flood control)
+    per line, so coalesce() packs consecutive lines for the same target
+    into as few messages as the IRC line limit allows.
+
+    Messages are then sent through a SendQueue, which keeps the bot under
+    the server's flood limits with a token bucket, sends turn critical
+    messages first, and takes turns between targets so a burst of output
+    in one channel does not hold up the games in the others.
+'''
+import time
+from collections import deque
+
+# RFC 1459: a message is at most 512 bytes including the trailing CRLF.
+MAX_MESSAGE = 512
+
+# The server prefixes relayed messages with ":nick!user@host ", which
+# counts against the 512 bytes the other clients receive.
+PREFIX_RESERVE = 100
+
+# put between packed lines.
+SEPARATOR = ' | '
+
+# mIRC control code that resets all formatting.
+RESET = '\x0f'
+
+
+def _size(text):
+    '''size in bytes of text on the wire.'''
+    if isinstance(text, unicode):
+        return len(text.encode('utf-8'))
+
+    return len(text)
+
+
+def budget(target, command='NOTICE'):
+    '''Return the number of bytes of text that fit in one command to target.'''
+    return (MAX_MESSAGE - PREFIX_RESERVE - 2 -
+            _size('%s %s :' % (command, target)))
+
+
+def _is_closed(text):
+    '''Return True if text ends with no bold or color left open. The
+    text_markup classes always close what they open.'''
+    return text.count('\x02') % 2 == 0 and text.count('\x03') % 2 == 0
+
+
+def split_line(line, size):
+    '''Split a line longer than size bytes into pieces that fit. Split
+    at a space outside any bold or color run if there is one. A unicode
+    line is split by its UTF-8 bytes, never inside a character, and
+    comes back as unicode pieces.'''
+    if isinstance(line, unicode):
+        return [p.decode('utf-8') for p in split_line(line.encode('utf-8'), size)]
+
+    pieces = []
+    while len(line) > size:
+        cut = None
+        i = line.rfind(' ', 0, size)
+        while i > 0:
+            if _is_closed(line[:i]):
+                cut = i
+                break
+            i = line.rfind(' ', 0, i)
+
+        if cut is None:
+            # no clean place, so cut hard and reset the formatting.
+            cut = size - len(RESET)
+            # do not cut a color code ("\x03NN") or a character in half.
+            j = line.rfind('\x03', max(0, cut - 2), cut)
+            if j > 0:
+                cut = j
+            while 0 < cut < len(line) and 0x80 <= ord(line[cut]) < 0xc0:
+                cut -= 1
+            if cut <= 0:
+                # size is too small for anything but one character.
+                cut = 1
+                while cut < len(line) and 0x80 <= ord(line[cut]) < 0xc0:
+                    cut += 1
+
+            pieces.append(line[:cut] + RESET)
+            line = line[cut:]
+        else:
+            pieces.append(line[:cut])
+            line = line[cut+1:]
+
+    pieces.append(line)
+    return pieces
+
+
+def coalesce(lines, size):
+    '''Pack lines into as few messages of at most size bytes as possible,
+    keeping them in order. Lines that leave formatting open get a reset
+    before the next line is added.'''
+    msgs = []
+    cur = None
+    for line in lines:
+        if _size(line) > size:
+            pieces = split_line(line, size)
+        else:
+            pieces = [line]
+
+        for piece in pieces:
+            if cur is None:
+                cur = piece
+                continue
+
+            glue = SEPARATOR if _is_closed(cur) else RESET + SEPARATOR
+
+            if _size(cur) + _size(glue) + _size(piece) <= size:
+                cur = cur + glue + piece
+            else:
+                msgs.append(cur)
+                cur = piece
+
+    if cur is not None:
+        msgs.append(cur)
+
+    return msgs
+
+
+# SendQueue priorities, most urgent first.
+HIGH, NORMAL = range(2)
+
+
+class SendQueue(object):
+    '''
+    Messages waiting to be sent, queued per target and priority.
+
+    send(target, msg) is called for each message. At most burst messages
+    are sent back to back, after that one message every 1/rate seconds.
+    All HIGH messages are sent before any NORMAL ones. Within a priority
+    the targets take turns, one message each.
+
+    If call_later(delay, func) is given it is used to run pump() again
+    when the next message may go out. Otherwise the caller must call
+    pump() itself.
+    '''
+    def __init__(self, send, rate=1.0, burst=5, call_later=None, clock=time.time):
+        self._send = send
+        self.rate = float(rate)
+        self.burst = burst
+        self._call_later = call_later
+        self._clock = clock
+
+        self._tokens = float(burst)
+        self._last = clock()
+        self._scheduled = False
+
+        # for each priority: target --> deque of msgs, and the deque of
+        # targets with msgs in turn order.
+        self._queues = [dict() for p in (HIGH, NORMAL)]
+        self._turns = [deque() for p in (HIGH, NORMAL)]
+
+        self.sent = 0
+
+    def __len__(self):
+        return sum(len(q) for queues in self._queues for q in queues.itervalues())
+
+    def put(self, target, msg, priority=NORMAL):
+        '''Queue msg for target and send what the rate allows.'''
+        queues = self._queues[priority]
+        if target not in queues:
+            queues[target] = deque()
+            self._turns[priority].append(target)
+
+        queues[target].append(msg)
+        self.pump()
+
+    def pump(self):
+        '''Send queued messages while there are tokens. Return the seconds
+        until the next message can go out, or None if the queue is empty.'''
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+        while self._tokens >= 1:
+            item = self._next()
+            if item is None:
+                return None
+
+            self._tokens -= 1
+            self.sent += 1
+            self._send(*item)
+
+        if not len(self):
+            return None
+
+        wait = (1 - self._tokens) / self.rate
+        if self._call_later and not self._scheduled:
+            self._scheduled = True
+            self._call_later(wait, self._on_timer)
+
+        return wait
+
+    def _on_timer(self):
+        self._scheduled = False
+        self.pump()
+
+    def _next(self):
+        '''Remove and return the next (target, msg) to send, or None.'''
+        for queues, turns in zip(self._queues, self._turns):
+            if turns:
+                target = turns.popleft()
+                q = queues[target]
+                msg = q.popleft()
+                if q:
+                    turns.append(target)
+                else:
+                    del queues[target]
+
+                return target, msg
+
+        return None
@@ -0,0 +1,159 @@
+'''
+    profiling.py profiles the bot's command handling on demand, for the
+    next N commands or for a time window, without restarting the bot.
+
+    While a CommandProfiler is active, each command run through run()
+    is profiled with cProfile, and the stats of all of them are written
+    together when it stops: a .pstats file (for pstats or snakeviz) and
+    a .txt report of the top functions. With stacks=True a thread also
+    samples the stack of the command handling thread every few ms, and
+    the samples are written as collapsed stacks (a .stacks file, one
+    "frame;frame;frame count" per line) for flamegraph.pl or speedscope.
+
+    When it is not active the bot only checks the active flag, so it
+    costs next to nothing to have around.
+'''
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import defaultdict
+
+log = logging.getLogger(__name__)
+
+
+class StackSampler(threading.Thread):
+    '''Samples the stack of thread target every interval seconds while
+    self.inside is True, counting the collapsed stacks.'''
+    def __init__(self, target, interval=0.002):
+        threading.Thread.__init__(self, name='stack-sampler')
+        self.daemon = True
+        self.target = target
+        self.interval = interval
+        self.inside = False
+        self.counts = defaultdict(int)
+        self._halt = threading.Event()
+
+    def run(self):
+        me = sys._getframe()
+        while not self._halt.wait(self.interval):
+            if not self.inside:
+                continue
+
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None and frame is not me:
+                code = frame.f_code
+                stack.append('%s:%s' % (os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+class CommandProfiler(object):
+    '''Profiles the commands run through run() between start() and stop(),
+    writing the results to directory.'''
+    def __init__(self, directory='.', clock=time.time):
+        self.directory = directory
+        self._clock = clock
+        self.active = False
+
+    def start(self, commands=None, seconds=None, stacks=False, done=None):
+        '''Profile the next commands commands, or the commands in the next
+        seconds seconds (whichever ends first if both are given). done(paths)
+        is called with the files written when it stops. Return False if
+        already profiling.'''
+        if self.active:
+            return False
+
+        self._left = commands
+        self._until = self._clock() + seconds if seconds else None
+        self._done = done
+        self._profile = cProfile.Profile()
+        self._sampler = None
+        if stacks:
+            self._sampler = StackSampler(threading.current_thread().ident)
+            self._sampler.start()
+
+        self.count = 0
+        self.active = True
+        log.info('Profiling started for %s commands, %s seconds.', commands, seconds)
+        return True
+
+    def run(self, func, *args):
+        '''Call func(*args), profiling it if active.'''
+        if not self.active:
+            return func(*args)
+
+        self.expire()
+        if not self.active:
+            return func(*args)
+
+        if self._sampler:
+            self._sampler.inside = True
+        self._profile.enable()
+        try:
+            return func(*args)
+        finally:
+            self._profile.disable()
+            if self._sampler:
+                self._sampler.inside = False
+
+            self.count += 1
+            if self._left is not None:
+                self._left -= 1
+                if self._left <= 0:
+                    self.stop()
+
+    def expire(self):
+        '''Stop if the time window is over.'''
+        if self.active and self._until is not None and self._clock() >= self._until:
+            self.stop()
+
+    def stop(self):
+        '''Stop profiling and write the results. Return the paths written.'''
+        if not self.active:
+            return []
+
+        self.active = False
+        if self._sampler:
+            self._sampler.stop()
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # a profile written in the same second as another is numbered.
+        name = 'hanabot-profile-%s' % time.strftime('%Y%m%d-%H%M%S')
+        base, n = os.path.join(self.directory, name), 1
+        while any(os.path.exists(base + ext) for ext in ('.pstats', '.txt', '.stacks')):
+            n += 1
+            base = os.path.join(self.directory, '%s-%d' % (name, n))
+
+        paths = []
+        if self.count:
+            self._profile.dump_stats(base + '.pstats')
+            with open(base + '.txt', 'w') as fd:
+                fd.write('%d commands profiled.\n' % self.count)
+                stats = pstats.Stats(self._profile, stream=fd)
+                stats.sort_stats('cumulative').print_stats(50)
+            paths += [base + '.pstats', base + '.txt']
+
+        if self._sampler and self._sampler.counts:
+            with open(base + '.stacks', 'w') as fd:
+                for stack, count in sorted(self._sampler.counts.iteritems()):
+                    fd.write('%s %d\n' % (stack, count))
+            paths.append(base + '.stacks')
+
+        log.info('Profiled %d commands: %s', self.count, ', '.join(paths))
+        if self._done:
+            self._done(paths)
+
+        return paths
@@ -0,0 +1,230 @@
+'''
+    renderer.py turns the output of the hanabi.Game engine into lines
+    of text.
+
+    Game methods return (public, private) lists of strings and
+    events.Event objects. Renderer.render_all() turns such a list into
+    a list of strings using one of the text_markup classes for colors,
+    so the same game output can be shown on IRC, an xterm, or plain
+    ascii.
+
+    The table and discard pile are rendered in segments kept in the
+    game's render_cache, keyed by the renderer and markup classes. A
+    segment is only rendered again when the game bumps its version, so
+    showing the table after a hint does not re-render the cards.
+'''
+import events
+from text_markup import irc_markup
+
+
+class Renderer(object):
+    '''Render game output with the given markup (irc_markup if not given).'''
+
+    # chars used to show the tokens.
+    notes_up, notes_down = ('w', 'b')
+    storms_up, storms_down = ('X', 'O')
+
+    def __init__(self, markup=None):
+        self.markup = markup if markup else irc_markup()
+
+        # renderers of the same classes render the same text, so they
+        # share segments in the game render caches.
+        self._cache_key = (type(self), type(self.markup))
+
+        # (notes, max_notes, storms, max_storms) --> token text.
+        self._tokens = dict()
+
+        # (colors mask, numbers mask) --> knowledge text.
+        self._knowledge = dict()
+
+        # event class --> method rendering it.
+        self._dispatch = dict()
+        for name in dir(events):
+            cls = getattr(events, name)
+            if isinstance(cls, type) and issubclass(cls, events.Event):
+                method = getattr(self, '_render_%s' % name, None)
+                if method:
+                    self._dispatch[cls] = method
+
+    def render(self, item):
+        '''Return the list of lines for a single string or event.'''
+        if isinstance(item, basestring):
+            return [item]
+
+        return self._dispatch[type(item)](item)
+
+    def render_all(self, items):
+        '''Return the list of lines for a list of strings and events.'''
+        lines = []
+        for item in items:
+            if isinstance(item, basestring):
+                lines.append(item)
+            else:
+                lines += self._dispatch[type(item)](item)
+
+        return lines
+
+    def front(self, card):
+        '''the face of the card, e.g. a red "R3".'''
+        return self.markup.glyphs[(card.color, card.number, None)]
+
+    def card(self, card):
+        '''the face and the mark of the card, e.g. a red "R3" and "/B".'''
+        return self.markup.glyphs[(card.color, card.number, card.mark)]
+
+    def _render_CardPlayed(self, e):
+        if e.success:
+            return ['%s successfully added %s to the %s group.' %
+                    (e.nick, self.card(e.card), e.card.color)]
+
+        return ['%s guessed wrong with %s! One storm token flipped up!' %
+                (e.nick, self.card(e.card))]
+
+    def _render_CardDiscarded(self, e):
+        return ['%s has discarded %s' % (e.nick, self.card(e.card))]
+
+    def _render_CardDrawn(self, e):
+        return ['%s drew a new card from the deck into his or her hand.' % e.nick]
+
+    def _render_HintGiven(self, e):
+        plural = 's ' if len(e.marks) > 1 else ' '
+        is_are = 'are ' if len(e.marks) > 1 else 'is '
+        a = 'a ' if isinstance(e.hint, int) else ''
+        return ['%s has given %s a hint: your card%s%s %s%s%s' % (
+                e.nick, e.player, plural, ', '.join(e.marks), is_are, a,
+                str(e.hint))]
+
+    def _render_TokensChanged(self, e):
+        if e.bonus:
+            return ['Bonus for finishing %s group: one note token '
+                    'flipped up!' % e.bonus]
+
+        return []
+
+    def _segment(self, cache, name, version, render, *args):
+        '''Return the text of segment name from cache if it was rendered
+        at version, else render(*args) it and keep it.'''
+        key = (self._cache_key, name)
+        hit = cache.get(key)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+
+        text = render(*args)
+        cache[key] = (version, text)
+        return text
+
+    def _table_text(self, colors, table):
+        glyphs = self.markup.glyphs
+        cardstrs = list()
+        for color, top in zip(colors, table):
+            if top:
+                cardstrs.append(''.join([glyphs[(color, n, None)]
+                                         for n in xrange(1, top+1)]))
+
+        if not cardstrs:
+            return 'Table: empty'
+
+        return 'Table: %s' % ', '.join(cardstrs)
+
+    def _discards_text(self, discards):
+        glyphs = self.markup.glyphs
+        return ', '.join([glyphs[(c.color, c.number, None)] for c in discards])
+
+    def _tokens_text(self, e):
+        key = (e.notes, e.max_notes, e.storms, e.max_storms)
+        text = self._tokens.get(key)
+        if text is None:
+            text = self._tokens[key] = 'Notes: %s, Storms: %s' % (
+                self.notes_down * (e.max_notes - e.notes) + self.notes_up * e.notes,
+                self.storms_up * e.storms + self.storms_down * (e.max_storms - e.storms))
+
+        return text
+
+    def _render_TableState(self, e):
+        lines = []
+        lines.append(self._segment(e.cache, 'table', e.table_version,
+                                   self._table_text, e.colors, e.table))
+
+        lines.append('%s, %d cards remaining.' % (self._tokens_text(e), e.deck_size))
+
+        if e.discards:
+            lines.append('Discard pile: %s. (size is %d)' % (
+                self._segment(e.cache, 'discards', e.discards_version,
+                              self._discards_text, e.discards),
+                len(e.discards)))
+
+        if e.turn:
+            lines.append('It is %s\'s turn to play.' % e.turn)
+        else:
+            lines.append('The game has yet to start. No turns yet.')
+
+        return lines
+
+    def _knowledge_text(self, colors, masks):
+        '''what a (colors, numbers) knowledge mask pair says about a card,
+        e.g. "(R)" or "(WGY2345)". Empty if nothing is known.'''
+        text = self._knowledge.get(masks)
+        if text is None:
+            cmask, nmask = masks
+            text = ''
+            if cmask != 0x1f:
+                text += ''.join([c[0].upper() for i, c in enumerate(colors)
+                                 if cmask & (1 << i)])
+            if nmask != 0x1f:
+                text += ''.join([str(n) for n in xrange(1, 6) if nmask & (1 << (n-1))])
+            text = self._knowledge[masks] = '(%s)' % text if text else ''
+
+        return text
+
+    def _render_HandsShown(self, e):
+        glyphs = self.markup.glyphs
+        know = self._knowledge_text
+        hands = []
+        for name, hand, knowledge in e.hands:
+            if not hand:
+                hands.append('No hand dealt yet.')
+            elif name != e.viewer:
+                hands.append('%s: %s' % (name, ' '.join(
+                    [glyphs[(c.color, c.number, c.mark)] + know(e.colors, k)
+                     for c, k in zip(hand, knowledge)])))
+            elif any(k != (0x1f, 0x1f) for k in knowledge):
+                hands.append('%s: %s' % (name, ' '.join(
+                    [c.mark + know(e.colors, k) for c, k in zip(hand, knowledge)])))
+            else:
+                hands.append('%s: %s' % (name, ''.join([c.mark for c in hand])))
+
+        return ['Current hands: %s' % ', '.join(hands)]
+
+    def _render_DiscardPileShown(self, e):
+        if not e.discards:
+            return ['There are no cards in the discard pile.']
+
+        return ['Discards: %s' % self._segment(e.cache, 'discards', e.discards_version,
+                                               self._discards_text, e.discards)]
+
+    def _render_GameEnded(self, e):
+        score = e.score
+        lines = ['-------------------------']
+        lines.append('The game is over. Final score is %d.' % score)
+        if 0 <= score <= 5:
+            lines.append('Oh dear! The crowd booed.')
+        elif 6 <= score <= 10:
+            lines.append('Poor! Hardly any applause.')
+        elif 11 <= score <= 15:
+            lines.append('OK! The audience has seen better.')
+        elif 16 <= score <= 20:
+            lines.append('Good! The audience is pleased!')
+        elif 21 <= score <= 24:
+            lines.append('Very good! The audience is enthusiastic!')
+        elif score == 25:
+            lines.append('Congratulationss! It\'s a perfect game! 25 points!')
+        else:
+            lines.append('Hmm. score should only be in range 0 to 25. Somthing is amiss. '
+                         ' Might as well play again...')
+
+        lines.append('-------------------------')
+        return lines
+
+
+# used by str(event)
+default_renderer = Renderer()
@@ -0,0 +1,164 @@
+'''
+    replay.py rebuilds a game from its seed and the list of actions
+    taken, and steps through it, either headless (as fast as the engine
+    goes) or printing what the players saw, rendered for a terminal.
+
+    Actions are journal records (see journal.py). They are read either
+    from a journal file, one JSON list per line, or from commands, one
+    per line:
+
+        seed 1234
+        join alice
+        join bob
+        start alice
+        play alice A
+        hint alice bob r
+        discard bob C
+        swap bob A B
+        move bob A 2
+        sort bob
+        undo alice
+        leave alice
+
+    Usage:
+        r = Replay(actions, seed=1234)
+        for action, (pub, priv) in r:
+            ...
+        r.game
+'''
+import argparse
+import json
+import sys
+import time
+
+import journal
+from bot_commands import card, hint, slot, word
+from hanabi import Game
+from renderer import Renderer
+from text_markup import xterm_markup
+
+# command --> converters for its arguments
+_schemas = {
+    'seed': [int],
+    'join': [word],
+    'leave': [word],
+    'start': [word],
+    'play': [word, card],
+    'discard': [word, card],
+    'hint': [word, word, hint],
+    'swap': [word, card, card],
+    'move': [word, card, slot],
+    'sort': [word],
+    'undo': [word],
+}
+
+
+def parse_action(line):
+    '''Return the record for a command line or a journal line.'''
+    line = line.strip()
+    if line.startswith('['):
+        return tuple(journal._str(json.loads(line)))
+
+    words = line.split()
+    if not words or words[0] not in _schemas:
+        raise ValueError('Unknown action: %s' % line)
+
+    schema = _schemas[words[0]]
+    if len(words) - 1 != len(schema):
+        raise ValueError('Wrong number of arguments: %s' % line)
+
+    return tuple([words[0]] + [conv(a) for conv, a in zip(schema, words[1:])])
+
+
+def read_actions(fd):
+    '''Return the records in fd, skipping blank lines and # comments.'''
+    return [parse_action(l) for l in fd if l.strip() and not l.startswith('#')]
+
+
+class Replay(object):
+    '''Steps a Game through a list of actions.'''
+    def __init__(self, actions, seed=None, deck=None):
+        self.game = Game(seed=seed, deck=deck)
+        self.actions = list(actions)
+        self.pos = 0
+
+    def step(self):
+        '''Apply the next action. Return (action, (pub, priv)).'''
+        action = self.actions[self.pos]
+        self.pos += 1
+        return action, journal.apply_record(self.game, action)
+
+    def run(self, until=None):
+        '''Apply the actions up to until (or all of them) without looking
+        at the output. Return the number applied.'''
+        end = len(self.actions) if until is None else min(until, len(self.actions))
+        start = self.pos
+        while self.pos < end:
+            self.step()
+
+        return end - start
+
+    def __iter__(self):
+        while self.pos < len(self.actions):
+            yield self.step()
+
+
+def summary(game, renderer):
+    '''A few lines describing the state of game.'''
+    lines = ['Seed: %d' % game.seed]
+    lines += ['%s: %s' % (nick, ' '.join(renderer.card(c) for c in game.hand(nick)))
+              for nick in game.players()]
+    lines += renderer.render_all(game.get_table()[0])
+    if game.game_over():
+        lines.append('The game is over. Score: %d' % game.score)
+
+    return lines
+
+
+def main(argv=None):
+    desc = 'Replay a game of Hanabi from its seed and actions.'
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument('actions', nargs='?', default='-',
+                           help='A journal or a file of commands. Default is stdin.')
+    argparser.add_argument('-s', '--seed', type=int,
+                           help='The seed of the game, if the actions do not set it.')
+    argparser.add_argument('-d', '--deck',
+                           help='An explicit deck order, e.g. "r1w1b2...".')
+    argparser.add_argument('-u', '--until', type=int,
+                           help='Stop after this many actions.')
+    argparser.add_argument('-r', '--render', action='store_true',
+                           help='Show the game output for each action.')
+    args = argparser.parse_args(argv)
+
+    if args.actions == '-':
+        actions = read_actions(sys.stdin)
+    else:
+        with open(args.actions) as fd:
+            actions = read_actions(fd)
+
+    deck = journal.decode_cards(args.deck) if args.deck else None
+    replay = Replay(actions, seed=args.seed, deck=deck)
+    if args.until is not None:
+        replay.actions = replay.actions[:args.until]
+
+    renderer = Renderer(xterm_markup())
+    start = time.time()
+    if args.render:
+        for action, (pub, priv) in replay:
+            print '>>> %s' % ' '.join(str(a) for a in action)
+            for l in renderer.render_all(pub):
+                print l
+            for l in renderer.render_all(priv):
+                print '(to %s) %s' % (action[1], l)
+    else:
+        replay.run()
+
+    elapsed = time.time() - start
+    for l in summary(replay.game, renderer):
+        print l
+
+    if not args.render:
+        print 'Replayed %d actions in %.3f seconds.' % (replay.pos, elapsed)
+
+if __name__ == '__main__':
+    sys.exit(main())
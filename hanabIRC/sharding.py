@@ -0,0 +1,296 @@
+'''
+    sharding.py keeps the bot's games, either in the bot process
+    (LocalGames) or spread over worker processes (GameShards).
+
+    Both are dicts of channel --> game and both run game methods with
+    submit(channel, method, args, callback), which calls
+    callback(output) with the (public, private) output of the method.
+
+    LocalGames calls the Game method right away. GameShards sends the
+    call to the worker process that owns the channel's game (picked by
+    hashing the channel name) and returns at once; the worker runs it,
+    renders the output to text and sends it back, and the callback is
+    called from the bot's event loop as soon as the reply can be read
+    from the worker's pipe. So a slow game only holds up the channels on
+    its own worker.
+
+    For GameShards the values are GameProxy objects that answer the
+    read only questions the bot asks between commands (game_over(),
+    has_started(), players(), ...) from the state the worker sent back
+    with its last reply.
+
+    Given a journal directory, both keep a journal.Journal of each game
+    in the process that owns the game, and restore() brings back the
+    games journaled there. Given an archive directory, retire() writes
+    the game there (see lifecycle.py) before dropping it.
+'''
+import logging
+import traceback
+import zlib
+from collections import deque
+from multiprocessing import Process, Pipe
+
+import journal
+from lifecycle import Archive
+from renderer import Renderer
+from text_markup import irc_markup
+
+log = logging.getLogger(__name__)
+
+
+class LocalGames(dict):
+    '''channel --> Game, all in this process.'''
+    def __init__(self, journal_dir=None, archive_dir=None):
+        dict.__init__(self)
+        self.journal = journal.Journal(journal_dir) if journal_dir else None
+        self.archive = Archive(archive_dir) if archive_dir else None
+
+    def __setitem__(self, channel, game):
+        if self.get(channel) is not game:
+            if self.journal:
+                self.journal.attach(channel, game)
+            if self.archive:
+                self.archive.attach(channel, game)
+
+        dict.__setitem__(self, channel, game)
+
+    def __delitem__(self, channel):
+        dict.__delitem__(self, channel)
+        if self.journal:
+            self.journal.end(channel)
+        if self.archive:
+            self.archive.forget(channel)
+
+    def retire(self, channel, reason):
+        '''Drop the game in channel, archiving it first.'''
+        if self.archive:
+            self.archive.write(channel, self[channel], reason)
+        del self[channel]
+
+    def restore(self):
+        '''Add the games in the journal directory. Return their channels.'''
+        restored = []
+        if self.journal:
+            for channel, game, records in journal.load(self.journal.directory, records=True):
+                self._restore(channel, game, records)
+                restored.append(channel)
+
+        return restored
+
+    def _restore(self, channel, game, records):
+        dict.__setitem__(self, channel, game)
+        if self.journal:
+            self.journal.attach(channel, game, new=False)
+        if self.archive:
+            self.archive.attach(channel, game, records)
+
+    def submit(self, channel, method, args, callback):
+        callback(getattr(self[channel], method)(*args))
+
+    def close(self):
+        if self.journal:
+            self.journal.close()
+
+
+def _summary(game):
+    '''The read only state of game that GameProxy answers from.'''
+    return {
+        'game_over': game.game_over(),
+        'has_started': game.has_started(),
+        'players': list(game.players()),
+        'turn': game.turn(),
+        'turn_order': list(game.turn_order),
+    }
+
+
+def _worker(conn, journal_dir, archive_dir):
+    '''Worker process main loop. Owns the games for its channels.'''
+    games = LocalGames(journal_dir, archive_dir)
+    renderer = Renderer(irc_markup())
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+
+        if msg is None:
+            break
+
+        op, channel, args = msg
+        if op == 'set':
+            games[channel] = args
+        elif op == 'restore':
+            games._restore(channel, *args)
+        elif op == 'del':
+            if channel in games:
+                del games[channel]
+        elif op == 'retire':
+            if channel in games:
+                games.retire(channel, args)
+        elif op == 'call':
+            method, margs = args
+            if channel not in games:
+                # retired or deleted while the call was on its way.
+                conn.send(('ok', (['There is no active game in %s.' % channel], []), None))
+                continue
+
+            try:
+                game = games[channel]
+                pub, priv = getattr(game, method)(*margs)
+                reply = ('ok', (renderer.render_all(pub), renderer.render_all(priv)),
+                         _summary(game))
+            except Exception:
+                reply = ('error', traceback.format_exc(), None)
+
+            conn.send(reply)
+
+    games.close()
+
+
+class GameProxy(object):
+    '''Stands in for a Game that lives in a worker process.'''
+    def __init__(self, summary):
+        self.summary = summary
+
+    def game_over(self):
+        return self.summary['game_over']
+
+    def has_started(self):
+        return self.summary['has_started']
+
+    def players(self):
+        return self.summary['players']
+
+    def in_game(self, nick):
+        return nick in self.summary['players']
+
+    def turn(self):
+        return self.summary['turn']
+
+    def player_turn(self):
+        return self.summary['turn_order'][0]
+
+
+class GameShards(object):
+    '''
+    channel --> GameProxy, with the games themselves spread over workers
+    processes. watch(fileobj, func) must run func from the bot's event
+    loop each time fileobj has data to read, and stop when func is None;
+    it is given the workers' pipes, so replies are handled as they arrive.
+    '''
+    def __init__(self, workers, watch, journal_dir=None, archive_dir=None):
+        self._watch = watch
+        self._journal_dir = journal_dir
+        self._proxies = dict()
+        self._workers = []
+        for i in xrange(workers):
+            parent, child = Pipe()
+            p = Process(target=_worker, args=(child, journal_dir, archive_dir),
+                        name='hanabi-shard-%d' % i)
+            p.daemon = True
+            p.start()
+            child.close()
+            # (pipe, process, callbacks waiting for replies, in order)
+            worker = (parent, p, deque())
+            self._workers.append(worker)
+            watch(parent, lambda worker=worker: self._read(worker))
+
+    def _worker_for(self, channel):
+        return self._workers[zlib.crc32(channel) % len(self._workers)]
+
+    # dict interface
+    def __contains__(self, channel):
+        return channel in self._proxies
+
+    def __getitem__(self, channel):
+        return self._proxies[channel]
+
+    def __setitem__(self, channel, game):
+        '''Hand a new Game to its worker.'''
+        self._worker_for(channel)[0].send(('set', channel, game))
+        self._proxies[channel] = GameProxy(_summary(game))
+
+    def __delitem__(self, channel):
+        del self._proxies[channel]
+        self._worker_for(channel)[0].send(('del', channel, None))
+
+    def retire(self, channel, reason):
+        '''Drop the game in channel; its worker archives it first.'''
+        del self._proxies[channel]
+        self._worker_for(channel)[0].send(('retire', channel, reason))
+
+    def __iter__(self):
+        return iter(self._proxies)
+
+    def __len__(self):
+        return len(self._proxies)
+
+    def keys(self):
+        return self._proxies.keys()
+
+    def values(self):
+        return self._proxies.values()
+
+    def items(self):
+        return self._proxies.items()
+
+    def iteritems(self):
+        return self._proxies.iteritems()
+
+    def get(self, channel, default=None):
+        return self._proxies.get(channel, default)
+
+    def restore(self):
+        '''Hand the games in the journal directory to their workers. Return
+        their channels.'''
+        restored = []
+        if self._journal_dir:
+            for channel, game, records in journal.load(self._journal_dir, records=True):
+                self._worker_for(channel)[0].send(('restore', channel, (game, records)))
+                self._proxies[channel] = GameProxy(_summary(game))
+                restored.append(channel)
+
+        return restored
+
+    def submit(self, channel, method, args, callback):
+        conn, process, waiting = self._worker_for(channel)
+        conn.send(('call', channel, (method, tuple(args))))
+        waiting.append((channel, callback))
+
+    def _read(self, worker):
+        '''Handle the replies that have arrived from worker.'''
+        conn, process, waiting = worker
+        while conn.poll():
+            try:
+                reply = conn.recv()
+            except EOFError:
+                log.critical('Game worker %s has stopped.', process.name)
+                self._watch(conn, None)
+                while waiting:
+                    self._answer(waiting.popleft(), ('error', 'the worker stopped', None))
+                return
+
+            self._answer(waiting.popleft(), reply)
+
+    def _answer(self, waiter, reply):
+        channel, callback = waiter
+        status, output, summary = reply
+        if status != 'ok':
+            log.critical('Error in game worker for %s: %s', channel, output)
+            output = (['Does not compute. Unknown error happened in the '
+                       'game in %s.' % channel], [])
+        elif summary is not None and channel in self._proxies:
+            self._proxies[channel].summary = summary
+
+        try:
+            callback(output)
+        except Exception, e:
+            log.critical('Exception handling game output for %s: %s',
+                         channel, e)
+
+    def close(self):
+        '''Stop the worker processes.'''
+        for conn, process, waiting in self._workers:
+            self._watch(conn, None)
+            conn.send(None)
+            process.join(1)
@@ -0,0 +1,216 @@
+'''
+    simulator.py runs complete games of Hanabi without IRC.
+
+    Games are driven through the same hanabi.Game API the bot uses
+    (start_game, play_card, discard_card, hint_player) with a scripted
+    policy choosing each player's action. Nothing is printed per move;
+    a batch of games is spread across a multiprocessing pool and only
+    the throughput and score distribution are reported.
+
+    A policy is a function policy(game, nick, rng) that returns the
+    action for nick as a tuple, one of:
+        ('play', mark)
+        ('discard', mark)
+        ('hint', player, hint)
+
+    Policies are looked up by name in the policies dict so they can be
+    named on the command line and passed to worker processes.
+'''
+import argparse
+import logging
+import random
+import sys
+import time
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+
+from engine import DEFAULT_RULES, CARD_DISTRIBUTION
+from hanabi import Game
+
+log = logging.getLogger(__name__)
+
+
+def random_policy(game, nick, rng):
+    '''Pick any action at random. Only gives hints that will be accepted.'''
+    state = game.state
+    hand = state.hand(nick)
+    hints = _possible_hints(state, nick) if state.notes else []
+    choice = rng.randint(0, 2)
+    if choice == 2 and hints:
+        return rng.choice(hints)
+    elif choice == 1:
+        return ('discard', rng.choice(hand).mark)
+
+    return ('play', rng.choice(hand).mark)
+
+
+def cheat_policy(game, nick, rng):
+    '''Look at our own hand. Play a playable card if there is one, else
+    give a hint while notes are up, else discard the least useful card.'''
+    state = game.state
+    hand, table = state.hand(nick), state.table
+    for c in hand:
+        if c.number == table[Game._color_index[c.color]] + 1:
+            return ('play', c.mark)
+
+    hints = _possible_hints(state, nick) if state.notes else []
+    if hints:
+        return rng.choice(hints)
+
+    # discard a card that can never be played, else the highest card.
+    for c in hand:
+        if c.number <= table[Game._color_index[c.color]]:
+            return ('discard', c.mark)
+
+    return ('discard', max(hand, key=lambda c: c.number).mark)
+
+
+policies = {
+    'random': random_policy,
+    'cheat': cheat_policy,
+}
+
+
+def _possible_hints(state, nick):
+    '''Return all hint actions nick can give that match at least one card.'''
+    hints = []
+    for p, hand in zip(state.players, state.hands):
+        if p == nick:
+            continue
+
+        for hint in set([c.color for c in hand] + [c.number for c in hand]):
+            hints.append(('hint', p, hint))
+
+    return hints
+
+
+def run_game(policy, num_players, seed, max_turns=500, rules=DEFAULT_RULES,
+             card_distribution=CARD_DISTRIBUTION):
+    '''Play one game to the end, by rules and with card_distribution cards of
+    each color. Return a dict with the score, number of turns taken, and
+    storms flipped.'''
+    rng = random.Random(seed)
+    game = Game(seed=seed, rules=rules)
+    if list(card_distribution) != list(game.card_distribution):
+        game.card_distribution = card_distribution
+        game._new_deck(seed)
+
+    nicks = ['player_%d' % i for i in range(1, num_players+1)]
+    for nick in nicks:
+        game.add_player(nick)
+
+    game.start_game(nicks[0])
+
+    turns = 0
+    while not game.game_over() and turns < max_turns:
+        nick = game.player_turn()
+        action = policy(game, nick, rng)
+        if action[0] == 'play':
+            game.play_card(nick, action[1])
+        elif action[0] == 'discard':
+            game.discard_card(nick, action[1])
+        else:
+            game.hint_player(nick, action[1], action[2])
+
+        # an action the engine refused leaves the turn unchanged. Discard
+        # instead so a bad policy cannot stall the game.
+        if not game.game_over() and game.player_turn() == nick:
+            game.discard_card(nick, game.hand(nick)[0].mark)
+
+        turns += 1
+
+    return {'score': game.score, 'turns': turns, 'storms': game.storms}
+
+
+def _run_games(args):
+    '''worker entry point: play games for each seed in the chunk.'''
+    policy_name, num_players, seeds = args
+    policy = policies[policy_name]
+    return [run_game(policy, num_players, seed) for seed in seeds]
+
+
+def run_batch(policy_name, num_players, games, processes=None, seed=0,
+              chunksize=50):
+    '''Play games games across a pool of processes. Return a dict
+    with the number of games, elapsed seconds, games per second and the
+    score distribution (score --> count).'''
+    seeds = range(seed, seed + games)
+    chunks = [(policy_name, num_players, seeds[i:i+chunksize])
+              for i in xrange(0, len(seeds), chunksize)]
+
+    start = time.time()
+    if processes == 1:
+        results = map(_run_games, chunks)
+    else:
+        pool = Pool(processes)
+        try:
+            results = pool.map(_run_games, chunks)
+        finally:
+            pool.close()
+            pool.join()
+
+    elapsed = time.time() - start
+
+    scores = defaultdict(int)
+    for chunk in results:
+        for r in chunk:
+            scores[r['score']] += 1
+
+    return {
+        'games': games,
+        'elapsed': elapsed,
+        'games_per_sec': games / elapsed if elapsed else float('inf'),
+        'scores': dict(scores),
+    }
+
+
+def report(stats):
+    '''Return the batch results as a list of strings.'''
+    scores = stats['scores']
+    total = sum(s * n for s, n in scores.iteritems())
+    lines = ['%d games in %.2f seconds (%.1f games/sec).' % (
+        stats['games'], stats['elapsed'], stats['games_per_sec'])]
+    lines.append('Score mean %.2f, min %d, max %d.' % (
+        float(total) / stats['games'], min(scores), max(scores)))
+    for s in sorted(scores):
+        lines.append('%2d: %6d %s' % (s, scores[s],
+                                      '#' * (60 * scores[s] / stats['games'])))
+
+    return lines
+
+
+def main(argv=None):
+    desc = 'Play many games of Hanabi with scripted players.'
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument('-g', '--games', type=int, default=1000,
+                           help='The number of games to play.')
+    argparser.add_argument('-p', '--players', type=int, default=3,
+                           choices=range(2, Game().max_players+1),
+                           help='The number of players in each game.')
+    argparser.add_argument('--policy', default='cheat',
+                           choices=sorted(policies.keys()),
+                           help='How the players choose their actions.')
+    argparser.add_argument('-j', '--processes', type=int, default=cpu_count(),
+                           help='The number of worker processes.')
+    argparser.add_argument('-s', '--seed', type=int, default=0,
+                           help='The seed of the first game.')
+    argparser.add_argument('-b', '--batched', action='store_true',
+                           help='Play the games in lockstep with the NumPy engine '
+                           '(batch.py), in this process. Cheat policy only.')
+    args = argparser.parse_args(argv)
+    if args.batched and args.policy != 'cheat':
+        argparser.error('--batched only plays the cheat policy')
+
+    if args.batched:
+        import batch
+        stats = batch.simulate(args.games, args.players, seed=args.seed)
+    else:
+        stats = run_batch(args.policy, args.players, args.games,
+                          processes=args.processes, seed=args.seed)
+    for l in report(stats):
+        print l
+    if 'turns' in stats:
+        print '%.0f turns/sec.' % (stats['turns'] / stats['elapsed'])
+
+if __name__ == '__main__':
+    sys.exit(main())
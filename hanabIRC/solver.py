@@ -0,0 +1,436 @@
+'''
+    solver.py finds the best score a game of Hanabi could have reached,
+    to grade finished games against it.
+
+    The solver plays with perfect information: every hand and the deck
+    order are known, so a hint tells nobody anything and only spends a
+    note to pass the turn. What is left is a search over plays, discards
+    and passes, with:
+
+    - a compact position: the hands as sorted tuples of card codes
+      (color index * 5 + number - 1), starting at the player to move,
+      the number of cards drawn, the table and the notes. Storms never
+      change, as a misplay is never better than a discard of the same
+      card. The score is the sum of the table.
+    - a transposition table of the positions searched, with the bounds
+      of their best score found so far.
+    - move ordering: plays, lowest first, then discards of cards that
+      can never be played, a pass, and the other discards, copies of
+      cards held or still in the deck first.
+    - pruning: a position is searched only if its upper bound is above
+      the score looked for. The bound is the smallest of 25, the score
+      plus the cards left to draw, and how far the colors can still be
+      built with the cards in the hands and the deck, given that the game
+      ends when the last card is drawn: a card drawn at draw d can only
+      be played in the plays and discards after it.
+
+    A greedy playout gives a first score. Then each score from the upper
+    bound of the deal down to it is looked for in turn, until one is
+    reached: a null window search that stops as soon as the score is
+    reached or proved out of reach. The first moves are searched in
+    rounds with a node budget that doubles every round, so that a move
+    that cannot be decided quickly does not hold up the others. solve()
+    can instead give each first move to a process of a multiprocessing
+    pool.
+
+    Usage:
+        result = solve(game.state)
+        result.score, result.exact, result.upper
+        for entry, result in grade_archive('games-2026-10.jsonl'):
+            ...
+'''
+import argparse
+import json
+import logging
+import sys
+import time
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+
+import journal
+from engine import COLOR_INDEX, MAX_SCORE
+from hanabi import Game
+
+log = logging.getLogger(__name__)
+
+# score: the best score found. exact: True if it is proved the best
+# there is, else upper is the best bound proved. nodes: positions searched.
+Result = namedtuple('Result', 'score exact upper nodes elapsed')
+
+
+class OutOfNodes(Exception):
+    pass
+
+
+def card_code(card):
+    return COLOR_INDEX[card.color] * 5 + card.number - 1
+
+
+class Solver(object):
+    '''The search from positions of one deal, given the deck as card codes.'''
+    def __init__(self, deck, max_notes, max_nodes=None):
+        self.deck = tuple(deck)
+        self.max_notes = max_notes
+        self.max_nodes = max_nodes
+        self.nodes = 0
+        self.memo = dict()          # position --> (lower, upper) bounds of its best score
+
+        # where the first copy of each card is in the deck from each draw
+        # on, if it can still be played: any but the last card.
+        first = dict()
+        self._first_from = [None] * (len(self.deck) + 1)
+        for d in range(len(self.deck), -1, -1):
+            if d < len(self.deck) - 1:
+                first[self.deck[d]] = d
+            self._first_from[d] = dict(first)
+        # how many of each card are in the deck from each draw on.
+        counts = [0] * MAX_SCORE
+        self._counts_from = [tuple(counts)]
+        for code in reversed(self.deck):
+            counts[code] += 1
+            self._counts_from.append(tuple(counts))
+        self._counts_from.reverse()
+
+    def position(self, state):
+        '''The position of an engine.State that is being played.'''
+        hands = tuple(tuple(sorted(card_code(c) for c in state.hand(nick)))
+                      for nick in state.turn_order)
+        return (hands, state.drawn, tuple(state.table), state.notes)
+
+    def _arrivals(self, hands, drawn, table):
+        '''For each color, the draws at which the cards still to be played
+        on it can be played from, for as far as it can be built. -1 for
+        cards held.'''
+        held = set()
+        for hand in hands:
+            held.update(hand)
+
+        first = self._first_from[drawn]
+        arrivals = []
+        for color, top in enumerate(table):
+            base, at, times = color * 5, -1, []
+            while top < 5:
+                code = base + top
+                if code not in held:
+                    if code not in first:
+                        break
+                    at = max(at, first[code])
+                times.append(at)
+                top += 1
+            arrivals.append(times)
+
+        return arrivals
+
+    def _reach(self, hands, drawn, table):
+        '''How high each color can still be built.'''
+        return [top + len(times) for top, times in
+                zip(table, self._arrivals(hands, drawn, table))]
+
+    def upper_bound(self, pos):
+        '''The most points that can be scored from pos. A card drawn at draw d
+        can only be played in the len(deck) - 1 - d plays and discards left
+        after it, so for each d no more than that many of the cards still
+        to play can come at or after d.'''
+        hands, drawn, table, notes = pos
+        times = sorted(t for ts in self._arrivals(hands, drawn, table) for t in ts)
+        best = min(len(times), len(self.deck) - drawn)
+        last = len(self.deck) - 1
+        for i, t in enumerate(times):
+            if t >= 0 and i + last - t < best:
+                best = i + last - t
+
+        return min(MAX_SCORE, sum(table) + best)
+
+    def moves(self, pos):
+        '''The moves worth trying from pos, best first, as (position, score)
+        pairs. The position is None if the move ends the game.'''
+        hands, drawn, table, notes = pos
+        hand, rest = hands[0], hands[1:]
+        last = drawn + 1 == len(self.deck)
+        new = self.deck[drawn] if drawn < len(self.deck) else None
+        score = sum(table)
+
+        plays, trash, others = [], [], []
+        reach = None
+        for code in sorted(set(hand), key=lambda c: (c % 5, c)):
+            color, number = divmod(code, 5)
+            if number == table[color]:
+                plays.append(code)
+                continue
+
+            if reach is None:
+                reach = self._reach(hands, drawn, table)
+            if number < table[color] or number >= reach[color]:
+                trash.append(code)
+            else:
+                others.append(code)
+
+        moves = []
+        for code in plays:
+            color, number = divmod(code, 5)
+            if score + 1 == MAX_SCORE or last:
+                moves.append((None, score + 1))
+                continue
+
+            new_table = table[:color] + (number + 1,) + table[color+1:]
+            new_notes = min(notes + 1, self.max_notes) if number == 4 else notes
+            moves.append(((rest + (self._replaced(hand, code, new),), drawn + 1,
+                           new_table, new_notes), score + 1))
+
+        passing = [((rest + (hand,), drawn, table, notes - 1), score)] if notes else []
+        if last:
+            # any discard ends the game.
+            return moves + [(None, score)] + passing
+
+        discard_notes = min(notes + 1, self.max_notes)
+        discards = [((rest + (self._replaced(hand, code, new),), drawn + 1, table,
+                      discard_notes), score)
+                    for code in trash[:1] + sorted(others, key=lambda c: self._spare(hands, drawn, c))]
+        moves.extend(discards[:len(trash[:1])])
+        moves.extend(passing)
+        moves.extend(discards[len(trash[:1]):])
+        return moves
+
+    def _spare(self, hands, drawn, code):
+        '''Sort key of the discards that are not trash: cards with other
+        copies held or still to come first, then high cards first.'''
+        copies = self._counts_from[drawn][code] + sum(h.count(code) for h in hands) - 1
+        return (0 if copies else 1, -(code % 5))
+
+    @staticmethod
+    def _replaced(hand, code, new):
+        hand = list(hand)
+        hand.remove(code)
+        hand.append(new)
+        hand.sort()
+        return tuple(hand)
+
+    def greedy(self, pos):
+        '''The score of playing the first move of each position to the end.'''
+        while pos is not None:
+            pos, score = self.moves(pos)[0]
+
+        return score
+
+    def search(self, pos, alpha):
+        '''Whether the best score from pos is above alpha: if the value
+        returned is above alpha, the best score is at least that, else it is
+        at most that.'''
+        score = sum(pos[2])
+        lower, upper = self.memo.get(pos) or (score, self.upper_bound(pos))
+        if lower > alpha or upper <= alpha:
+            return lower if lower > alpha else upper
+
+        self.nodes += 1
+        if self.max_nodes and self.nodes > self.max_nodes:
+            raise OutOfNodes()
+
+        # the score never goes down, so it is always reached.
+        best = score
+        for child, score in self.moves(pos):
+            if child is not None:
+                score = self.search(child, alpha)
+            if score > best:
+                best = score
+                if best > alpha:
+                    break
+
+        if best > alpha:
+            self.memo[pos] = (best, upper)
+        else:
+            self.memo[pos] = (lower, best)
+        return best
+
+    def best(self, pos, floor):
+        '''The best score from pos and the best bound of it proved, (score,
+        score), if it is above floor. Else (floor, floor). Each score from the
+        upper bound down is tried in turn, and the search for it stops as
+        soon as it is reached or proved out of reach. If the search runs out
+        of nodes, return (floor, the best bound proved).'''
+        target = self.upper_bound(pos)
+        try:
+            while target > floor:
+                if self._reaches(pos, target):
+                    return target, target
+                target -= 1
+        except OutOfNodes:
+            return floor, target
+
+        return floor, floor
+
+    def _reaches(self, pos, target, budget=1000):
+        '''Whether target can be reached from pos. A search can go a long way
+        down a move that cannot reach it before it gives up, so the moves
+        from pos are searched in rounds, each with a node budget that
+        doubles every round, until one of them reaches target or all of
+        them are proved not to. What a round finds is kept for the next.'''
+        pending = []
+        for child, score in self.moves(pos):
+            if score >= target:
+                return True
+            elif child is not None:
+                pending.append(child)
+
+        limit = self.max_nodes
+        try:
+            while pending:
+                for child in list(pending):
+                    self.max_nodes = self.nodes + budget
+                    if limit:
+                        self.max_nodes = min(self.max_nodes, limit)
+                    try:
+                        if self.search(child, target - 1) >= target:
+                            return True
+                        pending.remove(child)
+                    except OutOfNodes:
+                        if limit and self.nodes >= limit:
+                            raise
+                budget *= 2
+        finally:
+            self.max_nodes = limit
+
+        return False
+
+
+def _solve_move(args):
+    '''worker entry point: the best score from a position after a first move.'''
+    deck, max_notes, max_nodes, pos, floor = args
+    solver = Solver(deck, max_notes, max_nodes)
+    score, upper = solver.best(pos, floor)
+    return score, upper, solver.nodes
+
+
+def solve(state, processes=1, max_nodes=None):
+    '''Solve an engine.State that is being played. Return a Result.
+    With processes other than 1, the first moves are searched by a pool of
+    that many processes (None for one per cpu). max_nodes limits the
+    positions searched by each process, or by each first move in a pool;
+    without it the search can take a long time on an unlucky deal.'''
+    start = time.time()
+    if not state.playing:
+        if state.over:
+            return Result(state.score, True, state.score, 0, 0.0)
+        raise ValueError('The game has not started.')
+
+    solver = Solver([card_code(c) for c in state.deck], state.rules.max_notes, max_nodes)
+    pos = solver.position(state)
+    limit = solver.upper_bound(pos)
+    floor = solver.greedy(pos)
+    if processes == 1 or floor >= limit:
+        score, upper = solver.best(pos, floor)
+        return Result(score, score == upper, upper, solver.nodes, time.time() - start)
+
+    # each first move is searched for a score above the greedy one, until
+    # one of them reaches the upper bound.
+    score = upper = floor
+    tasks = []
+    for child, s in solver.moves(pos):
+        if child is None:
+            score = upper = max(score, s)
+        else:
+            tasks.append((solver.deck, solver.max_notes, max_nodes, child, floor))
+
+    nodes = 0
+    pool = Pool(processes)
+    try:
+        for s, u, n in pool.imap_unordered(_solve_move, tasks):
+            score, upper, nodes = max(score, s), max(upper, u), nodes + n
+            if score >= limit:
+                pool.terminate()
+                upper = limit
+                break
+        else:
+            pool.close()
+    finally:
+        pool.join()
+
+    return Result(score, score == upper, upper, nodes, time.time() - start)
+
+
+def deal(seed, num_players):
+    '''The state at the start of the game with seed and num_players.'''
+    game = Game(seed=seed)
+    nicks = ['player_%d' % i for i in range(1, num_players+1)]
+    for nick in nicks:
+        game.add_player(nick)
+
+    game.start_game(nicks[0])
+    return game.state
+
+
+def archived_deal(entry):
+    '''The state at the start of an archived game (see lifecycle.py): its
+    journal records replayed up to the start. None if it never started.'''
+    game = Game()
+    for record in entry['records']:
+        record = journal._str(record)
+        journal.apply_record(game, record)
+        if record[0] == 'start' and game.has_started():
+            return game.state
+
+    return None
+
+
+def grade_archive(path, processes=1, max_nodes=None, reasons=('over',)):
+    '''Solve the games in the archive file at path that were retired for one
+    of reasons. Yield (entry, Result) for each. A player leaving during a
+    game reshuffles the deck, so such games are graded by their first deal.'''
+    with open(path) as fd:
+        for line in fd:
+            entry = json.loads(line)
+            if reasons and entry['reason'] not in reasons:
+                continue
+
+            state = archived_deal(entry)
+            if state is None:
+                continue
+
+            yield entry, solve(state, processes=processes, max_nodes=max_nodes)
+
+
+def describe(result):
+    '''The result as a string.'''
+    if result.exact:
+        best = '%d points possible (proved' % result.score
+    else:
+        best = '%d to %d points possible (unproved' % (result.score, result.upper)
+
+    return '%s, %d positions in %.2f seconds)' % (best, result.nodes, result.elapsed)
+
+
+def main(argv=None):
+    desc = 'Find the best possible score of games of Hanabi.'
+    argparser = argparse.ArgumentParser(description=desc)
+    argparser.add_argument('archive', nargs='*',
+                           help='Archive files of games to grade, from the archive_dir of a bot.')
+    argparser.add_argument('-s', '--seed', type=int, default=0,
+                           help='The seed of the first deal to solve, without archives.')
+    argparser.add_argument('-g', '--games', type=int, default=1,
+                           help='The number of deals to solve, without archives.')
+    argparser.add_argument('-p', '--players', type=int, default=3,
+                           choices=range(2, Game().max_players+1),
+                           help='The number of players of the deals, without archives.')
+    argparser.add_argument('-a', '--all', action='store_true',
+                           help='Grade all archived games that started, not just finished ones.')
+    argparser.add_argument('-j', '--processes', type=int, default=cpu_count(),
+                           help='The number of worker processes.')
+    argparser.add_argument('-n', '--max-nodes', type=int, default=2000000,
+                           help='The most positions each process searches, 0 for no limit.')
+    args = argparser.parse_args(argv)
+
+    if not args.archive:
+        for seed in range(args.seed, args.seed + args.games):
+            result = solve(deal(seed, args.players), args.processes, args.max_nodes)
+            print 'Seed %d, %d players: %s.' % (seed, args.players, describe(result))
+        return
+
+    reasons = None if args.all else ('over',)
+    for path in args.archive:
+        for entry, result in grade_archive(path, args.processes, args.max_nodes, reasons):
+            when = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['retired']))
+            print '%s %s, %s: scored %d of %s.' % (
+                entry['channel'], when, ', '.join(entry['players']),
+                entry['score'], describe(result))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+'''
+    Benchmarks for the hanabi engine and the text renderers.
+
+    Each benchmark times a single call on a fresh object and reports the
+    best (lowest) time per call in microseconds over a few repeats.
+
+    Save a baseline:
+        bench_hanabi.py --save
+    Compare a later run against it, exiting non zero on regressions:
+        bench_hanabi.py --compare
+
+    Baselines are machine specific, so save one on the machine used for
+    the comparison before making changes.
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from hanabi import Game, Player, Card
+from renderer import Renderer
+from simulator import run_game, policies
+from text_markup import irc_markup, xterm_markup, ascii_markup
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'bench_baseline.json')
+
+players = ['p1', 'p2', 'p3']
+
+
+def new_game(start=True):
+    g = Game()
+    for p in players:
+        g.add_player(p)
+
+    if start:
+        g.start_game(players[0])
+
+    return g
+
+
+def a_hint(g):
+    '''return a (nick, player, hint) the current player can give.'''
+    nick = g.player_turn()
+    other = [p for p in g.turn_order if p != nick][0]
+    return nick, other, g.hand(other)[0].color
+
+
+def full_hand():
+    p = Player('p1')
+    for n in xrange(1, 6):
+        p.add_card(Card.get('red', n))
+
+    p.hand.reverse()
+    return p
+
+# one renderer for the render benchmarks, as the bot keeps, so they time
+# the rendering and not building its dispatch table.
+renderer = Renderer()
+
+# name --> (function making the object for one call, function doing the call)
+benchmarks = {
+    'Game.start_game': (lambda: new_game(False),
+                        lambda g: g.start_game(players[0])),
+    'Game.play_card': (new_game, lambda g: g.play_card(g.player_turn(), 'A')),
+    'Game.discard_card': (new_game, lambda g: g.discard_card(g.player_turn(), 'A')),
+    'Game.hint_player': (new_game, lambda g: g.hint_player(*a_hint(g))),
+    'Game.get_table': (new_game, lambda g: g.get_table()),
+    'Game.get_hands': (new_game, lambda g: g.get_hands(players[0])),
+    'Game.snapshot': (new_game, lambda g: g.snapshot()),
+    'Game.restore': (lambda: (lambda g: (g, g.snapshot()))(new_game()),
+                     lambda (g, snap): g.restore(snap)),
+    'Game.branch': (new_game, lambda g: g.branch()),
+    'render get_table': (lambda: new_game().get_table()[0], renderer.render_all),
+    'render get_hands': (lambda: new_game().get_hands(players[0])[1], renderer.render_all),
+    'Player.add_card': (lambda: Player('p1'), lambda p: p.add_card(Card.get('red', 1))),
+    'Player.card_index': (full_hand, lambda p: p.card_index('e')),
+    'Player.sort_cards': (full_hand, lambda p: p.sort_cards()),
+    'irc_markup.color': (irc_markup, lambda m: m.color('R1', 'red')),
+    'xterm_markup.color': (xterm_markup, lambda m: m.color('R1', 'red')),
+    'ascii_markup.color': (ascii_markup, lambda m: m.color('R1', 'red')),
+    'full game': (lambda: random.randint(0, 1 << 30),
+                  lambda seed: run_game(policies['cheat'], 3, seed)),
+}
+
+# number of calls timed in each repeat.
+counts = {'full game': 20}
+
+
+def run(names, number=2000, repeat=3):
+    '''Run the named benchmarks. Return a dict of name --> usec per call.'''
+    results = dict()
+    for name in names:
+        setup, call = benchmarks[name]
+        n = counts.get(name, number)
+        best = None
+        for i in xrange(repeat):
+            objs = [setup() for j in xrange(n)]
+            start = time.time()
+            for o in objs:
+                call(o)
+
+            t = (time.time() - start) / n * 1e6
+            best = t if best is None else min(best, t)
+
+        results[name] = best
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    '''Return a list of (name, baseline, result) that are slower than
+    baseline by more than threshold (a fraction).'''
+    slow = []
+    for name, t in sorted(results.iteritems()):
+        if name in baseline and t > baseline[name] * (1 + threshold):
+            slow.append((name, baseline[name], t))
+
+    return slow
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(description='Benchmark the hanabi engine.')
+    argparser.add_argument('-b', '--baseline', default=default_baseline,
+                           help='The JSON baseline file.')
+    argparser.add_argument('--save', action='store_true',
+                           help='Save the results as the new baseline.')
+    argparser.add_argument('--compare', action='store_true',
+                           help='Compare the results with the baseline.')
+    argparser.add_argument('-t', '--threshold', type=float, default=0.2,
+                           help='Fraction slower than the baseline that is a '
+                                'regression.')
+    argparser.add_argument('-n', '--number', type=int, default=2000,
+                           help='Number of calls in each repeat.')
+    argparser.add_argument('names', nargs='*', help='Benchmarks to run. Default all.')
+    args = argparser.parse_args(argv)
+
+    names = args.names if args.names else sorted(benchmarks.keys())
+    results = run(names, number=args.number)
+
+    baseline = dict()
+    if args.compare:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+
+    for name in names:
+        line = '%-20s %10.2f usec' % (name, results[name])
+        if name in baseline:
+            line += '  (baseline %.2f, %+.0f%%)' % (
+                baseline[name], 100 * (results[name] / baseline[name] - 1))
+
+        print line
+
+    if args.save:
+        with open(args.baseline, 'w') as fd:
+            json.dump(results, fd, indent=4, sort_keys=True)
+
+        print 'Saved baseline to %s' % args.baseline
+
+    if args.compare:
+        slow = compare(results, baseline, args.threshold)
+        for name, b, r in slow:
+            print 'REGRESSION: %s %.2f usec --> %.2f usec' % (name, b, r)
+
+        return 1 if slow else 0
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,6 +5,7 @@
 '''
 from string import uppercase
 from hanabi import Game, Player, Card
+from engine import set_card
 
 def display(lists):
     for lines in [('Public:', lists[0]), ('Private:', lists[1])]:
@@ -16,8 +17,8 @@ def display(lists):
                 print '\t', l
 
 def show_hands(g):
-    hands = [p.get_hand() for p in g._players.values()]
-    hidden = [p.get_hand(hidden=True) for p in g._players.values()]
+    hands = ['%s: %s' % (n, ' '.join([str(c) for c in g.hand(n)])) for n in g.players()]
+    hidden = ['%s: %s' % (n, ''.join([c.back() for c in g.hand(n)])) for n in g.players()]
     print ' --- '
     print ' Hands: %s' % ', '.join(hands)
     print 'Hidden: %s' % ', '.join(hidden)
@@ -26,28 +27,28 @@ def show_hands(g):
 def show_game(num_players, win=True):
     g = Game()
     [display(g.add_player('player_%d' % i)) for i in range(1, num_players+1)]
-    p1 = g._players[g._players.keys()[0]].name
+    p1 = g.players()[0]
     g.start_game(p1)
 
-    while not g._is_game_over():
+    while not g.game_over():
         for c in Game.colors:
             for i in xrange(1, 6):
                 # get current player
                 p = g.turn_order[0]
 
                 # card 'A' is always first. 
-                g._players[p].sort_cards() 
+                g.sort_cards(p)
 
                 # the fix in in, put the in/correct card at 'A'
                 if win:
-                    g._players[p].hand[0] = Card(c, i, 'A')
+                    g.state = set_card(g.state, p, 0, Card(c, i, 'A'))
                 else:
-                    g._players[p].hand[0] = Card(c, 6-i, 'A')
+                    g.state = set_card(g.state, p, 0, Card(c, 6-i, 'A'))
 
                 show_hands(g)
                 print '%s playing card A' % p
                 display(g.play_card(p, 'A'))
-                if g._is_game_over():
+                if g.game_over():
                     return
 
 # run through a bunch of games.
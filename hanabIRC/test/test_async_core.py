@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+import socket
+import unittest2
+from async_core import AsyncHanabot, EventLoop, parse_line
+from hanabot import HanabotBase
+
+class test_async_core(unittest2.TestCase):
+
+    def setUp(self):
+        self.bot = AsyncHanabot('localhost', 'hanabi', send_rate=1e9, send_burst=10**9)
+        self.sent = []
+        self.bot.connection.send_raw = self.sent.append
+        self.bot.connection.real_nickname = 'hanabot'
+
+    def feed(self, line):
+        self.bot.connection.handle_line(line)
+        sent, self.sent[:] = self.sent[:], []
+        return sent
+
+    def test_parse_line(self):
+        self.assertEqual(('a!u@h', 'PRIVMSG', ['#hanabi', '!play A']),
+                         parse_line(':a!u@h PRIVMSG #hanabi :!play A'))
+        self.assertEqual(('', 'PING', ['irc.example.org']),
+                         parse_line('PING :irc.example.org'))
+
+    def test_watch(self):
+        # a watched file is read as soon as it has data, not at the next
+        # timeout.
+        loop, (a, b) = EventLoop(), socket.socketpair()
+        got = []
+        loop.watch(a, lambda: got.append(a.recv(10)) or loop.stop())
+        loop.call_later(0.01, lambda: b.send('hi'))
+        loop.call_later(5, loop.stop)
+        loop.run(max_wait=10)
+        self.assertEqual(['hi'], got)
+        loop.watch(a, None)
+        self.assertEqual({}, loop.map)
+
+    def test_base(self):
+        # a bot without _call_later fails when it is made, not when it
+        # first schedules something.
+        class Bot(HanabotBase):
+            pass
+        self.assertRaises(TypeError, Bot, 'hanabi')
+
+    def test_commands(self):
+        self.assertEqual(['JOIN #hanabi'], self.feed(':irc 001 hanabot :Welcome'))
+        self.feed(':hanabot!u@h JOIN #hanabi')
+        self.feed(':irc 353 hanabot = #hanabi :hanabot @op alice')
+        self.assertEqual(['op'], self.bot.channels['#hanabi'].opers())
+
+        self.assertEqual(['PONG :irc'], self.feed('PING :irc'))
+        self.assertEqual(['NOTICE #hanabi :New game started by alice. Accepting joins.'],
+                         self.feed(':alice!u@h PRIVMSG #hanabi :!new'))
+        self.feed(':alice!u@h PRIVMSG #hanabi :!join')
+        self.feed(':bob!u@h PRIVMSG #hanabi :!join')
+        sent = self.feed(':alice!u@h PRIVMSG #hanabi :!start')
+        self.assertTrue(sent[0].startswith('NOTICE #hanabi :The Hanabi game has started!'))
+
+    def test_modes(self):
+        self.feed(':hanabot!u@h JOIN #hanabi')
+        self.feed(':irc 353 hanabot = #hanabi :hanabot @op alice bob')
+        self.feed(':op!u@h MODE #hanabi +lo 10 alice')
+        self.assertEqual(['alice', 'op'], sorted(self.bot.channels['#hanabi'].opers()))
+        self.feed(':op!u@h MODE #hanabi -lo+o alice bob')
+        self.assertEqual(['bob', 'op'], sorted(self.bot.channels['#hanabi'].opers()))
+
+    def test_kick_does_not_block(self):
+        self.feed(':hanabot!u@h JOIN #hanabi')
+        self.assertEqual([], self.feed(':op!u@h KICK #hanabi hanabot :bye'))
+        self.assertFalse('#hanabi' in self.bot.channels)
+
+        # rejoin happens from a timer.
+        when, seq, func = self.bot.loop._timers[0]
+        func()
+        self.assertEqual(['JOIN #hanabi', 'NOTICE #hanabi :Why I outta....'], self.sent)
+
+    def test_one_game_per_nick(self):
+        for c in ['#a', '#b']:
+            self.feed(':alice!u@h PRIVMSG %s :!new' % c)
+
+        self.feed(':alice!u@h PRIVMSG #a :!join')
+        self.feed(':carol!u@h PRIVMSG #a :!join')
+        self.assertEqual({'alice': '#a', 'carol': '#a'}, self.bot.player_channels)
+        self.assertEqual(['NOTICE alice :You are already in a game in #a. One game per nick please.'],
+                         self.feed(':alice!u@h PRIVMSG #b :!join'))
+
+        # carol is left alone, so the game is over and frees her too.
+        self.feed(':alice!u@h PRIVMSG #a :!leave')
+        self.assertNotIn('#a', self.bot.games)
+        self.assertEqual({}, self.bot.player_channels)
+        self.assertEqual(['NOTICE #a :New game started by carol. Accepting joins.'],
+                         self.feed(':carol!u@h PRIVMSG #a :!new'))
+
+        self.feed(':alice!u@h PRIVMSG #b :!join')
+        self.feed(':carol!u@h PRIVMSG #b :!join')
+        self.assertEqual({'alice': '#b', 'carol': '#b'}, self.bot.player_channels)
+        self.feed(':alice!u@h PRIVMSG #b :!delete')
+        self.assertEqual({}, self.bot.player_channels)
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import unittest2
+from collections import Counter
+from engine import COLORS
+from hanabi import Game
+from simulator import run_game, policies
+
+try:
+    import numpy
+    import batch
+except ImportError:
+    numpy = None
+
+@unittest2.skipIf(numpy is None, 'numpy is not installed')
+class test_batch(unittest2.TestCase):
+
+    def test_cheat_policy(self):
+        # the same games as the cheat policy plays through a Game.
+        seeds = range(40)
+        for players in range(2, 6):
+            b = batch.from_seeds(seeds, players)
+            while not b.over.all():
+                b.step(*batch.cheat_actions(b))
+            for i, seed in enumerate(seeds):
+                r = run_game(policies['cheat'], players, seed)
+                self.assertEqual([r['score'], r['turns'], r['storms']],
+                                 [b.score()[i], b.turns[i], b.storms[i]])
+
+    def test_step(self):
+        # random actions, some refused, applied to a batch and to Games.
+        rng = numpy.random.RandomState(1)
+        seeds = range(30)
+        games = []
+        for seed in seeds:
+            game = Game(seed=seed)
+            for nick in ['a', 'b', 'c']:
+                game.add_player(nick)
+            game.start_game('a')
+            games.append(game)
+        b = batch.from_states([g.state for g in games])
+
+        while not b.over.all():
+            n = len(games)
+            kind = rng.choice([batch.PLAY, batch.DISCARD, batch.HINT], n, p=[0.1, 0.5, 0.4])
+            slot, target, hint = rng.randint(0, 5, n), rng.randint(0, 3, n), rng.randint(0, 10, n)
+            taken = b.step(kind, slot, target, hint)
+
+            for i, game in enumerate(games):
+                if game.game_over():
+                    continue
+                nick = game.player_turn()
+                if kind[i] == batch.HINT:
+                    h = COLORS[hint[i]] if hint[i] < 5 else hint[i] - 4
+                    game.hint_player(nick, game.state.players[target[i]], h)
+                else:
+                    call = game.play_card if kind[i] == batch.PLAY else game.discard_card
+                    call(nick, game.hand(nick)[slot[i]].mark)
+                self.assertEqual(taken[i], game.player_turn() != nick)
+
+                state = game.state
+                self.assertEqual([[batch.card_code(c) for c in h] for h in state.hands],
+                                 b.hands[i].tolist())
+                self.assertEqual(list(state.table), b.table[i].tolist())
+                self.assertEqual([state.notes, state.storms, state.drawn, state.over],
+                                 [b.notes[i], b.storms[i], b.drawn[i], b.over[i]])
+                discarded = Counter(batch.card_code(c) for c in state.discards)
+                self.assertEqual([discarded[c] for c in range(25)], b.discarded[i].tolist())
+
+        self.assertTrue(all(g.game_over() for g in games))
+
+    def test_deal(self):
+        b = batch.deal(50, 4, numpy.random.RandomState(2))
+        self.assertEqual((50, 4, 4), b.hands.shape)
+        self.assertEqual(sorted(batch.card_code(c) for c in Game(seed=1).deck),
+                         sorted(b.deck[7].tolist()))
+        self.assertEqual(range(4), sorted(b.order[7].tolist()))
+        self.assertEqual(b.deck[7, 4:8].tolist(), b.hands[7, 1].tolist())
+
+        stats = batch.simulate(300, 4, chunksize=128)
+        self.assertEqual(300, sum(stats['scores'].values()))
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import unittest2
+from async_core import AsyncHanabot
+from hanabi import Card
+from engine import set_card
+from bot_commands import ArgError, table, card, hint, slot
+
+class test_bot_commands(unittest2.TestCase):
+
+    def test_converters(self):
+        self.assertEqual('C', card('c'))
+        self.assertRaises(ValueError, card, 'F')
+        self.assertRaises(ValueError, card, 'AB')
+        self.assertEqual(3, slot('3'))
+        self.assertRaises(ValueError, slot, '6')
+        self.assertEqual('red', hint('r'))
+        self.assertEqual('yellow', hint('YELLOW'))
+        self.assertEqual(4, hint('4'))
+        self.assertRaises(ValueError, hint, 'purple')
+        self.assertRaises(ValueError, hint, '0')
+
+    def test_table(self):
+        self.assertIs(table['play'], table['p'])
+        self.assertIs(table['hint'], table['h'])
+        self.assertEqual(['A'], table['p'].parse(['a']))
+        self.assertEqual(['bob', 'green'], table['h'].parse(['bob', 'g']))
+        self.assertEqual(['B', 2], table['move'].parse(['b', '2']))
+        self.assertEqual([], table['new'].parse([]))
+        self.assertEqual(['foo'], table['new'].parse(['foo']))
+        self.assertRaises(ArgError, table['new'].parse, ['foo', 'bar'])
+        self.assertRaises(ArgError, table['play'].parse, [])
+        self.assertRaises(ArgError, table['play'].parse, ['Q'])
+
+    def test_dispatch(self):
+        bot = AsyncHanabot('localhost', 'hanabi', send_rate=1e9, send_burst=10**9)
+        sent = []
+        bot.connection.send_raw = sent.append
+        bot.connection.real_nickname = 'hanabot'
+        for line in [':hanabot!u@h JOIN #hanabi', ':alice!u@h PRIVMSG #hanabi :!new',
+                     ':alice!u@h PRIVMSG #hanabi :!j', ':bob!u@h PRIVMSG #hanabi :!j',
+                     ':alice!u@h PRIVMSG #hanabi :!start']:
+            bot.connection.handle_line(line)
+
+        first = bot.games['#hanabi'].player_turn()
+        other = 'bob' if first == 'alice' else 'alice'
+        # give a hint by short form and color letter.
+        game = bot.games['#hanabi']
+        game.state = set_card(game.state, other, 0, Card.get('red', 1, 'A'))
+        sent[:] = []
+        bot.connection.handle_line(':%s!u@h PRIVMSG #hanabi :!h %s r' % (first, other))
+        self.assertEqual(other, bot.games['#hanabi'].player_turn())
+
+        # bad arguments get the error and the command help.
+        sent[:] = []
+        bot.connection.handle_line(':%s!u@h PRIVMSG #hanabi :!p Q' % other)
+        self.assertEqual('NOTICE %s :Wrong type for argument Q in command play.' % other,
+                         sent[0])
+        self.assertIn('!play card', sent[-1])
+
+        # die is unknown to non ops.
+        sent[:] = []
+        bot.connection.handle_line(':alice!u@h PRIVMSG #hanabi :!die')
+        self.assertIn('I do not understand', sent[0])
+
+        # an op of another channel, or by private message, cannot undo.
+        bot.connection.handle_line(':hanabot!u@h JOIN #other')
+        bot.connection.handle_line(':irc 353 hanabot = #other :hanabot @alice bob')
+        for target in ['#hanabi', 'hanabot']:
+            sent[:] = []
+            bot.connection.handle_line(':alice!u@h PRIVMSG %s :!undo' % target)
+            self.assertIn('I do not understand', sent[0])
+            self.assertEqual(other, bot.games['#hanabi'].player_turn())
+
+        # an op can take back the hint.
+        bot.connection.handle_line(':irc 353 hanabot = #hanabi :hanabot @alice bob')
+        sent[:] = []
+        bot.connection.handle_line(':alice!u@h PRIVMSG #hanabi :!undo')
+        self.assertEqual(first, bot.games['#hanabi'].player_turn())
+        self.assertIn("alice took back %s's hint." % first, sent[0])
+
+if __name__ == '__main__':
+    unittest2.main()
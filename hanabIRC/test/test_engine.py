@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+import random
+import unittest2
+import engine
+from engine import apply, new_state, DEFAULT_RULES
+from hanabi import Game
+from simulator import cheat_policy
+
+class test_engine(unittest2.TestCase):
+
+    def setUp(self):
+        self.game = Game(seed=11)
+        self.state = new_state(self.game.deck)
+        for action in [('join', 'a'), ('join', 'b'), ('join', 'c'),
+                       ('start', 'a', ('b', 'c', 'a'))]:
+            self.state, output = apply(self.state, action)
+
+    def test_pure(self):
+        state = self.state
+        copy = new_state(state.deck)
+        for action in [('join', 'a'), ('join', 'b'), ('join', 'c'),
+                       ('start', 'a', ('b', 'c', 'a'))]:
+            copy = apply(copy, action)[0]
+        self.assertEqual(state, copy)
+        self.assertEqual(hash(state), hash(copy))
+
+        after, (pub, priv) = apply(state, ('play', 'b', 'A'))
+        self.assertEqual(state, copy)
+        self.assertEqual(after, apply(state, ('play', 'b', 'A'))[0])
+        self.assertEqual(1, after.drawn - state.drawn)
+        self.assertEqual(('c', 'a', 'b'), after.turn_order)
+
+        # positions can be kept in dicts and sets.
+        seen = {state: 0, after: 1}
+        self.assertEqual(1, seen[apply(copy, ('play', 'b', 'A'))[0]])
+
+    def test_refused(self):
+        for action, reason in [(('play', 'a', 'A'), "It is not your turn. It is b's turn."),
+                               (('discard', 'b', 'Q'), 'You tried to discard card Q, oops.'),
+                               (('hint', 'b', 'b', 'red'), 'You really want to give a hint '
+                                'to yourself? Too bad no information leak here.'),
+                               (('join', 'd'), 'Game already started.'),
+                               (('start', 'a'), 'The game has already begun.')]:
+            state, (pub, priv) = apply(self.state, action)
+            self.assertIs(self.state, state)
+            self.assertEqual(reason, priv[0])
+
+    def test_rules(self):
+        rules = DEFAULT_RULES._replace(max_notes=4, hand_sizes=(3,) * 6)
+        state = new_state(self.state.deck, rules)
+        for action in [('join', 'a'), ('join', 'b'), ('start', 'a')]:
+            state = apply(state, action)[0]
+        self.assertEqual(('a', 'b'), state.turn_order)
+        self.assertEqual([3, 3], [len(h) for h in state.hands])
+        self.assertEqual(4, state.notes)
+        self.assertEqual(4, engine.table_state(state).max_notes)
+
+    def test_game(self):
+        # a Game is its state plus the random outcomes it picks.
+        rng = random.Random(2)
+        game = Game(seed=5)
+        records = []
+        game.observers.append(records.append)
+        for nick in ['a', 'b', 'c', 'd']:
+            game.add_player(nick)
+        game.start_game('a')
+        game.remove_player('d')
+        while not game.game_over():
+            nick = game.player_turn()
+            action = cheat_policy(game, nick, rng)
+            {'play': game.play_card, 'discard': game.discard_card,
+             'hint': game.hint_player}[action[0]](nick, *action[1:])
+
+        state = new_state(Game(seed=5).deck)
+        for record in records:
+            state, output = apply(state, record)
+        self.assertEqual(game.state, state)
+        self.assertTrue(state.over)
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+import math
+import unittest2
+from engine import DEFAULT_RULES
+from estimator import Estimate, main, make_variants, run, z_score
+from simulator import run_game, policies
+
+class test_estimator(unittest2.TestCase):
+
+    def test_estimate(self):
+        self.assertAlmostEqual(1.96, z_score(0.95), places=2)
+        e = Estimate()
+        scores = [20, 25, 22, 25, 18]
+        for s in scores:
+            e.add(s)
+        mean = sum(scores) / 5.0
+        self.assertAlmostEqual(mean, e.mean)
+        self.assertAlmostEqual(sum((s - mean) ** 2 for s in scores) / 4, e.variance())
+        self.assertAlmostEqual(2 * math.sqrt(e.variance() / 5), e.interval(2))
+        self.assertEqual(0.4, e.perfect_rate())
+        low, high = e.perfect_interval(1.96)
+        self.assertTrue(0 < low < 0.4 < high < 1)
+        self.assertFalse(e.tight(1.96, 0.5))
+        self.assertTrue(e.tight(1.96, 5))
+        self.assertFalse(e.tight(1.96, 5, perfect_tolerance=0.1))
+
+    def test_variants(self):
+        variants = make_variants(players=[2, 6], notes=[8, 10], hand_sizes=[(3,) * 6],
+                                 card_distributions=[[1, 1, 2, 3, 4, 5]])
+        self.assertEqual(4, len(variants))
+        six = variants[-1]
+        self.assertEqual((6, 10, 3), (six.players, six.rules.max_notes, six.rules.max_storms))
+        self.assertEqual(3, six.rules.hand_sizes[6])
+
+        # the variant is played: 18 of the 30 cards are dealt, so the game
+        # ends after 12 plays and discards.
+        r = run_game(policies['cheat'], six.players, 1, rules=six.rules,
+                     card_distribution=six.card_distribution)
+        self.assertTrue(0 < r['score'] <= 12)
+        self.assertEqual(run_game(policies['cheat'], 3, 1),
+                         run_game(policies['cheat'], 3, 1, rules=DEFAULT_RULES))
+
+        # a variant that deals the whole deck has nothing to draw.
+        self.assertRaises(ValueError, make_variants, players=[5], hand_sizes=[(5,) * 6],
+                          card_distributions=[[1, 2, 3, 4, 5]])
+        self.assertRaises(SystemExit, main, ['-p', '5', '-H', '5', '-d', '12345', '-g', '10'])
+
+    def test_run(self):
+        variants = make_variants(notes=[8, 4])
+        updates = list(run(variants, processes=1, chunksize=20, tolerance=100, min_games=40))
+        self.assertEqual(4, len(updates))
+        variant, estimates = updates[-1]
+        self.assertEqual([40, 40], [e.games for e in estimates])
+
+        # a pool plays the same games.
+        last = list(run(variants, processes=2, chunksize=20, tolerance=0, max_games=40))[-1][1]
+        for a, b in zip(estimates, last):
+            self.assertEqual(a.games, b.games)
+            self.assertAlmostEqual(a.mean, b.mean)
+
+        # stops at max_games, or when the caller stops.
+        updates = run(variants, processes=2, chunksize=20, tolerance=0, max_games=30)
+        self.assertEqual([30, 30], [e.games for e in list(updates)[-1][1]])
+        updates = run(variants, processes=2, chunksize=20, tolerance=0)
+        variant, estimates = next(updates)
+        updates.close()
+        self.assertEqual(20, sum(e.games for e in estimates))
+
+if __name__ == '__main__':
+    unittest2.main()
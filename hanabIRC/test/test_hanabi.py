@@ -3,6 +3,10 @@
 import unittest2
 from string import uppercase
 from hanabi import Game, Player, Card
+from engine import set_card
+from renderer import Renderer
+from text_markup import ascii_markup
+from events import CardPlayed, HintGiven, TableState, HandsShown
 
 players = ['p1', 'p2']
 
@@ -16,6 +20,11 @@ class test_hanabi(unittest2.TestCase):
         self.game.start_game(players[0])
         self.game.turn_order = list(players)
 
+    def give(self, nick, i, color, number):
+        '''put a color number card at index i of nick's hand.'''
+        mark = self.game.hand(nick)[i].mark
+        self.game.state = set_card(self.game.state, nick, i, Card.get(color, number, mark))
+
     def getHand(self, h):
         return ' '.join([str(c) for c in h])
 
@@ -27,12 +36,42 @@ class test_hanabi(unittest2.TestCase):
 
     def test_handmgt(self):
         p = Player(players[0])
-        p.hand = [Card('red', i, b) for i, b in zip(xrange(1,6), uppercase[:5])]
+        for i in xrange(1, 6):
+            p.add_card(Card.get('red', i))
         self.assertEqual('ABCDE', self.getBacks(p.hand))
 
         print p.swap_cards('A', 'E')
         self.assertEqual('EBCDA', self.getBacks(p.hand))
 
+    def test_knowledge(self):
+        p = Player(players[0])
+        for c, n in [('red', 1), ('blue', 1), ('red', 3), ('green', 4), ('white', 5)]:
+            p.add_card(Card.get(c, n))
+
+        red, blue = 1 << Game.colors.index('red'), 1 << Game.colors.index('blue')
+        p.learn('red')
+        p.learn(1)
+        self.assertEqual([(red, 0x1), (0x1f & ~red, 0x1), (red, 0x1e),
+                          (0x1f & ~red, 0x1e), (0x1f & ~red, 0x1e)], p.knowledge)
+
+        # knowledge moves with the cards.
+        p.swap_cards('A', 'B')
+        p.move_card('C', 5)
+        self.assertEqual('BADEC', self.getBacks(p.hand))
+        self.assertEqual([(0x1f & ~red, 0x1), (red, 0x1), (0x1f & ~red, 0x1e),
+                          (0x1f & ~red, 0x1e), (red, 0x1e)], p.knowledge)
+        p.sort_cards()
+        self.assertEqual((red, 0x1), p.knowledge[0])
+        p.learn('blue')
+        self.assertEqual((blue, 0x1), p.knowledge[1])
+        self.assertEqual(p.hand[1], p.remove_card(1))
+        self.assertEqual(4, len(p.knowledge))
+
+        lines = Renderer(ascii_markup()).render(HandsShown(
+            players[0], [(p.name, tuple(p.hand), tuple(p.knowledge))], Game.colors))
+        self.assertEqual(['Current hands: %s: A(R1) C(R2345) D(WGY2345) E(WGY2345)' %
+                          players[0]], lines)
+
 
     def test_play(self):
         self.setUpGame()
@@ -41,6 +80,153 @@ class test_hanabi(unittest2.TestCase):
         print self.game.turn()
         print self.game.hint_player(players[1], players[0], 'blue')
 
+    def test_table(self):
+        self.setUpGame()
+        deck_size = len(self.game.deck)
+        self.give(players[0], 0, 'red', 1)
+        self.game.play_card(players[0], 'A')
+        self.assertEqual(1, self.game.table[Game.colors.index('red')])
+        self.assertEqual(deck_size - 1, len(self.game.deck))
+
+        self.give(players[1], 0, 'red', 3)
+        self.game.play_card(players[1], 'A')
+        self.assertEqual(1, self.game.table[Game.colors.index('red')])
+        self.assertEqual(1, self.game.storms)
+        table = self.game.get_table()[0]
+        self.assertTrue(isinstance(table[0], TableState))
+        self.assertEqual('Notes: wwwwwwww, Storms: XOO, %d cards remaining.' % (deck_size - 2),
+                         Renderer().render_all(table)[1])
+
+        self.give(players[1], 0, 'red', 2)
+        self.game.hint_player(players[0], players[1], 'red')
+        self.game.discard_card(players[1], self.game.hand(players[1])[1].mark)
+        self.game.hint_player(players[0], players[1], 'red')
+        self.assertEqual(7, self.game.notes)
+
+    def test_glyphs(self):
+        self.assertEqual('RR3/B', ascii_markup().card('red', 3, 'B'))
+        self.assertEqual('GG2', ascii_markup().card('green', 2))
+        self.assertTrue(ascii_markup().glyphs is ascii_markup().glyphs)
+        self.assertEqual('\x0304R3\x03', str(Card('red', 3).front()))
+
+    def test_render_cache(self):
+        self.setUpGame()
+        r = Renderer(ascii_markup())
+        self.give(players[0], 0, 'red', 1)
+        self.game.play_card(players[0], self.game.hand(players[0])[0].mark)
+        self.game.discard_card(players[1], 'A')
+        before = r.render_all(self.game.get_table()[0])
+
+        hand = self.game.hand(players[1])
+        self.game.hint_player(players[0], players[1], hand[0].number)
+        after = r.render_all(self.game.get_table()[0])
+        self.assertTrue(before[0] is after[0])
+        self.assertNotEqual(before[1], after[1])
+        self.assertEqual(before[2], after[2])
+
+        self.game.discard_card(players[1], 'A')
+        after = r.render_all(self.game.get_table()[0])
+        self.assertEqual('Discard pile: %s. (size is 2)' % ', '.join(
+            [ascii_markup().card(c.color, c.number) for c in self.game.discards]), after[2])
+
+    def test_events(self):
+        self.setUpGame()
+        self.give(players[0], 0, 'red', 1)
+        pub, priv = self.game.play_card(players[0], 'A')
+        self.assertEqual(CardPlayed(players[0], Card.get('red', 1, 'A'), True), pub[0])
+
+        self.give(players[0], 0, 'blue', 2)
+        self.give(players[0], 1, 'blue', 4)
+        hand = self.game.hand(players[0])
+        pub, priv = self.game.hint_player(players[1], players[0], 'blue')
+        self.assertEqual(HintGiven(players[1], players[0], 'blue',
+                                   [c.mark for c in hand if c.color == 'blue']), pub[0])
+
+        lines = Renderer(ascii_markup()).render_all(pub)
+        self.assertEqual('Table: RR1', lines[1])
+        self.assertEqual('Notes: bwwwwwww, Storms: OOO, %d cards remaining.' %
+                         len(self.game.deck), lines[2])
+        self.assertEqual('It is %s\'s turn to play.' % players[0], lines[-1])
+
+    def test_counters(self):
+        import random
+        from simulator import random_policy
+        game, rng = Game(seed=3), random.Random(3)
+        for nick in players[:3]:
+            game.add_player(nick)
+        game.start_game(players[0])
+        while not game.game_over():
+            nick = game.player_turn()
+            action = random_policy(game, nick, rng)
+            if action[0] == 'play':
+                game.play_card(nick, action[1])
+            elif action[0] == 'discard':
+                game.discard_card(nick, action[1])
+            else:
+                game.hint_player(nick, action[1], action[2])
+
+            self.assertEqual(sum(game.table), game.score)
+
+    def test_snapshot(self):
+        def state(game):
+            return game.state
+
+        game = Game(seed=3)
+        for nick in ['a', 'b', 'c']:
+            game.add_player(nick)
+        game.start_game('a')
+
+        snap, before = game.snapshot(), state(game)
+        nick = game.player_turn()
+        other = game.turn_order[1]
+        game.hint_player(nick, other, game.hand(other)[0].color)
+        game.swap_cards(other, 'A', 'B')
+        game.play_card(other, 'A')
+        self.assertNotEqual(before, state(game))
+        after = state(game)
+
+        # branches share the state but not the changes.
+        branch = game.branch()
+        self.assertEqual(after, state(branch))
+        branch.discard_card(game.player_turn(), 'A')
+        self.assertEqual(after, state(game))
+
+        game.restore(snap)
+        self.assertEqual(before, state(game))
+
+        # undo takes back one action at a time.
+        nick = game.player_turn()
+        game.discard_card(nick, 'B')
+        game.play_card(game.player_turn(), 'C')
+        pub, priv = game.undo('a')
+        self.assertEqual("a took back %s's play. It is %s's turn again." % (
+            game.player_turn(), game.player_turn()), pub[0])
+        game.undo('a')
+        self.assertEqual(before, state(game))
+        self.assertEqual(['There is nothing to undo.'], Game().undo('a')[1])
+
+    def test_seed(self):
+        def deal(game):
+            for nick in ['a', 'b', 'c']:
+                game.add_player(nick)
+            game.start_game('a')
+            return list(game.deck), game.turn_order, [game.hand(n) for n in game.players()]
+
+        self.assertEqual(deal(Game(seed=5)), deal(Game(seed=5)))
+        self.assertNotEqual(deal(Game(seed=5)), deal(Game(seed=6)))
+
+        # a game picks and remembers its seed.
+        g = Game()
+        self.assertEqual(deal(Game(seed=g.seed)), deal(g))
+
+        g = Game(seed=6)
+        g.set_seed('a', 5)
+        self.assertEqual(deal(Game(seed=5)), deal(g))
+        self.assertEqual([], g.set_seed('a', 7)[0])
+
+        deck = [Card.get(c, 1) for c in Game.colors] * 10
+        self.assertEqual(deck, list(Game(deck=deck).deck))
+
 if __name__ == '__main__':
     unittest2.main()
 
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+import os
+import random
+import shutil
+import tempfile
+import unittest2
+from hanabi import Game
+from journal import Journal, load, SUFFIX
+from sharding import LocalGames
+from simulator import cheat_policy
+
+class test_journal(unittest2.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.journal = Journal(self.dir)
+
+    def tearDown(self):
+        self.journal.close()
+        shutil.rmtree(self.dir)
+
+    def state(self, game):
+        return (sorted((n, list(game.hand(n))) for n in game.players()),
+                list(game.deck), game.table, game.discards, game.turn_order,
+                game.notes, game.storms, game.game_over())
+
+    def test_replay(self):
+        rng = random.Random(1)
+        game = Game()
+        self.journal.attach('#hanabi', game)
+        for nick in ['a', 'b', 'c', 'd']:
+            game.add_player(nick)
+
+        game.start_game('a')
+        game.swap_cards('b', 'A', 'C')
+        game.move_card('c', 'D', 1)
+        # d leaves, so the deck is reshuffled.
+        game.remove_player('d')
+        for turn in range(10):
+            nick = game.player_turn()
+            action = cheat_policy(game, nick, rng)
+            if action[0] == 'play':
+                game.play_card(nick, action[1])
+            elif action[0] == 'discard':
+                game.discard_card(nick, action[1])
+            else:
+                game.hint_player(nick, action[1], action[2])
+
+        # an undo, and play on from there.
+        game.undo('a')
+        nick = game.player_turn()
+        game.discard_card(nick, 'A')
+        game.sort_cards('b')
+        self.journal.flush()
+
+        games = load(self.dir)
+        self.assertEqual(['#hanabi'], [c for c, g in games])
+        self.assertEqual(self.state(game), self.state(games[0][1]))
+        # nicks in the recorded turn order are str too.
+        self.assertTrue(all(type(n) is str for n in games[0][1].turn_order))
+
+        # a torn last line is ignored.
+        path = os.path.join(self.dir, '%23hanabi' + SUFFIX)
+        with open(path, 'ab') as fd:
+            fd.write('["play","a"')
+        self.assertEqual(self.state(game), self.state(load(self.dir)[0][1]))
+
+        self.journal.end('#hanabi')
+        self.journal.flush()
+        self.assertEqual([], load(self.dir))
+
+    def test_local_games(self):
+        games = LocalGames(self.dir)
+        games['#a'] = Game()
+        games['#b'] = Game()
+        for g in games.values():
+            g.add_player('a')
+            g.add_player('b')
+
+        games['#a'].start_game('b')
+        games.retire('#b', 'over')
+        games.journal.flush()
+
+        restored = LocalGames(self.dir)
+        self.assertEqual(['#a'], restored.restore())
+        self.assertEqual(self.state(games['#a']), self.state(restored['#a']))
+
+        # the restored game keeps journaling.
+        nick = restored['#a'].player_turn()
+        restored['#a'].discard_card(nick, 'A')
+        restored.journal.flush()
+        self.assertEqual(self.state(restored['#a']), self.state(load(self.dir)[0][1]))
+
+        games.close()
+        restored.close()
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+import json
+import os
+import shutil
+import tempfile
+import unittest2
+from async_core import AsyncHanabot
+from hanabi import Game
+from journal import replay
+from lifecycle import Lifecycle, Archive
+from sharding import LocalGames
+
+class test_lifecycle(unittest2.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_lifecycle(self):
+        now = [0]
+        life = Lifecycle(idle_timeout=100, max_games=2, clock=lambda: now[0])
+        games = {'#a': Game(), '#b': Game()}
+        life.touch('#a')
+        now[0] = 50
+        life.touch('#b')
+        self.assertEqual([], life.idle())
+        now[0] = 120
+        self.assertEqual(['#a'], life.idle())
+        now[0] = 200
+        self.assertEqual(['#a', '#b'], life.idle())
+
+        self.assertTrue(life.full(games))
+        self.assertEqual('#a', life.victim(games))
+        for nick in ['x', 'y']:
+            games['#a'].add_player(nick)
+        games['#a'].start_game('x')
+        self.assertEqual('#b', life.victim(games))
+
+        life.forget('#a')
+        self.assertEqual(['#b'], life.idle())
+        self.assertFalse(Lifecycle().full(games))
+
+    def test_archive(self):
+        games = LocalGames(archive_dir=self.dir)
+        games['#a'] = Game(seed=4)
+        game = games['#a']
+        for nick in ['x', 'y']:
+            game.add_player(nick)
+        game.start_game('x')
+        nick = game.player_turn()
+        game.discard_card(nick, 'B')
+        games.retire('#a', 'idle')
+        self.assertNotIn('#a', games)
+
+        archived = os.listdir(self.dir)
+        self.assertEqual(1, len(archived))
+        with open(os.path.join(self.dir, archived[0])) as fd:
+            entry = json.loads(fd.readline())
+
+        self.assertEqual(['#a', 'idle', 4, ['x', 'y'], 0],
+                         [entry[k] for k in ['channel', 'reason', 'seed', 'players', 'score']])
+        again = replay(entry['records'])
+        self.assertEqual(list(game.deck), list(again.deck))
+        self.assertEqual(game.discards, again.discards)
+
+    def test_bot(self):
+        bot = AsyncHanabot('localhost', 'hanabi', send_rate=1e9, send_burst=10**9,
+                           archive_dir=self.dir, idle_timeout=600, max_games=2)
+        sent = []
+        bot.connection.send_raw = sent.append
+        bot.connection.real_nickname = 'hanabot'
+        now = [0]
+        bot.lifecycle._clock = lambda: now[0]
+        for c in ['#a', '#b']:
+            bot.connection.handle_line(':alice!u@h PRIVMSG %s :!new' % c)
+
+        # at the cap the least recently used lobby makes room.
+        now[0] = 10
+        bot.connection.handle_line(':bob!u@h PRIVMSG #b :!join')
+        del sent[:]
+        bot.connection.handle_line(':alice!u@h PRIVMSG #c :!new')
+        self.assertEqual(['NOTICE #a :The game in #a was removed to make room for a new game.',
+                          'NOTICE #c :New game started by alice. Accepting joins.'], sent)
+        self.assertEqual(['#b', '#c'], sorted(bot.games.keys()))
+
+        # games left alone are swept.
+        now[0] = 20
+        bot.connection.handle_line(':bob!u@h PRIVMSG #b :!turn')
+        now[0] = 615
+        del sent[:]
+        bot._sweep_games()
+        self.assertEqual(['NOTICE #c :The game in #c was removed after 10 minutes without '
+                          'a move.'], sent)
+        self.assertEqual(['#b'], bot.games.keys())
+        self.assertEqual({'bob': '#b'}, bot.player_channels)
+        self.assertIn('hanabot_games_retired_total{reason="cap"} 1', bot.metrics.exposition())
+
+        with open(os.path.join(self.dir, os.listdir(self.dir)[0])) as fd:
+            self.assertEqual(['cap', 'idle'], [json.loads(l)['reason'] for l in fd])
+
+if __name__ == '__main__':
+    unittest2.main()
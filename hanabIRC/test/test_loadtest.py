@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+
+import unittest2
+from loadtest import LoadTest, percentile, sustainable
+
+class test_loadtest(unittest2.TestCase):
+
+    def test_percentile(self):
+        values = range(1, 101)
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(100, percentile(values, 100))
+        self.assertEqual(1, percentile([1], 99))
+        self.assertEqual(0.0, percentile([], 50))
+
+    def test_run(self):
+        test = LoadTest(tables=3, players=(2, 3), core='async', seed=1)
+        test.start()
+        try:
+            stats = test.step(rate=0, duration=1.5)
+        finally:
+            test.stop()
+
+        self.assertEqual(0, stats['timeouts'])
+        self.assertTrue(stats['games'] > 0)
+        self.assertTrue(stats['commands'] > 50)
+        for cmd in ['new', 'join', 'start', 'play', 'hint', 'discard', 'hands', 'table']:
+            self.assertIn(cmd, stats['by_command'])
+        self.assertTrue(0 < stats['p50'] <= stats['p99'] <= stats['max'])
+        self.assertTrue(sustainable(stats, 1.0))
+
+if __name__ == '__main__':
+    unittest2.main()
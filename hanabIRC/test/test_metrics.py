@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+import urllib2
+import unittest2
+from async_core import AsyncHanabot
+from metrics import Metrics
+
+class test_metrics(unittest2.TestCase):
+
+    def test_exposition(self):
+        m = Metrics()
+        c = m.counter('x_total', 'Some xs.', ('kind',))
+        c.inc(('a',))
+        c.inc(('a',), 2)
+        c.inc(('b"',))
+        h = m.histogram('y_seconds', 'Some ys.', buckets=(0.1, 1))
+        h.observe((), 0.05)
+        h.observe((), 0.5)
+        h.observe((), 5)
+        m.gauge('z', 'A z.', lambda: 7)
+        self.assertEqual('\n'.join([
+            '# HELP x_total Some xs.',
+            '# TYPE x_total counter',
+            'x_total{kind="a"} 3',
+            'x_total{kind="b\\""} 1',
+            '# HELP y_seconds Some ys.',
+            '# TYPE y_seconds histogram',
+            'y_seconds_bucket{le="0.1"} 1',
+            'y_seconds_bucket{le="1"} 2',
+            'y_seconds_bucket{le="+Inf"} 3',
+            'y_seconds_sum 5.55',
+            'y_seconds_count 3',
+            '# HELP z A z.',
+            '# TYPE z gauge',
+            'z 7']) + '\n', m.exposition())
+        self.assertEqual((3, 5.55, 5), h.stats(()))
+
+        port = m.serve(0)
+        try:
+            body = urllib2.urlopen('http://127.0.0.1:%d/metrics' % port).read()
+            self.assertEqual(m.exposition(), body)
+        finally:
+            m.close()
+
+    def test_bot(self):
+        bot = AsyncHanabot('localhost', 'hanabi', send_rate=1e9, send_burst=10**9)
+        bot.connection.send_raw = lambda text: None
+        bot.connection.real_nickname = 'hanabot'
+        for line in [':a!u@h PRIVMSG #hanabi :!new', ':a!u@h PRIVMSG #hanabi :!join',
+                     ':b!u@h PRIVMSG #hanabi :!join', ':a!u@h PRIVMSG #hanabi :!hands']:
+            bot.connection.handle_line(line)
+
+        text = bot.metrics.exposition()
+        self.assertIn('hanabot_commands_total{command="join",channel="#hanabi"} 2', text)
+        self.assertIn('hanabot_messages_received_total 4', text)
+        self.assertIn('hanabot_games 1', text)
+        self.assertIn('hanabot_send_queue_depth 0', text)
+
+        lines = bot.metrics_summary()
+        self.assertIn('0 queued, 0 errors', lines[0])
+        self.assertTrue(any(l.startswith('metrics: !join: 2 run') for l in lines))
+
+        # the counts are since the last summary.
+        bot.connection.handle_line(':c!u@h PRIVMSG #hanabi :!join')
+        lines = bot.metrics_summary()
+        self.assertTrue(any(l.startswith('metrics: !join: 1 run') for l in lines))
+        self.assertFalse(any(l.startswith('metrics: !hands') for l in lines))
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+import unittest2
+from outbound import (coalesce, split_line, budget, SEPARATOR, RESET,
+                      SendQueue, HIGH, NORMAL)
+from text_markup import irc_markup
+
+class test_outbound(unittest2.TestCase):
+
+    def test_coalesce(self):
+        lines = ['one', 'two', 'three']
+        self.assertEqual([SEPARATOR.join(lines)], coalesce(lines, 100))
+        self.assertEqual(['one | two', 'three'], coalesce(lines, 10))
+        self.assertEqual([], coalesce([], 100))
+
+    def test_limit(self):
+        lines = ['x' * 30 for i in range(20)]
+        size = budget('#hanabIRC')
+        msgs = coalesce(lines, size)
+        self.assertTrue(all(len(m) <= size for m in msgs))
+        self.assertEqual(lines, SEPARATOR.join(msgs).split(SEPARATOR))
+
+    def test_split_markup(self):
+        m = irc_markup()
+        line = ' '.join([m.color('R%d' % (i % 5 + 1), 'red') for i in range(40)])
+        pieces = split_line(line, 50)
+        self.assertTrue(all(len(p) <= 50 for p in pieces))
+        self.assertTrue(all(p.count('\x03') % 2 == 0 for p in pieces))
+        self.assertEqual(line, ' '.join(pieces))
+
+        # no spaces to split at, cut hard and reset.
+        pieces = split_line('\x02' + 'x' * 30, 10)
+        self.assertTrue(pieces[0].endswith(RESET))
+        self.assertTrue(all(len(p) <= 10 for p in pieces))
+
+        # sizes too small for the reset still end.
+        self.assertEqual('abcdefgh', ''.join(p.replace(RESET, '') for p in split_line('abcdefgh', 1)))
+
+        # unicode is measured and cut in bytes, between characters.
+        line = u'\u00e9' * 30
+        pieces = split_line(line, 11)
+        self.assertTrue(all(isinstance(p, unicode) for p in pieces))
+        self.assertTrue(all(len(p.encode('utf-8')) <= 11 for p in pieces))
+        self.assertEqual(line, ''.join(p.replace(RESET, '') for p in pieces))
+
+    def test_send_queue(self):
+        now = [0.0]
+        sent = []
+        q = SendQueue(lambda t, m: sent.append((t, m)), rate=2, burst=2,
+                      clock=lambda: now[0])
+        q.put('#a', 'a1')
+        q.put('#a', 'a2')
+        q.put('#a', 'a3')
+        q.put('#a', 'a4')
+        q.put('#b', 'b1')
+        q.put('#b', 'b2')
+        q.put('nick', 'your turn', HIGH)
+        self.assertEqual([('#a', 'a1'), ('#a', 'a2')], sent)
+        self.assertEqual(5, len(q))
+
+        # tokens come back at rate per second.
+        now[0] = 0.5
+        self.assertEqual(0.5, q.pump())
+        self.assertEqual(('nick', 'your turn'), sent[-1])
+
+        # then the targets take turns.
+        now[0] = 2.0
+        self.assertEqual(0.5, q.pump())
+        self.assertEqual([('#a', 'a3'), ('#b', 'b1')], sent[3:])
+        now[0] = 10.0
+        self.assertEqual(None, q.pump())
+        self.assertEqual([('#a', 'a4'), ('#b', 'b2')], sent[5:])
+        self.assertEqual(0, len(q))
+
+if __name__ == '__main__':
+    unittest2.main()
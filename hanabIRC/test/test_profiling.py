@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest2
+from async_core import AsyncHanabot
+from profiling import CommandProfiler
+
+class test_profiling(unittest2.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_commands(self):
+        now = [0]
+        done = []
+        p = CommandProfiler(self.dir, clock=lambda: now[0])
+        self.assertEqual(3, p.run(lambda x: x + 1, 2))
+        self.assertTrue(p.start(commands=2, stacks=True, done=done.append))
+        self.assertFalse(p.start(commands=5))
+
+        def busy():
+            end = time.time() + 0.05
+            while time.time() < end:
+                pass
+
+        p.run(busy)
+        self.assertTrue(p.active)
+        p.run(busy)
+        self.assertFalse(p.active)
+
+        self.assertEqual(1, len(done))
+        paths = done[0]
+        self.assertEqual(['.pstats', '.txt', '.stacks'], [os.path.splitext(f)[1] for f in paths])
+        stats = pstats.Stats(paths[0])
+        self.assertTrue(any(func[2] == 'busy' for func in stats.stats))
+        with open(paths[2]) as fd:
+            line = fd.readline().split()
+        self.assertIn('test_profiling.py:busy', line[0].split(';'))
+        self.assertTrue(int(line[1]) > 0)
+
+        # a time window ends at the first command or expire() after it.
+        p.start(seconds=10)
+        p.run(busy)
+        now[0] = 10
+        p.expire()
+        self.assertFalse(p.active)
+        # next to the first profile's files, even in the same second.
+        self.assertEqual(5, len(os.listdir(self.dir)))
+        self.assertEqual([], p.stop())
+
+    def test_bot(self):
+        bot = AsyncHanabot('localhost', 'hanabi', send_rate=1e9, send_burst=10**9,
+                           profile_dir=self.dir)
+        sent = []
+        bot.connection.send_raw = sent.append
+        bot.connection.real_nickname = 'hanabot'
+        for line in [':hanabot!u@h JOIN #hanabi',
+                     ':irc 353 hanabot = #hanabi :hanabot @op alice',
+                     ':op!u@h PRIVMSG #hanabi :!profile 2',
+                     ':alice!u@h PRIVMSG #hanabi :!new',
+                     ':alice!u@h PRIVMSG #hanabi :!join']:
+            bot.connection.handle_line(line)
+
+        self.assertFalse(bot.profiler.active)
+        self.assertEqual('NOTICE op :Profiling the next 2 commands.', sent[0])
+        self.assertIn('NOTICE op :Profile written to %s' % self.dir, sent[-1])
+        self.assertEqual(2, len(os.listdir(self.dir)))
+
+        # only ops may profile.
+        sent[:] = []
+        bot.connection.handle_line(':alice!u@h PRIVMSG #hanabi :!profile 30s')
+        self.assertIn('I do not understand', sent[0])
+        self.assertFalse(bot.profiler.active)
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+import unittest2
+from StringIO import StringIO
+from replay import Replay, parse_action, read_actions
+
+class test_replay(unittest2.TestCase):
+
+    def test_parse_action(self):
+        self.assertEqual(('hint', 'a', 'b', 'red'), parse_action('hint a b r'))
+        self.assertEqual(('move', 'a', 'C', 2), parse_action('move a c 2'))
+        self.assertEqual(('play', 'a', 'A'), parse_action('["play","a","A"]'))
+        self.assertRaises(ValueError, parse_action, 'frob a')
+        self.assertRaises(ValueError, parse_action, 'play a')
+
+    def test_replay(self):
+        actions = read_actions(StringIO('# a short game\nseed 3\njoin a\njoin b\nstart a\n'))
+        r = Replay(actions)
+        self.assertEqual(4, r.run())
+        first = r.game.player_turn()
+        other = 'b' if first == 'a' else 'a'
+
+        # play the same game twice, stepping through one of them.
+        more = [('discard', first, 'A'), ('play', other, 'B'), ('sort', first)]
+        r1, r2 = Replay(actions + more), Replay(actions + more)
+        outputs = [out for action, out in r1]
+        self.assertEqual(7, len(outputs))
+        r2.run()
+        self.assertEqual(list(r1.game.deck), list(r2.game.deck))
+        self.assertEqual(r1.game.discards, r2.game.discards)
+        self.assertEqual(2, len(r1.game.discards) + sum(r1.game.table))
+
+        # a journal start record with the turn order it was dealt.
+        start = parse_action('["start", "a", ["b", "a"]]')
+        self.assertEqual(('start', 'a', ['b', 'a']), start)
+        self.assertEqual([str, str], [type(n) for n in start[2]])
+        r = Replay(actions[:3] + [start])
+        r.run()
+        self.assertEqual(('b', 'a'), r.game.turn_order)
+        self.assertEqual([str, str], [type(n) for n in r.game.turn_order])
+
+if __name__ == '__main__':
+    unittest2.main()
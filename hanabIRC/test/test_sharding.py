@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import select
+import time
+import unittest2
+from hanabi import Game
+from sharding import LocalGames, GameShards
+
+class test_sharding(unittest2.TestCase):
+
+    def setUp(self):
+        self.watched = dict()
+        self.games = GameShards(2, self.watch)
+
+    def watch(self, fileobj, func):
+        if func is None:
+            del self.watched[fileobj]
+        else:
+            self.watched[fileobj] = func
+
+    def tearDown(self):
+        # the pipes are no longer watched once the workers are stopped.
+        self.games.close()
+        self.assertEqual({}, self.watched)
+
+    def call(self, channel, method, *args):
+        '''submit a call and wait on the pipes until it has been answered.'''
+        out = []
+        self.games.submit(channel, method, args, out.append)
+        deadline = time.time() + 10
+        while not out and time.time() < deadline:
+            ready, w, e = select.select(self.watched.keys(), [], [], 1)
+            for fileobj in ready:
+                self.watched[fileobj]()
+
+        self.assertEqual(1, len(out))
+        return out[0]
+
+    def test_shards(self):
+        for c in ['#a', '#b', '#c']:
+            self.games[c] = Game()
+
+        self.assertEqual(['#a', '#b', '#c'], sorted(self.games.keys()))
+        for c in ['#a', '#b', '#c']:
+            self.call(c, 'add_player', 'alice')
+            self.call(c, 'add_player', 'bob')
+
+        pub, priv = self.call('#b', 'start_game', 'alice')
+        # output comes back rendered.
+        self.assertTrue(all(isinstance(l, basestring) for l in pub + priv))
+
+        # the proxies answer from the state sent back with the last reply.
+        self.assertTrue(self.games['#b'].has_started())
+        self.assertFalse(self.games['#a'].has_started())
+        self.assertItemsEqual(['alice', 'bob'], self.games['#a'].players())
+
+        first = self.games['#b'].player_turn()
+        pub, priv = self.call('#b', 'turn')
+        self.assertEqual(['It is %s\'s turn to play.' % first], pub)
+
+        # errors in a worker are reported, and the worker keeps going.
+        pub, priv = self.call('#a', 'no_such_method')
+        self.assertIn('Does not compute', pub[0])
+        pub, priv = self.call('#a', 'turns')
+        self.assertIn('not started', pub[0])
+
+        # a call that arrives after its game is retired is answered.
+        self.games.submit('#c', 'turn', (), lambda output: None)
+        self.games.retire('#c', 'over')
+        self.assertNotIn('#c', self.games)
+        pub, priv = self.call('#c', 'turn')
+        self.assertEqual(['There is no active game in #c.'], pub)
+        del self.games['#a']
+        self.assertNotIn('#a', self.games)
+
+    def test_local(self):
+        games = LocalGames()
+        games['#a'] = Game()
+        out = []
+        games.submit('#a', 'add_player', ('alice',), out.append)
+        self.assertEqual([['alice']], [games['#a'].players()])
+        self.assertEqual(1, len(out))
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+import unittest2
+from simulator import run_game, run_batch, policies, main
+
+class test_simulator(unittest2.TestCase):
+
+    def test_run_game(self):
+        for name, policy in policies.iteritems():
+            for n in range(2, 6):
+                r = run_game(policy, n, seed=n)
+                self.assertTrue(0 <= r['score'] <= 25)
+                self.assertTrue(r['storms'] <= 3)
+
+    def test_run_game_repeatable(self):
+        self.assertEqual(run_game(policies['cheat'], 3, seed=7),
+                         run_game(policies['cheat'], 3, seed=7))
+
+    def test_run_batch(self):
+        stats = run_batch('cheat', 2, 20, processes=2, chunksize=5)
+        self.assertEqual(20, sum(stats['scores'].values()))
+
+    def test_batched_policy(self):
+        # the batch engine only plays the cheat policy.
+        self.assertRaises(SystemExit, main, ['--batched', '--policy', 'random'])
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest2
+from engine import apply, new_state, DEFAULT_RULES
+from hanabi import Game
+from lifecycle import Archive
+from simulator import run_game, policies
+from solver import solve, deal, grade_archive
+
+def brute_force(state, memo):
+    '''The best score from state, trying every play, discard and hint.'''
+    if state.over:
+        return state.score
+    # what the hints told and the marks of the cards make no difference.
+    key = (tuple(tuple(sorted((c.color, c.number) for c in h)) for h in state.hands),
+           state.turn_order, state.drawn, state.table, state.notes, state.storms)
+    if key not in memo:
+        nick = state.turn_order[0]
+        actions = [(kind, nick, c.mark) for c in state.hand(nick) for kind in ['play', 'discard']]
+        if state.notes:
+            other = state.turn_order[1]
+            actions.append(('hint', nick, other, state.hand(other)[0].color))
+        memo[key] = max(brute_force(apply(state, a)[0], memo) for a in actions)
+    return memo[key]
+
+class test_solver(unittest2.TestCase):
+
+    def test_small_decks(self):
+        # short decks the solver can be checked against every line of play.
+        rng = random.Random(3)
+        rules = DEFAULT_RULES._replace(max_notes=1, hand_sizes=(2,) * 6)
+        for i in range(10):
+            cards = [c for c in Game(seed=i).deck if c.color in ['red', 'blue']]
+            deck = rng.sample(cards, 10)
+            state = new_state(deck, rules)
+            for action in [('join', 'a'), ('join', 'b'), ('start', 'a', ('a', 'b'))]:
+                state = apply(state, action)[0]
+            result = solve(state)
+            self.assertTrue(result.exact)
+            self.assertEqual(brute_force(state, {}), result.score)
+
+    def test_deals(self):
+        for seed, players in [(3, 2), (18, 2), (0, 5)]:
+            result = solve(deal(seed, players), max_nodes=200000)
+            self.assertTrue(result.exact)
+            self.assertEqual(result.score, result.upper)
+            self.assertGreaterEqual(result.score, run_game(policies['cheat'], players, seed)['score'])
+            # the first moves searched by a pool agree.
+            self.assertEqual(result.score, solve(deal(seed, players), processes=2).score)
+
+        # the red 5 at the bottom of the deck is never played.
+        game = Game(seed=1)
+        deck = list(game.deck)
+        deck.sort(key=lambda c: (c.color, c.number) == ('red', 5))
+        game.deck = deck
+        for nick in ['a', 'b', 'c']:
+            game.add_player(nick)
+        game.start_game('a')
+        self.assertEqual(24, solve(game.state).score)
+
+    def test_grade_archive(self):
+        directory = tempfile.mkdtemp()
+        try:
+            archive = Archive(directory)
+            game = Game(seed=3)
+            archive.attach('#a', game)
+            for nick in ['x', 'y']:
+                game.add_player(nick)
+            game.start_game('x')
+            game.play_card(game.player_turn(), 'A')
+            archive.write('#a', game, 'over')
+            archive.write('#b', Game(), 'idle')
+
+            path = os.path.join(directory, os.listdir(directory)[0])
+            graded = list(grade_archive(path))
+            self.assertEqual(['#a'], [entry['channel'] for entry, result in graded])
+            self.assertEqual(solve(deal(3, 2)).score, graded[0][1].score)
+            self.assertEqual(1, len(list(grade_archive(path, reasons=None))))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest2.main()
@@ -8,6 +8,27 @@ class text_markup_exception(Exception):
         return repr(self.value)
 
 
+class card_glyphs(dict):
+    '''
+    Rendered card faces for one markup class, keyed by (color, number, mark).
+    The value is the colored face, e.g. "R3", followed by "/mark" if mark is
+    not None. Faces are rendered once, the first time they are asked for,
+    and then shared by every instance of the markup class.
+    '''
+    def __init__(self, markup):
+        dict.__init__(self)
+        self._markup = markup
+
+    def __missing__(self, key):
+        color, number, mark = key
+        glyph = self._markup.color('%s%d' % (color[0].upper(), number), color)
+        if mark is not None:
+            glyph += '/%s' % mark
+
+        self[key] = glyph
+        return glyph
+
+
 class text_markup_base(object):
     '''Abstract bolding and colorizing text. Base class does no markup.'''
 
@@ -25,8 +46,22 @@ class text_markup_base(object):
 
     Markups = [BOLD]
 
+    # markup class --> card_glyphs, shared by all instances of the class.
+    _glyph_tables = dict()
+
     def __init__(self):
-        pass
+        cls = type(self)
+        if cls not in text_markup_base._glyph_tables:
+            glyphs = card_glyphs(self)
+            # precompute every card face and hand mark.
+            for color in text_markup_base.Colors:
+                for number in xrange(1, 6):
+                    for mark in (None, 'A', 'B', 'C', 'D', 'E'):
+                        glyphs[(color, number, mark)]
+
+            text_markup_base._glyph_tables[cls] = glyphs
+
+        self.glyphs = text_markup_base._glyph_tables[cls]
 
     def markup(self, text, markup):
         '''just check for supported markup. raise exception if not
@@ -46,6 +81,11 @@ class text_markup_base(object):
     def bold(self, text):
         return self.markup(text, text_markup_base.BOLD)
 
+    def card(self, color, number, mark=None):
+        '''Return the colored face of a card, followed by "/mark" if mark
+        is given. Faces are looked up in the table in self.glyphs.'''
+        return self.glyphs[(color, number, mark)]
+
 
 class irc_markup(text_markup_base):
     '''
@@ -12,5 +12,7 @@ setup(
     long_description=open('README.txt').read(),
     url='https://github.com/philsstein/hanabIRC',
     install_requires=['irc'],
-    scripts=['bin/hanabIRC']
+    extras_require={'batch': ['numpy']},
+    scripts=['bin/hanabIRC', 'bin/hanabSim', 'bin/hanabReplay',
+             'bin/hanabLoadTest', 'bin/hanabSolve', 'bin/hanabEstimate']
 )